@@ -7,4 +7,6 @@ npm run --workspace client build
 
 # Now run Flask app
 echo "Starting gunicorn..."
-gunicorn server.wsgi:app
\ No newline at end of file
+# Threads, since event streams (see routes/events.py) each hold one open. Each worker
+# streams on all but API_THREADS of its threads, which serve API requests.
+gunicorn --workers "${WEB_CONCURRENCY:-2}" --threads "${GUNICORN_THREADS:-32}" server.wsgi:app
\ No newline at end of file
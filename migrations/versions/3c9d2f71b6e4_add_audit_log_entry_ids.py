@@ -0,0 +1,34 @@
+"""Add audit log entry ids
+
+Revision ID: 3c9d2f71b6e4
+Revises: 6a69e025a0ae
+Create Date: 2026-10-18 18:05:12.417306
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "3c9d2f71b6e4"
+down_revision = "6a69e025a0ae"
+
+
+def upgrade() -> None:
+    op.add_column(
+        "audit_logs",
+        sa.Column("entry_id", postgresql.UUID(as_uuid=True), nullable=True),
+    )
+    op.create_index(
+        "ix_audit_logs_entry_id",
+        "audit_logs",
+        ["entry_id"],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_audit_logs_entry_id", table_name="audit_logs")
+    op.drop_column("audit_logs", "entry_id")
@@ -0,0 +1,35 @@
+"""Add deleted incidents
+
+Revision ID: 40b52aee073e
+Revises: e97409c99862
+Create Date: 2026-10-18 13:05:27.630918
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "40b52aee073e"
+down_revision = "e97409c99862"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "deleted_incidents",
+        sa.Column("incident_id", sa.Integer(), nullable=False),
+        sa.Column("deleted_on", sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint("incident_id"),
+    )
+    op.create_index(
+        "ix_deleted_incidents_deleted_on",
+        "deleted_incidents",
+        ["deleted_on"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_deleted_incidents_deleted_on", table_name="deleted_incidents")
+    op.drop_table("deleted_incidents")
@@ -0,0 +1,51 @@
+"""Store audit changes as JSONB
+
+Revision ID: 6a69e025a0ae
+Revises: a8f7e83d64d7
+Create Date: 2026-10-18 16:20:44.902113
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "6a69e025a0ae"
+down_revision = "a8f7e83d64d7"
+
+
+def upgrade() -> None:
+    op.alter_column(
+        "audit_logs",
+        "changes",
+        type_=postgresql.JSONB(),
+        existing_nullable=True,
+        postgresql_using="changes::jsonb",
+    )
+    op.create_index(
+        "ix_audit_logs_changes",
+        "audit_logs",
+        ["changes"],
+        unique=False,
+        postgresql_using="gin",
+    )
+    op.create_index(
+        "ix_audit_logs_timestamp",
+        "audit_logs",
+        ["timestamp", "id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_audit_logs_timestamp", table_name="audit_logs")
+    op.drop_index("ix_audit_logs_changes", table_name="audit_logs")
+    op.alter_column(
+        "audit_logs",
+        "changes",
+        type_=sa.Text(),
+        existing_nullable=True,
+        postgresql_using="changes::text",
+    )
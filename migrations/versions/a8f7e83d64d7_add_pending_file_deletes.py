@@ -0,0 +1,30 @@
+"""Add pending file deletes
+
+Revision ID: a8f7e83d64d7
+Revises: 40b52aee073e
+Create Date: 2026-10-18 15:42:10.318274
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a8f7e83d64d7"
+down_revision = "40b52aee073e"
+
+
+def upgrade() -> None:
+    op.create_table(
+        "pending_file_deletes",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("url", sa.String(), nullable=False),
+        sa.Column("created_on", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("pending_file_deletes")
@@ -0,0 +1,55 @@
+"""Add incident search vector
+
+Revision ID: bd34355f5fa4
+Revises: c5f62ee5fd17
+Create Date: 2026-10-18 11:03:17.530954
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "bd34355f5fa4"
+down_revision = "c5f62ee5fd17"
+
+
+def upgrade() -> None:
+    op.add_column(
+        "incidents", sa.Column("search_vector", postgresql.TSVECTOR(), nullable=True)
+    )
+    # Backfill with the same document server/models/search.py builds on write
+    op.execute(
+        """
+        UPDATE incidents i SET search_vector =
+            setweight(to_tsvector('english', coalesce(i.summary, '')), 'A') ||
+            setweight(to_tsvector('english', concat_ws(' ',
+                (SELECT string_agg(coalesce(nullif(s.display_name, ''), s.name), ' ')
+                 FROM incident_schools x JOIN schools s ON s.id = x.school_id
+                 WHERE x.incident_id = i.id),
+                (SELECT string_agg(coalesce(nullif(d.display_name, ''), d.name), ' ')
+                 FROM incident_districts x JOIN school_districts d ON d.id = x.district_id
+                 WHERE x.incident_id = i.id),
+                i.city
+            )), 'B') ||
+            setweight(to_tsvector('english', coalesce(i.details, '')), 'C')
+        """
+    )
+    op.create_index(
+        "ix_incidents_search_vector",
+        "incidents",
+        ["search_vector"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_incidents_search_vector",
+        table_name="incidents",
+        postgresql_using="gin",
+    )
+    op.drop_column("incidents", "search_vector")
@@ -0,0 +1,54 @@
+"""Add incident pagination indexes
+
+Revision ID: c5f62ee5fd17
+Revises: 37a4da0dde6a
+Create Date: 2026-10-18 10:12:41.208311
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c5f62ee5fd17"
+down_revision = "37a4da0dde6a"
+
+
+def upgrade() -> None:
+    # Keyset pagination needs updated_on to be set on every incident
+    op.execute(
+        "UPDATE incidents SET updated_on = COALESCE(created_on, now()) "
+        "WHERE updated_on IS NULL"
+    )
+    op.alter_column(
+        "incidents",
+        "updated_on",
+        existing_type=sa.DateTime(timezone=True),
+        nullable=False,
+    )
+    op.create_index(
+        "ix_incidents_occurred_on_sort",
+        "incidents",
+        [
+            sa.text("coalesce(occurred_on_year, 0)"),
+            sa.text("coalesce(occurred_on_month_start, 1)"),
+            sa.text("coalesce(occurred_on_day_start, 1)"),
+            "id",
+        ],
+        unique=False,
+    )
+    op.create_index(
+        "ix_incidents_updated_on", "incidents", ["updated_on", "id"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_incidents_updated_on", table_name="incidents")
+    op.drop_index("ix_incidents_occurred_on_sort", table_name="incidents")
+    op.alter_column(
+        "incidents",
+        "updated_on",
+        existing_type=sa.DateTime(timezone=True),
+        nullable=True,
+    )
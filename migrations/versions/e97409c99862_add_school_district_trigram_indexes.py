@@ -0,0 +1,35 @@
+"""Add school & district trigram indexes
+
+Revision ID: e97409c99862
+Revises: bd34355f5fa4
+Create Date: 2026-10-18 11:48:52.114620
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "e97409c99862"
+down_revision = "bd34355f5fa4"
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for table_name in ["schools", "school_districts"]:
+        for column in ["name", "display_name"]:
+            op.create_index(
+                f"ix_{table_name}_{column}_trgm",
+                table_name,
+                [column],
+                unique=False,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+
+
+def downgrade() -> None:
+    for table_name in ["schools", "school_districts"]:
+        for column in ["name", "display_name"]:
+            op.drop_index(f"ix_{table_name}_{column}_trgm", table_name=table_name)
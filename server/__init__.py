@@ -5,6 +5,8 @@ from flask_admin import Admin
 from .admin.manage_data import ManageDataView
 
 from .models.audit import AuditLog, AuditLogView
+from .models import files  # Registers the Simple File Upload delete outbox
+from .models.identity import get_identity_user
 
 from .admin.index import AdminView, BaseModelView
 from .admin.models import (
@@ -33,8 +35,10 @@ from .routes.incident import incident
 from .routes.school import school
 from .routes.district import district
 from .app import main
+from .cache import cache
 from .database import db
 from flask_login import LoginManager
+from worker import conn
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 app = Flask(__name__)
@@ -48,12 +52,13 @@ admin = Admin(app, index_view=AdminView(), url="/admin")
 
 from server import app
 from .routes.auth import has_role, auth
+from .routes.audit import audit
 
 
 @login_manager.user_loader
 def load_user(user_id):
     """Gets user upon flask-login login so we can use current_user"""
-    return User.query.get(int(user_id))
+    return get_identity_user(int(user_id))
 
 
 @app.context_processor
@@ -104,12 +109,23 @@ def create_app():
     # Bind app to db instance
     db.init_app(app)
 
+    # Share cached data between workers through Redis
+    cache.init_app(
+        app,
+        config={
+            "CACHE_TYPE": "RedisCache",
+            "CACHE_REDIS_HOST": conn,
+            "CACHE_KEY_PREFIX": "cache:",
+        },
+    )
+
     # Register Blueprints (routes)
     app.register_blueprint(main)
     register_api_blueprint(app, auth)
     register_api_blueprint(app, incident)
     register_api_blueprint(app, school)
     register_api_blueprint(app, district)
+    register_api_blueprint(app, audit)
 
     # Configure flask login for session management
     login_manager.init_app(app)
@@ -0,0 +1,83 @@
+import datetime
+import os
+
+from pyairtable import Api
+from pyairtable.formulas import IS_AFTER, Field
+from rq import get_current_job
+
+from worker import conn
+
+from .jobs import ImportProgress
+from .util import create_or_sync_incidents, sync_school_districts, sync_schools
+
+# How each table is synced, and the name its progress is shown under
+SYNC_FUNCTIONS = {
+    "District-Table": (sync_school_districts, "districts"),
+    "School-Table": (sync_schools, "schools"),
+    "Incident-Table": (create_or_sync_incidents, "incidents"),
+}
+
+LAST_MODIFIED_FIELD = "Last Modified"
+# Airtable shows Last Modified to the minute, so look back a little further than
+# the last sync. Syncing a record twice is harmless.
+SYNC_OVERLAP = datetime.timedelta(minutes=1)
+AIRTABLE_PAGE_SIZE = 100
+
+
+def get_table(region, table_name):
+    """The Airtable table for a region, raising ValueError if either is unknown."""
+    app_id = os.environ.get(f"AIRTABLE_APP_ID_{region}")
+    if not app_id or table_name not in SYNC_FUNCTIONS:
+        raise ValueError("Invalid Airtable ID")
+    return Api(os.environ["AIRTABLE_READ_TOKEN"]).table(app_id, table_name)
+
+
+def synced_on_key(region, table_name):
+    return f"airtable:synced:{region}:{table_name}"
+
+
+def get_synced_on(region, table_name):
+    """When the table was last synced (the high-water mark), or None."""
+    synced_on = conn.get(synced_on_key(region, table_name))
+    return datetime.datetime.fromisoformat(synced_on.decode()) if synced_on else None
+
+
+def sync_airtable(region, table_name, full=False):
+    """
+    Sync the records of an Airtable table changed since its last sync (or all of
+    them when `full`), a page at a time in order of change. The high-water mark
+    moves past each page once it's committed, so a retry (or the next sync)
+    carries on from there.
+    """
+    table = get_table(region, table_name)
+    synced_on = None if full else get_synced_on(region, table_name)
+    started_on = datetime.datetime.now(datetime.timezone.utc)
+    sync, progress_name = SYNC_FUNCTIONS[table_name]
+
+    job = get_current_job()
+    if job:
+        # Retries resume from the high-water mark, so count from scratch
+        job.meta.pop("progress", None)
+    progress = ImportProgress(progress_name)
+
+    result = f"Sync complete: no {progress_name} changed"
+    for records in table.iterate(
+        formula=(
+            IS_AFTER(Field(LAST_MODIFIED_FIELD), synced_on - SYNC_OVERLAP)
+            if synced_on
+            else None
+        ),
+        sort=[LAST_MODIFIED_FIELD],
+        page_size=AIRTABLE_PAGE_SIZE,
+    ):
+        result = sync(records, progress)
+        last_modified = records[-1]["fields"].get(LAST_MODIFIED_FIELD)
+        if last_modified:
+            conn.set(
+                synced_on_key(region, table_name),
+                datetime.datetime.fromisoformat(last_modified).isoformat(),
+            )
+
+    # Everything changed before the sync started is committed
+    conn.set(synced_on_key(region, table_name), started_on.isoformat())
+    return result
@@ -4,6 +4,8 @@ from markupsafe import Markup
 from flask_admin.contrib.sqla import ModelView
 
 from server.routes.auth import has_role
+from server.models.identity import invalidate_identities
+from server.models.reference import invalidate_reference
 from server.models.user import UserRole
 
 
@@ -22,6 +24,16 @@ class BaseModelView(ModelView):
     def is_visible(self):
         return self.is_accessible()
 
+    def after_model_change(self, form, model, is_created):
+        invalidate_reference(type(model))
+        invalidate_identities(model)
+        return super().after_model_change(form, model, is_created)
+
+    def after_model_delete(self, model):
+        invalidate_reference(type(model))
+        invalidate_identities(model)
+        return super().after_model_delete(model)
+
     can_view_details = True
     named_filter_urls = True
 
@@ -0,0 +1,51 @@
+import threading
+
+from rq import Retry, get_current_job
+
+from ..database import db
+
+# Import jobs commit as they go, so a failed attempt is retried from where it got to
+IMPORT_JOB_RETRY = Retry(max=3, interval=60)
+IMPORT_JOB_TIMEOUT = 1200  # 20 minutes
+
+# Imports in one job can run in parallel threads (see fetch_pages), sharing its meta
+_meta_lock = threading.Lock()
+
+
+class ImportProgress:
+    """
+    Progress of one import (e.g. a table of an NCES file or an Airtable table) in
+    the current RQ job. It's saved to `job.meta` after every committed chunk so the
+    admin can show it (see ManageDataView.job_status), and so a retried job can
+    resume after the last committed chunk. Pass `job` when importing from a thread
+    other than the job's own.
+    """
+
+    def __init__(self, name, total=None, job=None):
+        self.job = job or get_current_job()
+        with _meta_lock:
+            imports = self.job.meta.setdefault("progress", {}) if self.job else {}
+            self.counts = imports.setdefault(
+                name,
+                {
+                    "processed": 0,
+                    "inserted": 0,
+                    "updated": 0,
+                    "skipped": 0,
+                    "failed": 0,
+                },
+            )
+            if total is not None:
+                self.counts["total"] = total
+        # Rows committed by earlier attempts of this job
+        self.resume_from = self.counts["processed"]
+
+    def commit(self, processed, **counts):
+        """Commit a chunk of `processed` rows and record what happened to them."""
+        db.session.commit()
+        with _meta_lock:
+            self.counts["processed"] += processed
+            for key, count in counts.items():
+                self.counts[key] += count
+            if self.job:
+                self.job.save_meta()
@@ -1,59 +1,26 @@
-import os
 from io import StringIO
-import re
-from bs4 import BeautifulSoup
 from flask import jsonify, request
 
 from flask_admin import expose, BaseView
 from flask_login import current_user
-from pyairtable import Api
-import requests
 from rq import Queue
 from rq.job import Job
 from server.routes.auth import has_role
 from server.models.models import State
 from worker import conn
 
-from ..admin.util import (
-    fetch_pages,
-    sync_school_districts,
-    sync_schools,
-    create_or_sync_incidents,
-    convert_file_to_data,
-)
+from ..admin.jobs import IMPORT_JOB_RETRY, IMPORT_JOB_TIMEOUT
+from ..admin.nces import enqueue_nces_refresh, get_state_id, get_state_urls
+from ..admin.airtable import get_table, sync_airtable
+from ..admin.util import fetch_pages, convert_file_to_data
 
 q = Queue(connection=conn)
 
-BASE_SCHOOL_URL = "https://nces.ed.gov/ccd/schoolsearch"
-BASE_PRIVATE_SCHOOL_URL = "https://nces.ed.gov/surveys/pss/privateschoolsearch"
-BASE_DISTRICT_URL = "https://nces.ed.gov/ccd/districtsearch"
-
 
 def handle_job(job):
     return jsonify({"job_id": job.get_id(), "status": "loading"})
 
 
-def get_state_id(state):
-    """Fetches the NCES State ID for a given state abbreviation."""
-    response = requests.get(BASE_SCHOOL_URL)
-
-    if response.status_code != 200:
-        raise Exception("Failed to fetch NCES page")
-
-    soup = BeautifulSoup(response.text, "html.parser")
-    state_select = soup.find("select", {"name": "State"})
-
-    # Find the option that matches the full state name
-    for option in state_select.find_all("option"):
-        # Normalize strings with regular spaces
-        optionText = re.sub(r"\s+", " ", option.text).strip()
-        stateText = re.sub(r"\s+", " ", state).strip()
-        if optionText == stateText:
-            return option["value"]
-
-    raise ValueError(f"State ID not found for: {state}")
-
-
 class ManageDataView(BaseView):
     def __init__(self, roles_required=None, **kwargs):
         super().__init__(**kwargs)
@@ -75,17 +42,32 @@ class ManageDataView(BaseView):
 
     @expose("/job-status/<job_id>", methods=["GET"])
     def job_status(cls, job_id):
-        """Check job status from Redis."""
+        """Check job status and import progress (see ImportProgress) from Redis."""
         job_result = Job.fetch(id=job_id, connection=conn)
+        progress = job_result.meta.get("progress", {})
+        # A batch refresh reports the progress of all of its jobs
+        for job in Job.fetch_many(job_result.meta.get("jobs", []), connection=conn):
+            if job:
+                progress.update(job.meta.get("progress", {}))
         if job_result.return_value():
             return jsonify(
                 {
                     "status": "finished",
                     "alertMessage": f"{job_result.return_value()} complete!",
+                    "progress": progress,
+                }
+            )
+        if job_result.is_failed:
+            return jsonify(
+                {
+                    "status": "failed",
+                    "alertMessage": "Import failed after retrying. Rows already "
+                    "imported have been kept.",
+                    "progress": progress,
                 }
             )
 
-        return jsonify({"status": "pending"})
+        return jsonify({"status": "pending", "progress": progress})
 
     @expose("/upload", methods=["POST"])
     def upload(cls):
@@ -94,44 +76,53 @@ class ManageDataView(BaseView):
             # Read the file in memory using StringIO
             file_content = file.stream.read().decode("utf-8", errors="ignore")
             file_io = StringIO(file_content)
-            return handle_job(q.enqueue(convert_file_to_data, file_io))
+            return handle_job(
+                q.enqueue(
+                    convert_file_to_data,
+                    file_io,
+                    job_timeout=IMPORT_JOB_TIMEOUT,
+                    retry=IMPORT_JOB_RETRY,
+                )
+            )
         else:
             return "Invalid file format", 400
 
     @expose("/fetch-by-state", methods=["POST"])
     def fetch(cls):
-        state = request.form["state"]
-        state_id = get_state_id(state)
+        # One or more states, all fetched in the same job
+        states = request.form.getlist("state")
 
         return handle_job(
             q.enqueue(
                 fetch_pages,
-                [
-                    f"{BASE_DISTRICT_URL}/district_list.asp?State={state_id}",
-                    f"{BASE_SCHOOL_URL}/school_list.asp?State={state_id}",
-                    f"{BASE_PRIVATE_SCHOOL_URL}/school_list.asp?State={state_id}",
-                ],
-                job_timeout=1200,  # 15 minutes
+                {state: get_state_urls(get_state_id(state)) for state in states},
+                job_timeout=IMPORT_JOB_TIMEOUT * len(states),
+                retry=IMPORT_JOB_RETRY,
             )
         )
 
+    @expose("/refresh", methods=["POST"])
+    def refresh(cls):
+        # A list of states, or "all", each fetched by its own job
+        try:
+            return handle_job(enqueue_nces_refresh(request.form.getlist("state")))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
     @expose("/sync", methods=["POST"])
     def sync(cls):
-        # Sync existing district rows with airtable metadata
+        # Sync existing rows with the airtable records changed since the last sync
         region = request.form["region"]
         table_name = request.form["table"]
-        api = Api(os.environ["AIRTABLE_READ_TOKEN"])
-        try:
-            table = api.table(os.environ[f"AIRTABLE_APP_ID_{region}"], table_name)
-            data = table.all()
-        except Exception as e:
-            raise ValueError("Invalid Airtable ID")
-
-        if table_name == "District-Table":
-            return handle_job(q.enqueue(sync_school_districts, data, job_timeout=1200))
-        elif table_name == "School-Table":
-            return handle_job(q.enqueue(sync_schools, data, job_timeout=1200))
-        elif table_name == "Incident-Table":
-            return handle_job(
-                q.enqueue(create_or_sync_incidents, data, job_timeout=1200)
+        get_table(region, table_name)  # Raises ValueError for an unknown table
+
+        return handle_job(
+            q.enqueue(
+                sync_airtable,
+                region,
+                table_name,
+                full=bool(request.form.get("full")),
+                job_timeout=IMPORT_JOB_TIMEOUT,
+                retry=IMPORT_JOB_RETRY,
             )
+        )
@@ -0,0 +1,149 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import os
+from tempfile import SpooledTemporaryFile
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.fields import format_header_param_html5
+
+from server.models.files import (
+    MIRRORED_FILES_KEY,
+    MIRRORED_SOURCES_KEY,
+    MIRRORED_URLS_KEY,
+)
+from worker import conn
+
+API_URL = "https://app.simplefileupload.com/api/v1/file"
+
+# Files downloaded and uploaded at once
+MIRROR_WORKERS = 8
+# Files up to this size are kept in memory while they're mirrored, bigger ones on disk
+SPOOL_SIZE = 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+# Seconds to wait to connect to, or hear back from, Airtable and Simple File Upload
+MIRROR_TIMEOUT = 60
+
+# Shared by the mirroring threads, keeping connections to each host open between files
+http_session = requests.Session()
+http_session.mount("https://", HTTPAdapter(pool_maxsize=MIRROR_WORKERS))
+
+
+class MultipartFile:
+    """
+    A multipart/form-data body read from `file` as it's sent rather than built in
+    memory. Its `len` lets requests send a Content-Length instead of chunking.
+    Names are escaped as browsers (and urllib3) do, so quotes or line breaks in a
+    filename can't break out of its header.
+    """
+
+    def __init__(self, fields, filename, file, size):
+        self.boundary = uuid.uuid4().hex
+        head = (
+            b"".join(
+                f"--{self.boundary}\r\nContent-Disposition: form-data; "
+                f"{format_header_param_html5('name', name)}"
+                f"\r\n\r\n{value}\r\n".encode()
+                for name, value in fields.items()
+            )
+            + (
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="file"; '
+                f"{format_header_param_html5('filename', filename)}\r\n"
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode()
+        )
+        tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.len = len(head) + size + len(tail)
+        self._parts = [BytesIO(head), file, BytesIO(tail)]
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def read(self, size=-1):
+        chunks = []
+        while self._parts and size != 0:
+            chunk = self._parts[0].read(size)
+            if not chunk:
+                self._parts.pop(0)
+                continue
+            chunks.append(chunk)
+            if size > 0:
+                size -= len(chunk)
+        return b"".join(chunks)
+
+
+def download(url, file):
+    """Stream `url` into `file`, returning the SHA-256 of its content and its size."""
+    sha256 = hashlib.sha256()
+    with http_session.get(url, stream=True, timeout=MIRROR_TIMEOUT) as response:
+        response.raise_for_status()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            sha256.update(chunk)
+            file.write(chunk)
+    size = file.tell()
+    file.seek(0)
+    return sha256.hexdigest(), size
+
+
+def simple_file_upload_from_url(url, filename):
+    """
+    We use heroku's simple file upload plugin to handle how we store files (S3 under the hood).
+    We need to download Airtable files and reupload to Simple File Upload. Files with
+    the same content as one mirrored before aren't uploaded again, and files mirrored
+    from the same url aren't downloaded again.
+    """
+    if url == None:
+        return
+
+    # Skip the download if the url was mirrored before and that copy is still there
+    mirrored_url = conn.hget(MIRRORED_SOURCES_KEY, url)
+    if mirrored_url and conn.hexists(MIRRORED_URLS_KEY, mirrored_url):
+        return mirrored_url.decode()
+
+    with SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+        digest, size = download(url, file)
+        mirrored_url = conn.hget(MIRRORED_FILES_KEY, digest)
+        if mirrored_url:
+            conn.hset(MIRRORED_SOURCES_KEY, url, mirrored_url)
+            return mirrored_url.decode()
+
+        body = MultipartFile({"tag": f"{os.environ['ENV']}-logo"}, filename, file, size)
+        response = http_session.post(
+            API_URL,
+            data=body,
+            headers={"Content-Type": body.content_type},
+            auth=(
+                os.environ["SIMPLE_FILE_UPLOAD_API_TOKEN"],
+                os.environ["SIMPLE_FILE_UPLOAD_API_SECRET"],
+            ),
+            timeout=MIRROR_TIMEOUT,
+        )
+    response.raise_for_status()
+    cdn_url = response.json()["data"]["attributes"]["cdn-url"]
+    conn.hset(MIRRORED_FILES_KEY, digest, cdn_url)
+    conn.hset(MIRRORED_URLS_KEY, cdn_url, digest)
+    conn.hset(MIRRORED_SOURCES_KEY, url, cdn_url)
+    return cdn_url
+
+
+def mirror_file(url, filename):
+    try:
+        return simple_file_upload_from_url(url, filename)
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print(f"Error mirroring {filename} from {url}: {str(e)}")
+
+
+def mirror_files(attachments):
+    """
+    Mirror Airtable attachments (dicts with a `url` and `filename`) to Simple File
+    Upload, several at a time. Returns their new urls by Airtable url, or None for
+    files that couldn't be mirrored.
+    """
+    files = {attachment["url"]: attachment["filename"] for attachment in attachments}
+    if not files:
+        return {}
+    with ThreadPoolExecutor(max_workers=MIRROR_WORKERS) as executor:
+        return dict(zip(files, executor.map(mirror_file, files, files.values())))
@@ -1,9 +1,7 @@
 import calendar
 from datetime import datetime, date
-import os
-from flask import jsonify, redirect, request, url_for
+from flask import redirect, request, url_for
 from flask_login import current_user
-import requests
 
 from server.routes.auth import has_role
 from server.models.user import UserRole
@@ -34,12 +32,10 @@ from wtforms import (
     validators,
 )
 from wtforms.widgets import DateInput
-from requests.auth import HTTPBasicAuth
-from sqlalchemy import desc, event, func
+from sqlalchemy import desc, func
 from sqlalchemy.orm import aliased
 
 from ..models.models import (
-    File,
     Incident,
     IncidentPrivacyStatus,
     IncidentPublishDetail,
@@ -62,10 +58,6 @@ from ..models.models import (
 )
 from ..database import db
 
-API_URL = "https://app.simplefileupload.com/api/v1/file"
-API_TOKEN = os.environ["SIMPLE_FILE_UPLOAD_API_TOKEN"]
-API_SECRET = os.environ["SIMPLE_FILE_UPLOAD_API_SECRET"]
-
 
 class RoleView(BaseModelView):
     can_delete = False
@@ -117,42 +109,6 @@ class UserView(AuditModelView):
     column_formatters = {"audit_log": _all_audit_log_link}
 
 
-def simple_file_delete_from_url(mapper, connection, target):
-    """
-    Let's delete a resource from simple file upload storage so we
-    don't overload.
-    """
-    if target.url == None:
-        return
-
-    try:
-        response = requests.delete(
-            API_URL,
-            params={"url": target.url},
-            auth=HTTPBasicAuth(API_TOKEN, API_SECRET),
-        )
-    except requests.exceptions.RequestException as e:
-        return (
-            jsonify(
-                {
-                    "error": f"Simple File Upload delete failed with status: {response.status_code}"
-                }
-            ),
-            500,
-        )
-
-    if response.status_code == 200:
-        print("Success deleting Simple File Upload file")
-        return {"success": True, "message": "File deleted successfully"}
-    else:
-        print("Error when deleting Simple File Upload file: ", response.text)
-        return {"success": False, "error": response.text}
-
-
-# Event listener to delete file from simple file upload
-event.listen(File, "before_delete", simple_file_delete_from_url, propagate=True)
-
-
 class PublishDetailsForm(Form):
     publish = BooleanField("Publish")
     publish_status = QuerySelectField(
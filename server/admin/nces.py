@@ -0,0 +1,122 @@
+import re
+
+from bs4 import BeautifulSoup
+import requests
+from rq import Queue, get_current_job
+from rq.job import Dependency, Job
+
+from server.cache import get_or_load
+from server.models.models import State
+from worker import conn, listen
+
+from .jobs import IMPORT_JOB_RETRY, IMPORT_JOB_TIMEOUT
+from .util import fetch_pages
+
+BASE_SCHOOL_URL = "https://nces.ed.gov/ccd/schoolsearch"
+BASE_PRIVATE_SCHOOL_URL = "https://nces.ed.gov/surveys/pss/privateschoolsearch"
+BASE_DISTRICT_URL = "https://nces.ed.gov/ccd/districtsearch"
+
+STATE_IDS_KEY = "nces:state-ids"
+
+# States fetched at once by a batch refresh. Each lane works through its states
+# one job after another, on its own queue, so at most this many NCES fetches (and
+# browsers) run at the same time whatever the size of the batch.
+REFRESH_LANES = len(listen)
+
+
+def normalize_state(state):
+    # Normalize strings with regular spaces
+    return re.sub(r"\s+", " ", state).strip()
+
+
+def load_state_ids():
+    """Fetches the NCES State IDs from the NCES search page, by state name."""
+    response = requests.get(BASE_SCHOOL_URL)
+
+    if response.status_code != 200:
+        raise Exception("Failed to fetch NCES page")
+
+    soup = BeautifulSoup(response.text, "html.parser")
+    state_select = soup.find("select", {"name": "State"})
+    return {
+        normalize_state(option.text): option["value"]
+        for option in state_select.find_all("option")
+    }
+
+
+def get_state_id(state):
+    """Fetches the NCES State ID for a given state name."""
+    state_id = get_or_load(STATE_IDS_KEY, load_state_ids).get(normalize_state(state))
+    if state_id is None:
+        raise ValueError(f"State ID not found for: {state}")
+    return state_id
+
+
+def get_state_urls(state_id):
+    """The NCES search pages (districts, public and private schools) for a state."""
+    return [
+        f"{BASE_DISTRICT_URL}/district_list.asp?State={state_id}",
+        f"{BASE_SCHOOL_URL}/school_list.asp?State={state_id}",
+        f"{BASE_PRIVATE_SCHOOL_URL}/school_list.asp?State={state_id}",
+    ]
+
+
+def refresh_states(states):
+    """The states a refresh covers: the given state names, or every state for "all"."""
+    if states == "all" or "all" in states:
+        return [state.value for state in State]
+    return list(states)
+
+
+def enqueue_nces_refresh(states):
+    """
+    Fetch and import NCES data for many states (or "all") with one job per state,
+    spread over REFRESH_LANES lanes. Returns a job that finishes after all of them
+    and reports their progress (see ManageDataView.job_status).
+    """
+    states = refresh_states(states)
+    # Look every state up first, so a bad name fails before anything is enqueued
+    urls_by_state = {state: get_state_urls(get_state_id(state)) for state in states}
+
+    queues = [Queue(name, connection=conn) for name in listen]
+    lanes = [None] * REFRESH_LANES
+    jobs = []
+    for i, (state, urls) in enumerate(urls_by_state.items()):
+        lane = i % REFRESH_LANES
+        # A failed state doesn't hold up the rest of its lane
+        depends_on = lanes[lane] and Dependency(jobs=[lanes[lane]], allow_failure=True)
+        lanes[lane] = queues[lane % len(queues)].enqueue(
+            fetch_pages,
+            {state: urls},
+            depends_on=depends_on,
+            job_timeout=IMPORT_JOB_TIMEOUT,
+            retry=IMPORT_JOB_RETRY,
+            meta={"state": state},
+        )
+        jobs.append(lanes[lane])
+
+    return queues[-1].enqueue(
+        finish_nces_refresh,
+        depends_on=Dependency(
+            jobs=[lane for lane in lanes if lane], allow_failure=True
+        ),
+        meta={"jobs": [job.id for job in jobs]},
+    )
+
+
+def finish_nces_refresh():
+    """Summarizes a batch refresh once all of its state jobs are done."""
+    jobs = Job.fetch_many(get_current_job().meta["jobs"], connection=conn)
+    failed = [job.meta["state"] for job in jobs if job and job.is_failed]
+    summary = f"NCES refresh of {len(jobs)} states"
+    if failed:
+        summary += f" ({len(failed)} failed: {', '.join(failed)})"
+    return summary
+
+
+if __name__ == "__main__":
+    # Nightly refresh of the whole school directory (e.g. from Heroku Scheduler)
+    from server import create_app
+
+    with create_app().app_context():
+        print(f"Enqueued {enqueue_nces_refresh('all').id}")
@@ -1,12 +1,16 @@
+import asyncio
 from enum import Enum
-import os
+from html.parser import HTMLParser
+from itertools import islice, zip_longest
 import re
 import traceback
 
-from flask import jsonify
+from flask import current_app
 from pyppeteer import launch
 import requests
+from rq import get_current_job
 
+from server.models.autocomplete import invalidate_autocomplete
 from server.models.user import User
 
 from ..models.models import (
@@ -30,12 +34,30 @@ from ..models.models import (
     SchoolTypes,
     IncidentDocument,
     Status,
+    school_types,
 )
-from bs4 import BeautifulSoup, Tag
-from io import StringIO
+from io import TextIOWrapper
 import csv
 from ..database import db
-import urllib.request
+from .jobs import ImportProgress
+from .mirror import mirror_files
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+
+# Rows per INSERT (and commit) when importing NCES data
+IMPORT_CHUNK_SIZE = 500
+# Records per commit when syncing from Airtable
+SYNC_CHUNK_SIZE = 100
+# Problems with a row's data that skip the row rather than fail the import
+ROW_ERRORS = (KeyError, ValueError, TypeError, AttributeError)
+# NCES search pages open in the browser at once when fetching exports
+NCES_MAX_PAGES = 6
+# Seconds to wait for the export popup after clicking for it
+POPUP_TIMEOUT = 60
+# Seconds to wait for NCES to start (or continue) sending an export
+NCES_DOWNLOAD_TIMEOUT = 120
 
 
 class DataType(Enum):
@@ -44,58 +66,119 @@ class DataType(Enum):
     PRIVATE_SCHOOL = "private_school"
 
 
+class TableRowParser(HTMLParser):
+    """
+    Incrementally parses the rows of the first table in an HTML document. Feed it
+    text as it's read and take completed rows (lists of cell text) from `rows`.
+    Rows and cells don't need closing tags, as in the NCES exports.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self._depth = 0
+        self._done = False
+        self._row = None
+        self._cell = None
+
+    def _end_cell(self):
+        if self._cell is not None:
+            self._row.append("".join(self._cell).strip())
+            self._cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        if self._row is not None:
+            self.rows.append(self._row)
+            self._row = None
+
+    def handle_starttag(self, tag, attrs):
+        if self._done:
+            return
+        if tag == "table":
+            self._depth += 1
+        elif self._depth == 1 and tag == "tr":
+            self._end_row()
+            self._row = []
+        elif self._depth == 1 and tag == "td" and self._row is not None:
+            self._end_cell()
+            self._cell = []
+
+    def handle_endtag(self, tag):
+        if self._done or not self._depth:
+            return
+        if tag == "table":
+            self._depth -= 1
+            if not self._depth:
+                self._end_row()
+                self._done = True
+        elif self._depth == 1 and tag == "tr":
+            self._end_row()
+        elif self._depth == 1 and tag == "td":
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell.append(data)
+
+    def close(self):
+        super().close()
+        if not self._done:
+            self._end_row()
+
+
+def iter_table_rows(html_file, read_size=64 * 1024):
+    """Yield the rows of the first table in an HTML file, reading it a piece at a time."""
+    parser = TableRowParser()
+    while text := html_file.read(read_size):
+        parser.feed(text)
+        yield from parser.rows
+        parser.rows.clear()
+    parser.close()
+    yield from parser.rows
+
+
 # Borrowed logic from https://github.com/stophateinschools/nces-data-scripts/blob/main/nceshtml2csv.py
 # to reduce manual steps outside of this tool needed.
 # Thanks Dave :)
-def convert_file_to_data(html_file):
+def convert_file_to_data(html_file, source=None, job=None):
     """
-    Converts an HTML file containing a table of data to CSV and writes to in memory file.
+    Imports the table of data in an NCES HTML export, streaming its rows straight
+    into the database. `source` (e.g. the state) tells apart the progress of exports
+    of the same data type imported by one job.
     """
     try:
-        # Parse the HTML
-        soup = BeautifulSoup(html_file, "html.parser")
+        rows = iter_table_rows(html_file)
 
-        # Find the table in the HTML
-        table = soup.find("table")
-
-        # Create a StringIO object to hold the CSV data in memory
-        # TODO with output = StringIO so that output is closed at the end
-        output = StringIO()
-        csvwriter = csv.writer(output)
-
-        # Find the row that contains headers and write it
-        headers_written = False
+        # Find the row that contains headers
         data_type = None
-        if isinstance(table, Tag):
-            for row in table.find_all("tr"):
-                headers = [cell.text.strip() for cell in row.find_all("td")]
-                if headers and (
-                    "NCES School ID" in headers[0]
-                    or "NCES District ID" in headers[0]
-                    or "PSS_SCHOOL_ID" in headers[0]
-                ):
-                    if "NCES School ID" in headers[0]:
-                        data_type = DataType.SCHOOL.value
-                    elif "PSS_SCHOOL_ID" in headers[0]:
-                        data_type = DataType.PRIVATE_SCHOOL.value
-                    elif "NCES District ID" in headers[0]:
-                        data_type = DataType.SCHOOL_DISTRICT.value
-
-                    csvwriter.writerow(headers)
-                    headers_written = True
-                    break
-
-        # Write the remaining rows after headers
-        if headers_written:
-            for row in table.find_all("tr")[table.find_all("tr").index(row) + 1 :]:
-                cells = [cell.text.strip() for cell in row.find_all("td")]
-                if cells:  # Skip empty rows
-                    csvwriter.writerow(cells)
+        for headers in rows:
+            if headers and (
+                "NCES School ID" in headers[0]
+                or "NCES District ID" in headers[0]
+                or "PSS_SCHOOL_ID" in headers[0]
+            ):
+                if "NCES School ID" in headers[0]:
+                    data_type = DataType.SCHOOL.value
+                elif "PSS_SCHOOL_ID" in headers[0]:
+                    data_type = DataType.PRIVATE_SCHOOL.value
+                elif "NCES District ID" in headers[0]:
+                    data_type = DataType.SCHOOL_DISTRICT.value
+                break
 
         assert data_type  # Make sure we regnoize file data type
-        output.seek(0)  # Rewind the StringIO object to the beginning for reading
 
-        convert_csv_to_data(output, data_type)
+        # The remaining rows are data, keyed by header
+        import_rows(
+            data_type,
+            (
+                dict(zip_longest(headers, cells[: len(headers)], fillvalue=""))
+                for cells in rows
+                if cells  # Skip empty rows
+            ),
+            progress_name=f"{data_type} ({source})" if source else None,
+            job=job,
+        )
 
         return f"Upload {data_type}"
     except Exception as e:
@@ -107,156 +190,176 @@ def convert_csv_to_data(csv_file, data_type):
     """
     Converts an CSV file to data in our database.
     """
-    csv_reader = csv.DictReader(csv_file)
-    for row in csv_reader:
-        if data_type == DataType.SCHOOL_DISTRICT.value:
-            create_school_district(row)
-        elif data_type == DataType.SCHOOL.value:
-            create_school(row, is_public=True)
-        elif data_type == DataType.PRIVATE_SCHOOL.value:
-            create_school(row, is_public=False)
-    db.session.commit()
-
-
-def create_school_district(data):
-    district_name = data["District Name"].strip()
-    nces_id = data["NCES District ID"].strip()
-    state = data["State"]
-
-    if "college" in district_name.lower():
-        return
+    import_rows(data_type, csv.DictReader(csv_file))
 
-    existing_district = SchoolDistrict.query.filter_by(nces_id=nces_id).first()
-    if existing_district:
-        # Maybe at some point do a merge here if we want to update any data
-        return
 
-    district = SchoolDistrict(name=district_name, nces_id=nces_id, state=state)
-    db.session.add(district)
-
-
-def simple_file_upload_from_url(url, filename):
+def import_rows(data_type, rows, progress_name=None, job=None):
     """
-    We use heroku's simple file upload plugin to handle how we store files (S3 under the hood).
-    We need to download Airtable files and reupload to Simple File Upload.
+    Import NCES rows (dicts keyed by header) of the given data type, committing
+    a chunk at a time and resuming after the rows an earlier attempt committed.
     """
-    if url == None:
-        return
+    progress = ImportProgress(progress_name or data_type, job=job)
+    rows = islice(rows, progress.resume_from, None)
+    if data_type == DataType.SCHOOL_DISTRICT.value:
+        import_school_districts(rows, progress)
+    elif data_type == DataType.SCHOOL.value:
+        import_schools(rows, progress, is_public=True)
+    elif data_type == DataType.PRIVATE_SCHOOL.value:
+        import_schools(rows, progress, is_public=False)
 
-    API_URL = "https://app.simplefileupload.com/api/v1/file"
-    API_TOKEN = os.environ["SIMPLE_FILE_UPLOAD_API_TOKEN"]
-    API_SECRET = os.environ["SIMPLE_FILE_UPLOAD_API_SECRET"]
-    ENV = os.environ["ENV"]
 
-    try:
-        image_response = requests.get(url)
-        image_response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        return jsonify({"error": f"Error downloading file: {str(e)}"}), 400
+def chunked(iterable, size=IMPORT_CHUNK_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
 
-    file = {"file": (filename, image_response.content)}
-    data = {"tag": f"{ENV}-logo"}
-    try:
-        response = requests.post(
-            API_URL,
-            files=file,
-            data=data,
-            auth=(API_TOKEN, API_SECRET),
+
+def school_district_values(data):
+    """Column values for an NCES district row, or None if we don't import it."""
+    district_name = data["District Name"].strip()
+    if "college" in district_name.lower():
+        return None
+
+    return {
+        "name": district_name,
+        "nces_id": data["NCES District ID"].strip(),
+        "state": data["State"],
+    }
+
+
+def import_school_districts(rows, progress):
+    """Insert the districts in NCES rows that we don't have yet, a chunk at a time."""
+    # Maybe at some point do a merge here if we want to update any data
+    existing_nces_ids = set(db.session.scalars(select(SchoolDistrict.nces_id)))
+    for chunk in chunked(rows):
+        districts = []
+        failed = 0
+        for row in chunk:
+            try:
+                district = school_district_values(row)
+            except ROW_ERRORS as e:
+                print(f"Skipping invalid district row {row}: {e}")
+                failed += 1
+                continue
+            if district and district["nces_id"] not in existing_nces_ids:
+                existing_nces_ids.add(district["nces_id"])
+                districts.append(district)
+
+        states = (
+            db.session.scalars(
+                pg_insert(SchoolDistrict)
+                .values(districts)
+                .on_conflict_do_nothing(index_elements=["nces_id"])
+                .returning(SchoolDistrict.state)
+            ).all()
+            if districts
+            else []
         )
-    except requests.exceptions.RequestException as e:
-        return (
-            jsonify(
-                {
-                    "error": f"Simple File Upload failed with status: {response.status_code}"
-                }
-            ),
-            500,
+        progress.commit(
+            len(chunk),
+            inserted=len(states),
+            failed=failed,
+            skipped=len(chunk) - len(states) - failed,
         )
+        # Core inserts skip the session listeners that keep typeahead indexes current
+        invalidate_autocomplete(SchoolDistrict, states)
 
-    print(response.status_code, response.json())
-    if response.status_code == 200:
-        try:
-            data = response.json()["data"]
-            return data["attributes"]["cdn-url"]
-        except ValueError:
-            return (
-                jsonify({"error": "Invalid JSON response from Simple File Upload API"}),
-                500,
-            )
 
-
-def sync_school_districts(districts):
+def sync_school_districts(districts, progress=None):
     """
-    Sync school district data from Airtable to our database.
+    Sync school district data from Airtable to our database. Pass `progress` to
+    count several calls (e.g. pages of records) as one sync, see sync_airtable.
     """
+    if progress is None:
+        progress = ImportProgress("districts", total=len(districts))
+        districts = districts[progress.resume_from :]
     try:
-        updated_count = 0
-        for district in districts:
-            nces_id = district["fields"].get("NCES-District-ID")
-
-            existing_district = SchoolDistrict.query.filter_by(nces_id=nces_id).first()
-            if existing_district == None:
-                continue
-
-            logo = (
-                district["fields"].get("District-Logo")[0]
-                if district["fields"].get("District-Logo")
-                else None
-            )
-            if logo:
-                airtable_url = logo["url"]
-                filename = logo["filename"]
-                if (
-                    existing_district.logo
-                    and existing_district.logo.jsonable()["name"] != filename
-                ) or (not existing_district.logo):
-                    # This would have created a S3 file everytime we sync - so if
-                    # the file already exists, don't create a new one.
-                    new_url = simple_file_upload_from_url(airtable_url, filename)
-                    print("newurl and filename ", new_url, filename)
+        for chunk in chunked(districts, SYNC_CHUNK_SIZE):
+            updated_count = 0
+            existing_districts = {
+                existing_district.nces_id: existing_district
+                for existing_district in SchoolDistrict.query.filter(
+                    SchoolDistrict.nces_id.in_(
+                        district["fields"].get("NCES-District-ID") for district in chunk
+                    )
+                )
+            }
+            # This would have created a S3 file everytime we sync - so if the file
+            # already exists, don't create a new one.
+            new_logos = {}
+            for district in chunk:
+                existing_district = existing_districts.get(
+                    district["fields"].get("NCES-District-ID")
+                )
+                logos = district["fields"].get("District-Logo")
+                if existing_district and logos:
+                    if (
+                        not existing_district.logo
+                        or existing_district.logo.jsonable()["name"]
+                        != logos[0]["filename"]
+                    ):
+                        new_logos[district["id"]] = logos[0]
+            new_urls = mirror_files(new_logos.values())
+
+            for district in chunk:
+                nces_id = district["fields"].get("NCES-District-ID")
+
+                existing_district = existing_districts.get(nces_id)
+                if existing_district == None:
+                    continue
+
+                logo = new_logos.get(district["id"])
+                if logo and new_urls[logo["url"]]:
                     existing_district.logo = SchoolDistrictLogo(
-                        url=new_url, name=filename
+                        url=new_urls[logo["url"]], name=logo["filename"]
                     )
 
-            airtable_name = district["fields"].get("District-Name")
-            existing_district.display_name = (
-                airtable_name if airtable_name != existing_district.name else None
-            )
-            existing_district.airtable_id = district["id"]
-            existing_district.url = district["fields"].get("District-URL")
-            existing_district.twitter = district["fields"].get("District-Twitter")
-            existing_district.facebook = district["fields"].get("District-Facebook")
-            existing_district.phone = district["fields"].get("District-Phone")
-            existing_district.superintendent_name = district["fields"].get(
-                "Superintendent-Name"
-            )
-            existing_district.superintendent_email = district["fields"].get(
-                "Superintendent-Email"
-            )
-            existing_district.civil_rights_url = district["fields"].get(
-                "CivilRights-URL"
-            )
-            existing_district.civil_rights_contact_name = district["fields"].get(
-                "CivilRights-Contact"
-            )
-            existing_district.civil_rights_contact_email = district["fields"].get(
-                "CivilRights-Email"
-            )
-            existing_district.hib_url = district["fields"].get("HIB-URL")
-            existing_district.hib_form_url = district["fields"].get("HIB-Form")
-            existing_district.hib_contact_name = district["fields"].get("HIB-Contact")
-            existing_district.hib_contact_email = district["fields"].get("HIB-Email")
-            existing_district.board_url = district["fields"].get("Board-URL")
+                airtable_name = district["fields"].get("District-Name")
+                existing_district.display_name = (
+                    airtable_name if airtable_name != existing_district.name else None
+                )
+                existing_district.airtable_id = district["id"]
+                existing_district.url = district["fields"].get("District-URL")
+                existing_district.twitter = district["fields"].get("District-Twitter")
+                existing_district.facebook = district["fields"].get("District-Facebook")
+                existing_district.phone = district["fields"].get("District-Phone")
+                existing_district.superintendent_name = district["fields"].get(
+                    "Superintendent-Name"
+                )
+                existing_district.superintendent_email = district["fields"].get(
+                    "Superintendent-Email"
+                )
+                existing_district.civil_rights_url = district["fields"].get(
+                    "CivilRights-URL"
+                )
+                existing_district.civil_rights_contact_name = district["fields"].get(
+                    "CivilRights-Contact"
+                )
+                existing_district.civil_rights_contact_email = district["fields"].get(
+                    "CivilRights-Email"
+                )
+                existing_district.hib_url = district["fields"].get("HIB-URL")
+                existing_district.hib_form_url = district["fields"].get("HIB-Form")
+                existing_district.hib_contact_name = district["fields"].get(
+                    "HIB-Contact"
+                )
+                existing_district.hib_contact_email = district["fields"].get(
+                    "HIB-Email"
+                )
+                existing_district.board_url = district["fields"].get("Board-URL")
+
+                updated_count += 1
 
-            updated_count += 1
+            progress.commit(
+                len(chunk), updated=updated_count, skipped=len(chunk) - updated_count
+            )
 
-        db.session.commit()
-        return f"Sync complete: {updated_count} districts updated"
+        return f"Sync complete: {progress.counts['updated']} districts updated"
     except Exception as e:
         db.session.rollback()
         error_msg = f"Sync failed: {str(e)}\n{traceback.format_exc()}"
         print(error_msg)
-        return error_msg
+        raise
 
 
 def convert_grade_to_int(grade):
@@ -318,7 +421,11 @@ def deformat_phone_number(phone):
     return re.sub(r"\D", "", phone)
 
 
-def create_school(data, is_public):
+def school_values(data, is_public):
+    """
+    Column values, school types and district NCES ID for an NCES school row, or
+    None if we don't import it.
+    """
     if is_public:
         school_name = get_title_casing(data["School Name"])
         nces_id = data["NCES School ID"].strip()
@@ -329,14 +436,10 @@ def create_school(data, is_public):
         phone = deformat_phone_number(data["Phone"].strip())
         low_grade = data["Low Grade"].strip()
         high_grade = data["High Grade"].strip()
-        level = categorize_school_level(low_grade, high_grade)
         types = (
-            [
-                SchoolType.query.filter_by(name=SchoolTypes.PUBLIC).first(),
-                SchoolType.query.filter_by(name=SchoolTypes.CHARTER).first(),
-            ]
+            [SchoolTypes.PUBLIC, SchoolTypes.CHARTER]
             if data["Charter"] == "No"
-            else [SchoolType.query.filter_by(name=SchoolTypes.PUBLIC).first()]
+            else [SchoolTypes.PUBLIC]
         )
         district_nces_id = data["NCES District ID"].strip()
     else:
@@ -349,332 +452,529 @@ def create_school(data, is_public):
         phone = data["PSS_PHONE"].strip()
         low_grade = data["LoGrade"].strip()
         high_grade = data["HiGrade"].strip()
-        level = categorize_school_level(low_grade, high_grade)
-        types = [SchoolType.query.filter_by(name=SchoolTypes.PRIVATE).first()]
+        types = [SchoolTypes.PRIVATE]
         district_nces_id = None
 
-    existing_school = School.query.filter_by(nces_id=nces_id).first()
-    is_undergraduate = low_grade == "UG" or high_grade == "UG"
-    if existing_school or is_undergraduate:
-        return
-
-    district = SchoolDistrict.query.filter_by(nces_id=district_nces_id).first()
-    school = School(
-        name=school_name,
-        nces_id=nces_id,
-        street=street,
-        city=city,
-        state=state,
-        postal_code=postal_code,
-        phone=phone,
-        district=district if district else None,
-        level=level,
-        low_grade=low_grade,
-        high_grade=high_grade,
-        types=types,
+    if low_grade == "UG" or high_grade == "UG":
+        return None
+
+    school = {
+        "name": school_name,
+        "nces_id": nces_id,
+        "street": street,
+        "city": city,
+        "state": state,
+        "postal_code": postal_code,
+        "phone": phone,
+        "level": categorize_school_level(low_grade, high_grade),
+        "low_grade": low_grade,
+        "high_grade": high_grade,
+    }
+    return school, types, district_nces_id
+
+
+def import_schools(rows, progress, is_public):
+    """
+    Insert the schools in NCES rows that we don't have yet, with their types, a
+    chunk at a time.
+    """
+    existing_nces_ids = set(db.session.scalars(select(School.nces_id)))
+    district_ids = dict(
+        db.session.execute(
+            select(SchoolDistrict.nces_id, SchoolDistrict.id).where(
+                SchoolDistrict.nces_id.is_not(None)
+            )
+        ).all()
     )
-    db.session.add(school)
+    type_ids = dict(db.session.execute(select(SchoolType.name, SchoolType.id)).all())
+
+    for chunk in chunked(rows):
+        schools = []
+        school_types_by_nces_id = {}
+        failed = 0
+        for row in chunk:
+            try:
+                values = school_values(row, is_public)
+            except ROW_ERRORS as e:
+                print(f"Skipping invalid school row {row}: {e}")
+                failed += 1
+                continue
+            if not values or values[0]["nces_id"] in existing_nces_ids:
+                continue
+            school, types, district_nces_id = values
+            existing_nces_ids.add(school["nces_id"])
+            school["district_id"] = district_ids.get(district_nces_id)
+            schools.append(school)
+            school_types_by_nces_id[school["nces_id"]] = types
+
+        inserted = (
+            db.session.execute(
+                pg_insert(School)
+                .values(schools)
+                .on_conflict_do_nothing(index_elements=["nces_id"])
+                .returning(School.id, School.nces_id, School.state)
+            ).all()
+            if schools
+            else []
+        )
+        links = [
+            {"school_id": school.id, "type_id": type_ids[school_type]}
+            for school in inserted
+            for school_type in school_types_by_nces_id[school.nces_id]
+            if school_type in type_ids
+        ]
+        if links:
+            db.session.execute(insert(school_types), links)
+        progress.commit(
+            len(chunk),
+            inserted=len(inserted),
+            failed=failed,
+            skipped=len(chunk) - len(inserted) - failed,
+        )
+        # Core inserts skip the session listeners that keep typeahead indexes current
+        invalidate_autocomplete(School, [school.state for school in inserted])
 
 
-def sync_schools(schools):
+def sync_schools(schools, progress=None):
     """
-    Sync school data from Airtable to our database.
+    Sync school data from Airtable to our database. Pass `progress` to count
+    several calls (e.g. pages of records) as one sync, see sync_airtable.
     """
+    if progress is None:
+        progress = ImportProgress("schools", total=len(schools))
+        schools = schools[progress.resume_from :]
     try:
-        updated_count = 0
-        for school in schools:
-            nces_id = school["fields"].get("NCES-School-ID")
+        for chunk in chunked(schools, SYNC_CHUNK_SIZE):
+            updated_count = 0
+            for school in chunk:
+                nces_id = school["fields"].get("NCES-School-ID")
 
-            existing_school = School.query.filter_by(nces_id=nces_id).first()
+                existing_school = School.query.filter_by(nces_id=nces_id).first()
 
-            if existing_school == None:
-                print(
-                    "TODO create airtable school - we had no match from NCES ", school
+                if existing_school == None:
+                    print(
+                        "TODO create airtable school - we had no match from NCES ",
+                        school,
+                    )
+                    continue
+
+                airtable_name = school["fields"].get("School-Name")
+                (
+                    existing_school.display_name == airtable_name
+                    if airtable_name != existing_school.name
+                    else None
                 )
-                continue
+                existing_school.website = school["fields"].get("Website")
+                existing_school.airtable_id = school["fields"].get("School-Record-ID")
 
-            airtable_name = school["fields"].get("School-Name")
-            (
-                existing_school.display_name == airtable_name
-                if airtable_name != existing_school.name
-                else None
-            )
-            existing_school.website = school["fields"].get("Website")
-            existing_school.airtable_id = school["fields"].get("School-Record-ID")
+                updated_count += 1
 
-            updated_count += 1
+            progress.commit(
+                len(chunk), updated=updated_count, skipped=len(chunk) - updated_count
+            )
 
-        db.session.commit()
-        return f"Sync complete: {updated_count} schools updated"
+        return f"Sync complete: {progress.counts['updated']} schools updated"
     except Exception as e:
         db.session.rollback()
         error_msg = f"Sync failed: {str(e)}\n{traceback.format_exc()}"
         print(error_msg)
-        return error_msg
+        raise
 
 
-def get_publish_status(publish_string):
-    status = None
-    if publish_string == "NO-Cannot-Validate-Insufficient-Details-or-Not-Anti-Jewish":
-        status = IncidentStatus.query.filter_by(
-            name="Cannot Validate/Insufficient Details"
-        ).first()
-    elif publish_string == "NO-Duplicate":
-        status = IncidentStatus.query.filter_by(name="Duplicate").first()
-    elif publish_string == "NO-In-Review":
-        status = IncidentStatus.query.filter_by(name="In Review").first()
-    elif publish_string == "NO-No-Permission-Provided":
-        status = IncidentStatus.query.filter_by(name="No Permission Provided").first()
-    elif publish_string == "NO-Privacy-Concern":
-        status = IncidentStatus.query.filter_by(name="Privacy Concern").first()
-    elif publish_string == "NO-Safety-Concern-Swatting":
-        status = IncidentStatus.query.filter_by(name="Safety Concern").first()
-
-    return status
-
-
-def get_publish_details(publish_string, privacy_string):
+# Incident statuses by the Airtable "Publish" value that means them
+PUBLISH_STATUS_NAMES = {
+    "NO-Cannot-Validate-Insufficient-Details-or-Not-Anti-Jewish": "Cannot Validate/Insufficient Details",
+    "NO-Duplicate": "Duplicate",
+    "NO-In-Review": "In Review",
+    "NO-No-Permission-Provided": "No Permission Provided",
+    "NO-Privacy-Concern": "Privacy Concern",
+    "NO-Safety-Concern-Swatting": "Safety Concern",
+}
+
+
+def get_publish_status(publish_string, statuses):
+    return statuses.get(PUBLISH_STATUS_NAMES.get(publish_string))
+
+
+def get_publish_details(publish_string, privacy_string, lookups):
     status = None
     privacy = None
+    privacies = lookups["privacies"]
     if publish_string == "YES" and (privacy_string and "YES" in privacy_string):
         if "YES" in privacy_string:
-            privacy = IncidentPrivacyStatus.query.filter_by(name="Full Details").first()
+            privacy = privacies.get("Full Details")
         elif "NO" in privacy_string:
-            privacy = IncidentPrivacyStatus.query.filter_by(
-                name="Limited Details"
-            ).first()
+            privacy = privacies.get("Limited Details")
     elif publish_string and "NO" in publish_string:
-        privacy = IncidentPrivacyStatus.query.filter_by(name="Hide Details").first()
-        status = get_publish_status(publish_string)
+        privacy = privacies.get("Hide Details")
+        status = get_publish_status(publish_string, lookups["statuses"])
 
     return IncidentPublishDetail(status=status, privacy=privacy)
 
 
-def create_or_sync_incidents(data):
+def by_name(model):
+    return {row.name: row for row in model.query.all()}
+
+
+def first_linked_ids(data, field):
+    """Airtable ids of the first record each incident links to in `field`."""
+    return {
+        incident["fields"][field][0]
+        for incident in data
+        if incident["fields"].get(field)
+    }
+
+
+def load_incident_lookups(data):
     """
-    Get incident data from Airtable and create or sync records.
+    Everything syncing the Airtable incidents in `data` looks up, loaded with one
+    query per table: the incidents, schools and districts by Airtable id and the
+    types and statuses by name.
     """
-    try:
-        created_count = 0
-        updated_count = 0
-        for incident in data:
-            fields = incident["fields"]
-            nces_school_id = fields.get("NCES-School-ID")
-            if nces_school_id and "See" in nces_school_id[0]:
-                # These are specific records in the National Incidents database
-                # that Josh has already moved over to state specific tables so we
-                # don't want to create them twice.
-                continue
-
-            airtable_id = incident["id"]
-            existing_incident = Incident.query.filter_by(
-                airtable_id=airtable_id
-            ).first()
-
-            airtable_id_number = fields.get("Incident-Number")
-            summary = fields.get("Incident-Summary")
-            details = fields.get("Incident-Details")
-            related_link_1 = fields.get("Related-Link-1")
-            related_link_2 = fields.get("Related-Link-2")
-            related_link_3 = fields.get("Related-Link-3")
-            internal_note_0 = fields.get("INTERNAL-Notes")
-            documents = fields.get("Supporting-Materials")
-            school_airtable_id = (
-                fields.get("School-Name")[0] if fields.get("School-Name") else None
-            )
-            school = (
-                School.query.filter_by(airtable_id=school_airtable_id).first()
-                if school_airtable_id
-                else None
+    airtable_ids = [incident["id"] for incident in data]
+    return {
+        "incidents": {
+            incident.airtable_id: incident
+            for incident in Incident.query.options(
+                selectinload(Incident.schools), selectinload(Incident.districts)
+            ).filter(Incident.airtable_id.in_(airtable_ids))
+        },
+        "schools": {
+            school.airtable_id: school
+            for school in School.query.filter(
+                School.airtable_id.in_(first_linked_ids(data, "School-Name"))
             )
-            district_airtable_id = (
-                fields.get("School-District")[0]
-                if fields.get("School-District")
-                else None
-            )
-            district = (
-                SchoolDistrict.query.filter_by(airtable_id=district_airtable_id).first()
-                if district_airtable_id
-                else None
-            )
-            created_on = fields.get("Created")
-            updated_on = fields.get("Last Modified")
-            occurred_on_year = (
-                fields.get("Year")
-                if fields.get("Year") and fields.get("Year") != "null"
-                else None
-            )
-            occurred_on_month_start = (
-                fields.get("Month")
-                if fields.get("Month") and fields.get("Month") != "null"
-                else None
-            )
-            occurred_on_month_end = None
-            if occurred_on_month_start and "-" in occurred_on_month_start:
-                # If the month is in a format like "09-10", we need to set month_start and month_end
-                arr = occurred_on_month_start.split("-")
-                occurred_on_month_start = arr[0].strip()
-                occurred_on_month_end = arr[1].strip() if len(arr) > 1 else None
-            occurred_on_day_start = (
-                fields.get("Day")
-                if fields.get("Day") and fields.get("Day") != "null"
-                else None
+        },
+        "districts": {
+            district.airtable_id: district
+            for district in SchoolDistrict.query.filter(
+                SchoolDistrict.airtable_id.in_(
+                    first_linked_ids(data, "School-District")
+                )
             )
-            if occurred_on_day_start and occurred_on_day_start == "multiple dates":
-                occurred_on_day_start = None
+        },
+        "types": by_name(IncidentType),
+        "source_types": by_name(IncidentSourceType),
+        "attribution_types": by_name(AttributionType),
+        "statuses": by_name(IncidentStatus),
+        "privacies": by_name(IncidentPrivacyStatus),
+        "admin_user": User.query.filter_by(email="admin@stophateinschools.org").first(),
+    }
 
-            incident_type_name = (
-                fields.get("Incident-Type")[0] if fields.get("Incident-Type") else None
-            )
-            incident_type = IncidentType.query.filter_by(
-                name=incident_type_name
-            ).first()
-            source_type_name = (
-                fields.get("Source-Internal")[0]
-                if fields.get("Source-Internal")
-                else None
-            )
-            source_type = IncidentSourceType.query.filter_by(
-                name=source_type_name
-            ).first()
-            attribution_name = (
-                fields.get("Source-Attribution")[0]
-                if fields.get("Source-Attribution")
-                else None
-            )
-            attribution_type = AttributionType.query.filter_by(
-                name=attribution_name
-            ).first()
-            source_id = fields.get("Source-ID")
-            reported_to_school = (
-                True if fields.get("Reported-To-School") == "Yes" else None
+
+def create_or_sync_incidents(data, progress=None):
+    """
+    Get incident data from Airtable and create or sync records. Pass `progress` to
+    count several calls (e.g. pages of records) as one sync, see sync_airtable.
+    """
+    if progress is None:
+        progress = ImportProgress("incidents", total=len(data))
+        data = data[progress.resume_from :]
+    lookups = load_incident_lookups(data)
+    # Keep the lookups loaded across the commit of each chunk, so matching a
+    # record to them never queries
+    db.session().expire_on_commit = False
+    try:
+        for chunk in chunked(data, SYNC_CHUNK_SIZE):
+            created_count = 0
+            updated_count = 0
+            # Documents are only mirrored for new incidents
+            new_urls = mirror_files(
+                document
+                for incident in chunk
+                if incident["id"] not in lookups["incidents"]
+                for document in incident["fields"].get("Supporting-Materials") or []
             )
-            school_responded = fields.get("School-Responded") == "Yes"
-            city = fields.get("School-City")
-            state = fields.get("School-State")
-            publish_string = fields.get("Publish")
-            privacy_string = fields.get("Privacy")
-            publish_details = get_publish_details(publish_string, privacy_string)
-            status = Status.FILED if publish_string == "YES" else Status.ACTIVE
-
-            # For now, things that require new object creation lets keep to only new incidents
-            if existing_incident == None:
-                admin_user = User.query.filter_by(
-                    email="admin@stophateinschools.org"
-                ).first()
-                internal_notes = (
-                    [InternalNote(note=internal_note_0, author_id=admin_user.id)]
-                    if internal_note_0
-                    else []
+            for incident in chunk:
+                fields = incident["fields"]
+                nces_school_id = fields.get("NCES-School-ID")
+                if nces_school_id and "See" in nces_school_id[0]:
+                    # These are specific records in the National Incidents database
+                    # that Josh has already moved over to state specific tables so we
+                    # don't want to create them twice.
+                    continue
+
+                airtable_id = incident["id"]
+                existing_incident = lookups["incidents"].get(airtable_id)
+
+                airtable_id_number = fields.get("Incident-Number")
+                summary = fields.get("Incident-Summary")
+                details = fields.get("Incident-Details")
+                related_link_1 = fields.get("Related-Link-1")
+                related_link_2 = fields.get("Related-Link-2")
+                related_link_3 = fields.get("Related-Link-3")
+                internal_note_0 = fields.get("INTERNAL-Notes")
+                documents = fields.get("Supporting-Materials")
+                school_airtable_id = (
+                    fields.get("School-Name")[0] if fields.get("School-Name") else None
                 )
-                new_documents = []
-                for document in documents or []:
-                    airtable_url = document["url"]
-                    filename = document["filename"]
-                    new_url = simple_file_upload_from_url(airtable_url, filename)
-                    print("Incident doc ", airtable_url, filename, new_url)
-                    new_documents.append(IncidentDocument(url=new_url, name=filename))
-
-                new_incident = Incident(
-                    status=status,
-                    airtable_id=airtable_id,
-                    airtable_id_number=airtable_id_number,
-                    summary=summary,
-                    details=details,
-                    internal_notes=internal_notes,
-                    related_links=[
-                        RelatedLink(link=link)
-                        for link in [related_link_1, related_link_2, related_link_3]
-                        if link is not None
-                    ],
-                    documents=new_documents,
-                    schools=[school] if school else [],
-                    districts=[district] if district else [],
-                    created_on=created_on,
-                    owner_id=admin_user.id,
-                    updated_on=updated_on,
-                    occurred_on_year=occurred_on_year,
-                    occurred_on_month_start=occurred_on_month_start,
-                    occurred_on_month_end=occurred_on_month_end,
-                    occurred_on_day_start=occurred_on_day_start,
-                    publish_details=publish_details,
-                    types=[incident_type] if incident_type else [],
-                    source_types=([source_type] if source_type else []),
-                    attributions=(
-                        [
-                            IncidentAttribution(
-                                attribution_type=attribution_type,
-                                attribution_id=source_id,
-                            )
-                        ]
-                        if attribution_type
-                        else []
-                    ),
-                    reported_to_school=reported_to_school,
-                    school_responded=school_responded,
-                    city=city,
-                    state=state,
+                school = lookups["schools"].get(school_airtable_id)
+                district_airtable_id = (
+                    fields.get("School-District")[0]
+                    if fields.get("School-District")
+                    else None
                 )
-                db.session.add(new_incident)
-                created_count += 1
-            else:
-                existing_incident.status = status
-                existing_incident.summary = summary
-                existing_incident.details = details
-                existing_incident.schools = [school] if school else []
-                existing_incident.districts = [district] if district else []
-                existing_incident.occurred_on_year = occurred_on_year
-                existing_incident.occurred_on_month_start = occurred_on_month_start
-                existing_incident.occurred_on_month_end = occurred_on_month_end
-                existing_incident.occurred_on_day_start = occurred_on_day_start
-                existing_incident.city = city
-                existing_incident.state = state
-                updated_count += 1
+                district = lookups["districts"].get(district_airtable_id)
+                created_on = fields.get("Created")
+                # updated_on is required, so fall back to when the record was created
+                updated_on = fields.get("Last Modified") or created_on
+                occurred_on_year = (
+                    fields.get("Year")
+                    if fields.get("Year") and fields.get("Year") != "null"
+                    else None
+                )
+                occurred_on_month_start = (
+                    fields.get("Month")
+                    if fields.get("Month") and fields.get("Month") != "null"
+                    else None
+                )
+                occurred_on_month_end = None
+                if occurred_on_month_start and "-" in occurred_on_month_start:
+                    # If the month is in a format like "09-10", we need to set month_start and month_end
+                    arr = occurred_on_month_start.split("-")
+                    occurred_on_month_start = arr[0].strip()
+                    occurred_on_month_end = arr[1].strip() if len(arr) > 1 else None
+                occurred_on_day_start = (
+                    fields.get("Day")
+                    if fields.get("Day") and fields.get("Day") != "null"
+                    else None
+                )
+                if occurred_on_day_start and occurred_on_day_start == "multiple dates":
+                    occurred_on_day_start = None
+
+                incident_type_name = (
+                    fields.get("Incident-Type")[0]
+                    if fields.get("Incident-Type")
+                    else None
+                )
+                incident_type = lookups["types"].get(incident_type_name)
+                source_type_name = (
+                    fields.get("Source-Internal")[0]
+                    if fields.get("Source-Internal")
+                    else None
+                )
+                source_type = lookups["source_types"].get(source_type_name)
+                attribution_name = (
+                    fields.get("Source-Attribution")[0]
+                    if fields.get("Source-Attribution")
+                    else None
+                )
+                attribution_type = lookups["attribution_types"].get(attribution_name)
+                source_id = fields.get("Source-ID")
+                reported_to_school = (
+                    True if fields.get("Reported-To-School") == "Yes" else None
+                )
+                school_responded = fields.get("School-Responded") == "Yes"
+                city = fields.get("School-City")
+                state = fields.get("School-State")
+                publish_string = fields.get("Publish")
+                privacy_string = fields.get("Privacy")
+                publish_details = get_publish_details(
+                    publish_string, privacy_string, lookups
+                )
+                status = Status.FILED if publish_string == "YES" else Status.ACTIVE
+
+                # For now, things that require new object creation lets keep to only new incidents
+                if existing_incident == None:
+                    admin_user = lookups["admin_user"]
+                    internal_notes = (
+                        [InternalNote(note=internal_note_0, author_id=admin_user.id)]
+                        if internal_note_0
+                        else []
+                    )
+                    new_documents = [
+                        IncidentDocument(
+                            url=new_urls[document["url"]], name=document["filename"]
+                        )
+                        for document in documents or []
+                        if new_urls.get(document["url"])
+                    ]
+
+                    new_incident = Incident(
+                        status=status,
+                        airtable_id=airtable_id,
+                        airtable_id_number=airtable_id_number,
+                        summary=summary,
+                        details=details,
+                        internal_notes=internal_notes,
+                        related_links=[
+                            RelatedLink(link=link)
+                            for link in [related_link_1, related_link_2, related_link_3]
+                            if link is not None
+                        ],
+                        documents=new_documents,
+                        schools=[school] if school else [],
+                        districts=[district] if district else [],
+                        created_on=created_on,
+                        owner_id=admin_user.id,
+                        updated_on=updated_on,
+                        occurred_on_year=occurred_on_year,
+                        occurred_on_month_start=occurred_on_month_start,
+                        occurred_on_month_end=occurred_on_month_end,
+                        occurred_on_day_start=occurred_on_day_start,
+                        publish_details=publish_details,
+                        types=[incident_type] if incident_type else [],
+                        source_types=([source_type] if source_type else []),
+                        attributions=(
+                            [
+                                IncidentAttribution(
+                                    attribution_type=attribution_type,
+                                    attribution_id=source_id,
+                                )
+                            ]
+                            if attribution_type
+                            else []
+                        ),
+                        reported_to_school=reported_to_school,
+                        school_responded=school_responded,
+                        city=city,
+                        state=state,
+                    )
+                    db.session.add(new_incident)
+                    # A later record for the same incident updates this one
+                    lookups["incidents"][airtable_id] = new_incident
+                    created_count += 1
+                else:
+                    existing_incident.status = status
+                    existing_incident.summary = summary
+                    existing_incident.details = details
+                    existing_incident.schools = [school] if school else []
+                    existing_incident.districts = [district] if district else []
+                    existing_incident.occurred_on_year = occurred_on_year
+                    existing_incident.occurred_on_month_start = occurred_on_month_start
+                    existing_incident.occurred_on_month_end = occurred_on_month_end
+                    existing_incident.occurred_on_day_start = occurred_on_day_start
+                    existing_incident.city = city
+                    existing_incident.state = state
+                    updated_count += 1
+
+            progress.commit(
+                len(chunk),
+                inserted=created_count,
+                updated=updated_count,
+                skipped=len(chunk) - created_count - updated_count,
+            )
 
-        db.session.commit()
         return (
-            f"Complete: {created_count} created and {updated_count} updated incidents"
+            f"Complete: {progress.counts['inserted']} created and "
+            f"{progress.counts['updated']} updated incidents"
         )
     except Exception as e:
         db.session.rollback()
         error_msg = f"Sync failed: {str(e)}\n{traceback.format_exc()}"
         print(error_msg)
-        return error_msg
-
-
-async def fetch_pages(urls):
-    """Uses Puppeteer to load a webpage and return its content."""
-    return_urls = []
-
-    for url in urls:
-        try:
-            browser = await launch(args=["--no-sandbox"])
-            page = await browser.newPage()
-
-            await page.goto(url, {"waitUntil": "networkidle2", "timeout": 600000})
-            await page.waitForSelector(".excelclass")
-            await page.click(".excelclass")
-            popup = None
-            while not popup:
-                pages = await browser.pages()
-                if len(pages) > 1:
-                    popup = pages[-1]
-
-            # Extract the NCES file url from the popup
-            await popup.bringToFront()
-            await popup.waitForSelector('a[href*="excelcreator"]')
-            element = await popup.querySelector('a[href*="excelcreator"]')
-            file_url = await (await element.getProperty("href")).jsonValue()
-            file_content = (
-                urllib.request.urlopen(file_url).read().decode("utf-8", errors="ignore")
-            )
-            file_io = StringIO(file_content)
-            convert_file_to_data(file_io)
+        raise
+    finally:
+        db.session().expire_on_commit = True
 
-            await browser.close()
-            return_urls.append(file_url)
-        except Exception as e:
-            print("Error fetching nces page ", e)
-            return e
 
-    return return_urls
+def import_export(app, job, file_url, source):
+    """
+    Download an NCES export and import it as it arrives. Runs in a thread of its
+    own, with its own app context (and so database session).
+    """
+    with app.app_context(), requests.get(
+        file_url, stream=True, timeout=NCES_DOWNLOAD_TIMEOUT
+    ) as response:
+        response.raise_for_status()
+        response.raw.decode_content = True
+        html_file = TextIOWrapper(response.raw, encoding="utf-8", errors="ignore")
+        return convert_file_to_data(html_file, source=source, job=job)
+
+
+async def fetch_export_url(browser, url):
+    """Open an NCES search page and return the url of its export (shown in a popup)."""
+    page = await browser.newPage()
+    popup_target = asyncio.get_running_loop().create_future()
+
+    def on_target_created(target):
+        if target.opener is page.target and not popup_target.done():
+            popup_target.set_result(target)
+
+    browser.on("targetcreated", on_target_created)
+    popup = None
+    try:
+        await page.goto(url, {"waitUntil": "networkidle2", "timeout": 600000})
+        await page.waitForSelector(".excelclass")
+        await page.click(".excelclass")
+        popup = await (await asyncio.wait_for(popup_target, POPUP_TIMEOUT)).page()
+
+        # Extract the NCES file url from the popup
+        await popup.waitForSelector('a[href*="excelcreator"]')
+        element = await popup.querySelector('a[href*="excelcreator"]')
+        return await (await element.getProperty("href")).jsonValue()
+    finally:
+        browser.remove_listener("targetcreated", on_target_created)
+        if popup:
+            await popup.close()
+        await page.close()
+
+
+async def import_state(urls, fetch_export, import_file):
+    """
+    Find the exports behind one state's search page urls, all at once, and import
+    them. The first (its districts, see get_state_urls) is imported before the rest,
+    as schools are linked to the districts already imported. Returns the export urls
+    or, for those that failed, the errors.
+    """
+
+    async def fetch_and_import(url, after=None):
+        file_url = await fetch_export(url)
+        if after:
+            await after
+        # Imports are synchronous (database) work, so they run in threads while
+        # the browser carries on with the other pages
+        await asyncio.to_thread(import_file, file_url)
+        return file_url
+
+    districts = asyncio.ensure_future(fetch_and_import(urls[0]))
+    return await asyncio.gather(
+        districts,
+        *(fetch_and_import(url, after=districts) for url in urls[1:]),
+        return_exceptions=True,
+    )
+
+
+async def fetch_pages(urls_by_state):
+    """
+    Uses Puppeteer to find the NCES exports behind search page urls and imports
+    them, several at a time in one browser. `urls_by_state` maps state names to
+    their search page urls (see import_state); a plain list of urls is fetched as a
+    single state.
+    """
+    if not isinstance(urls_by_state, dict):
+        urls_by_state = {None: urls_by_state}
+    app = current_app._get_current_object()
+    job = get_current_job()
+    open_pages = asyncio.Semaphore(NCES_MAX_PAGES)
+
+    browser = await launch(args=["--no-sandbox"])
+
+    async def fetch_export(url):
+        async with open_pages:
+            return await fetch_export_url(browser, url)
+
+    try:
+        results = await asyncio.gather(
+            *(
+                import_state(
+                    urls,
+                    fetch_export,
+                    lambda file_url, state=state: import_export(
+                        app, job, file_url, state
+                    ),
+                )
+                for state, urls in urls_by_state.items()
+            )
+        )
+    finally:
+        await browser.close()
+
+    results = [result for state_results in results for result in state_results]
+    errors = [result for result in results if isinstance(result, Exception)]
+    for error in errors:
+        print("Error fetching nces page ", error)
+    if errors:
+        # Fail the job so it's retried; imports that completed are skipped over
+        raise errors[0]
+    return results
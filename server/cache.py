@@ -0,0 +1,47 @@
+import threading
+
+from cachetools import TTLCache
+from flask_caching import Cache
+
+# Shared by every worker through Redis (configured in create_app)
+cache = Cache()
+
+# A per process tier in front of Redis. Entries expire quickly so invalidations
+# made by other workers show up here within LOCAL_CACHE_TTL seconds.
+LOCAL_CACHE_TTL = 5
+# How long (seconds) entries live in Redis if nothing invalidates them
+CACHE_TIMEOUT = 60 * 60
+
+_local_cache = TTLCache(maxsize=256, ttl=LOCAL_CACHE_TTL)
+_local_lock = threading.Lock()
+_missing = object()
+
+
+def get_or_load(key, load, timeout=CACHE_TIMEOUT, local=True):
+    """
+    The cached value for `key`, calling `load()` to compute it on a miss. Pass
+    `local=False` for values whose invalidations must reach every worker at once,
+    which only caches them in Redis.
+    """
+    if local:
+        with _local_lock:
+            value = _local_cache.get(key, _missing)
+        if value is not _missing:
+            return value
+
+    value = cache.get(key)
+    if value is None:
+        value = load()
+        cache.set(key, value, timeout=timeout)
+    if local:
+        with _local_lock:
+            _local_cache[key] = value
+    return value
+
+
+def invalidate(*keys):
+    """Drop `keys` from Redis and from this worker's tier."""
+    cache.delete_many(*keys)
+    with _local_lock:
+        for key in keys:
+            _local_cache.pop(key, None)
@@ -1,5 +1,5 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import MetaData
+from sqlalchemy import DDL, MetaData, event
 
 convention = {
     "ix": "ix_%(column_0_label)s",
@@ -10,3 +10,8 @@ convention = {
 }
 
 db = SQLAlchemy(metadata=MetaData(naming_convention=convention))
+
+# Trigram indexes (see School and SchoolDistrict) need the pg_trgm extension
+event.listen(
+    db.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
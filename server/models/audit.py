@@ -1,14 +1,32 @@
 import datetime
+import os
+import uuid
 from flask import json, request
 from flask_login import current_user
 from markupsafe import Markup
-from sqlalchemy import DateTime, event
-from sqlalchemy.orm.attributes import get_history
+from redis import RedisError
+from rq import Queue
+from sqlalchemy import DateTime, event, insert, inspect
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import ColumnProperty
 
 from ..admin.index import BaseModelView, render_model_details_link
 
 from ..database import db
 from enum import Enum
+from worker import conn
+
+# Write audit logs from an RQ job after commit, rather than in the flush
+ASYNC_AUDIT_LOG = os.getenv("ASYNC_AUDIT_LOG") == "1"
+AUDIT_PENDING_KEY = "audit:pending"
+AUDIT_PROCESSING_KEY = "audit:processing"
+AUDIT_WRITER_LOCK = "audit:writer"
+# Seconds a writer holds its lock for, should its worker die
+AUDIT_WRITER_TIMEOUT = 5 * 60
+AUDIT_BATCH_SIZE = 500
+
+audit_queue = Queue("low", connection=conn)
 
 
 class AuditAction(Enum):
@@ -35,14 +53,39 @@ class AuditLog(db.Model):
     timestamp = db.Column(
         DateTime(timezone=True), nullable=False, default=datetime.datetime.now
     )
-    changes = db.Column(db.Text(), nullable=True)
+    # {column: {"old": ..., "new": ...}}
+    changes = db.Column(JSONB(), nullable=True)
+    # Set by the async writer so an entry written twice is only stored once
+    entry_id = db.Column(UUID(as_uuid=True), nullable=True)
+
+    user = db.relationship("User")
 
     # Create an index on model_name and record_id to speed up admin filters
-    __table_args__ = (db.Index("ix_audit_logs_record_id", "model_name", "record_id"),)
+    __table_args__ = (
+        db.Index("ix_audit_logs_record_id", "model_name", "record_id"),
+        # Keyset pagination of GET /api/audit
+        db.Index("ix_audit_logs_timestamp", "timestamp", "id"),
+        # Filtering by the fields changed (changes ? 'status')
+        db.Index("ix_audit_logs_changes", "changes", postgresql_using="gin"),
+        db.Index("ix_audit_logs_entry_id", "entry_id", unique=True),
+    )
 
     def __str__(self):
         return f"<AuditLog {self.model_name.value} {self.action} {self.record_id}>"
 
+    def jsonable(self):
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp.isoformat(),
+            "userId": self.user_id,
+            "userName": self.user.name if self.user else None,
+            "model": self.model_name.value,
+            "recordId": self.record_id,
+            "action": self.action.value,
+            "changes": self.changes or {},
+        }
+
+
 def serialize_for_json(value):
     if isinstance(value, list):
         return [serialize_for_json(v) for v in value]
@@ -50,8 +93,9 @@ def serialize_for_json(value):
         return value.name
     return value
 
-def create_audit_log(action, instance, changes=None):
-    """Helper function to create and add an audit log entry."""
+
+def audit_log_values(action, model_name, record_id, changes=None):
+    """Column values for an audit log entry, for creating it or bulk inserting it."""
     # Access current_user from g, set during the request context
     serializable_changes = {
         key: {
@@ -60,12 +104,29 @@ def create_audit_log(action, instance, changes=None):
         }
         for key, change in (changes or {}).items()
     }
+    return {
+        "model_name": model_name,
+        "action": action,
+        "record_id": record_id,
+        # No one is logged in outside requests (e.g. in jobs)
+        "user_id": (
+            current_user.id if current_user and current_user.is_authenticated else None
+        ),
+        # Values are stored as they'd be sent to clients (e.g. dates as strings)
+        "changes": (
+            json.loads(json.dumps(serializable_changes))
+            if serializable_changes
+            else None
+        ),
+    }
+
+
+def create_audit_log(action, instance, changes=None):
+    """Helper function to create and add an audit log entry."""
     audit_log = AuditLog(
-        model_name=AuditModel(instance.__class__.__name__),
-        action=action,
-        record_id=instance.id,
-        user_id=current_user.id if current_user.is_authenticated else None,
-        changes=json.dumps(serializable_changes) if serializable_changes else None,
+        **audit_log_values(
+            action, AuditModel(instance.__class__.__name__), instance.id, changes
+        )
     )
     db.session.add(audit_log)
 
@@ -75,39 +136,150 @@ def is_audit_model(instance):
     return instance.__class__.__name__ in [e.value for e in AuditModel]
 
 
-# The SQLAlchemy event listeners to track changes
-def log_audit(session, flush_context, instances):
-    for instance in session.dirty.union(session.new).union(session.deleted):
-        if not isinstance(instance, db.Model):
+def audit_changes(instance):
+    """
+    Old and new values of the audited columns changed on `instance`. Only the
+    attributes the session saw change are looked at, not every column.
+    """
+    state = inspect(instance)
+    changes = {}
+    for key in state.committed_state:
+        attr = state.mapper.attrs.get(key)
+        if not isinstance(attr, ColumnProperty):
             continue
-        if not is_audit_model(instance):
+        column = attr.columns[0]
+        # Derived columns (i.e. search vectors) opt out of auditing
+        if not column.info.get("audit", True):
             continue
+        history = state.attrs[key].history
+        original_value = (
+            serialize_for_json(history.deleted[0]) if history.deleted else None
+        )
+        current_value = serialize_for_json(history.added[0]) if history.added else None
+        if original_value != current_value:
+            changes[column.name] = {"old": original_value, "new": current_value}
+    return changes
 
-        if not hasattr(instance, "__table__"):
+
+# The SQLAlchemy event listeners to track changes
+def log_audit(session, flush_context):
+    """
+    Capture audit entries for the audited instances a flush deletes or changes.
+    They're inserted in one statement in the flush's transaction or, with
+    ASYNC_AUDIT_LOG, handed to write_pending_audit_logs once it commits.
+    """
+    entries = []
+    for instance in session.dirty.union(session.deleted):
+        if not is_audit_model(instance):
             continue
 
+        model_name = AuditModel(instance.__class__.__name__)
         if instance in session.deleted:
-            create_audit_log(AuditAction.DELETE, instance)
-        elif instance in session.dirty:
-            changes = {}
-            for column in instance.__table__.columns:
-                history = get_history(instance, column.name)
-                if not history.has_changes():
-                    continue
-
-                original_value = serialize_for_json(history.deleted[0]) if history.deleted else None
-                current_value = serialize_for_json(history.added[0]) if history.added else None
-                if original_value != current_value:
-                    changes[column.name] = {
-                        "old": original_value,
-                        "new": current_value,
-                    }
-
+            entries.append(
+                audit_log_values(AuditAction.DELETE, model_name, instance.id)
+            )
+        else:
+            changes = audit_changes(instance)
             if changes:
-                create_audit_log(AuditAction.UPDATE, instance, changes)
+                entries.append(
+                    audit_log_values(
+                        AuditAction.UPDATE, model_name, instance.id, changes
+                    )
+                )
+    if not entries:
+        return
+
+    if ASYNC_AUDIT_LOG:
+        now = datetime.datetime.now(datetime.timezone.utc)
+        session.info.setdefault("audit_entries", []).extend(
+            json.dumps(
+                {
+                    **entry,
+                    "model_name": entry["model_name"].value,
+                    "action": entry["action"].value,
+                    "timestamp": now.isoformat(),
+                    "entry_id": str(uuid.uuid4()),
+                }
+            )
+            for entry in entries
+        )
+    else:
+        session.connection().execute(insert(AuditLog), entries)
+
+
+def insert_audit_entries(connection, entries):
+    """
+    Insert queued audit entries (JSON, see log_audit). Entries already written,
+    e.g. by a writer that died before letting them go, are skipped.
+    """
+    connection.execute(
+        pg_insert(AuditLog).on_conflict_do_nothing(index_elements=["entry_id"]),
+        [
+            {
+                **entry,
+                "model_name": AuditModel(entry["model_name"]),
+                "action": AuditAction(entry["action"]),
+                "timestamp": datetime.datetime.fromisoformat(entry["timestamp"]),
+                "entry_id": uuid.UUID(entry["entry_id"]),
+            }
+            for entry in map(json.loads, entries)
+        ],
+    )
+
+
+def queue_audit_entries(session):
+    entries = session.info.pop("audit_entries", None)
+    if not entries:
+        return
+    try:
+        conn.rpush(AUDIT_PENDING_KEY, *entries)
+        audit_queue.enqueue(write_pending_audit_logs)
+    except RedisError:
+        # The changes are committed, so write their entries now rather than lose
+        # them. Any that did reach the queue are skipped when it's written.
+        with session.get_bind().begin() as connection:
+            insert_audit_entries(connection, entries)
+
+
+def discard_audit_entries(session, previous_transaction):
+    session.info.pop("audit_entries", None)
+
+
+def write_audit_batch():
+    """Insert the entries in the processing list, then let them go."""
+    entries = conn.lrange(AUDIT_PROCESSING_KEY, 0, -1)
+    if entries:
+        insert_audit_entries(db.session, entries)
+        db.session.commit()
+    conn.delete(AUDIT_PROCESSING_KEY)
+    return len(entries)
+
+
+def write_pending_audit_logs():
+    """
+    Insert queued audit entries (see ASYNC_AUDIT_LOG) a batch at a time. A batch is
+    moved to a processing list while it's written, so if a worker dies part way the
+    next run writes it again rather than losing it (see insert_audit_entries).
+    """
+    written = 0
+    # One writer at a time, so the processing list is only ever this job's
+    with conn.lock(AUDIT_WRITER_LOCK, timeout=AUDIT_WRITER_TIMEOUT):
+        # Finish a batch left behind by a crashed writer
+        written += write_audit_batch()
+        while True:
+            pipeline = conn.pipeline()
+            for _ in range(AUDIT_BATCH_SIZE):
+                pipeline.lmove(AUDIT_PENDING_KEY, AUDIT_PROCESSING_KEY)
+            if not any(pipeline.execute()):
+                break
+            written += write_audit_batch()
+    return f"Wrote {written} audit logs"
+
 
 # Listen for the update and delete events
-event.listen(db.session, "before_flush", log_audit)
+event.listen(db.session, "after_flush", log_audit)
+event.listen(db.session, "after_commit", queue_audit_entries)
+event.listen(db.session, "after_soft_rollback", discard_audit_entries)
 
 
 class AuditModelView(BaseModelView):
@@ -0,0 +1,153 @@
+import bisect
+import os
+import re
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload
+
+from worker import conn
+from .models import School, SchoolDistrict, State
+from ..database import db
+
+# Opt in to answering school and district typeahead from memory instead of Postgres
+AUTOCOMPLETE_ENABLED = os.getenv("IN_PROCESS_AUTOCOMPLETE") == "1"
+
+# Redis hash of "<model>:<state>" -> version, bumped whenever that partition changes
+VERSIONS_KEY = "autocomplete:versions"
+# How often (seconds) a worker checks whether its indexes are stale
+VERSION_CHECK_INTERVAL = 5
+
+
+def normalize(text):
+    """Lower case words separated by single spaces, punctuation dropped."""
+    return " ".join(re.findall(r"\w+", (text or "").casefold()))
+
+
+class PrefixIndex:
+    """
+    Sorted arrays of normalized names searched with bisect. Every name is indexed
+    from each of its words onward, so "lincoln hi" finds "Abraham Lincoln High".
+    """
+
+    def __init__(self, entries):
+        """`entries` is an iterable of (item, names) pairs."""
+        self.items = []
+        self.names = []
+        self.tokens = []
+        for item, names in entries:
+            item_id = len(self.items)
+            self.items.append(item)
+            for name in filter(None, names):
+                words = normalize(name).split()
+                for position in range(len(words)):
+                    key = (" ".join(words[position:]), item_id)
+                    (self.names if position == 0 else self.tokens).append(key)
+        self.names.sort()
+        self.tokens.sort()
+
+    def search(self, text, limit):
+        """Up to `limit` items with a name prefixed by `text`, whole name matches first."""
+        prefix = normalize(text)
+        if not prefix:
+            return []
+
+        seen = set()
+        results = []
+        for keys in (self.names, self.tokens):
+            index = bisect.bisect_left(keys, (prefix,))
+            while index < len(keys) and len(results) < limit:
+                key, item_id = keys[index]
+                if not key.startswith(prefix):
+                    break
+                if item_id not in seen:
+                    seen.add(item_id)
+                    results.append(self.items[item_id])
+                index += 1
+        return results
+
+
+def partition_key(model, state):
+    return f"{model.__name__}:{state.name}"
+
+
+def load_entries(model, state):
+    """(jsonable, names) pairs for every school or district in a state."""
+    query = model.query.filter(model.state == state)
+    if model is SchoolDistrict:
+        query = query.options(selectinload(SchoolDistrict.logo))
+    for record in query.all():
+        yield record.jsonable(), [record.name, record.display_name]
+
+
+class AutocompleteIndexes:
+    """Per worker PrefixIndexes for each model and state, built on first use."""
+
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _current_version(self, key):
+        return int(conn.hget(VERSIONS_KEY, key) or 0)
+
+    def get(self, model, state):
+        key = partition_key(model, state)
+        now = time.monotonic()
+        cached = self._indexes.get(key)
+        if cached and now - cached["checked_on"] < VERSION_CHECK_INTERVAL:
+            return cached["index"]
+
+        with self._lock:
+            version = self._current_version(key)
+            cached = self._indexes.get(key)
+            if not cached or cached["version"] != version:
+                cached = {"index": PrefixIndex(load_entries(model, state))}
+                self._indexes[key] = cached
+            cached["version"] = version
+            cached["checked_on"] = now
+            return cached["index"]
+
+    def search(self, model, state, text, limit):
+        return self.get(model, state).search(text, limit)
+
+
+autocomplete = AutocompleteIndexes()
+
+
+def invalidate_autocomplete(model, states):
+    """Mark the indexes for the given states stale in every worker."""
+    for state in set(states):
+        conn.hincrby(VERSIONS_KEY, partition_key(model, state), 1)
+
+
+def track_autocomplete_changes(session, flush_context):
+    """Remember which partitions a transaction touched so we invalidate them on commit."""
+    changed = session.info.setdefault("autocomplete_changes", set())
+    for instance in session.new.union(session.dirty).union(session.deleted):
+        if not isinstance(instance, (School, SchoolDistrict)) or not instance.state:
+            continue
+        # Linking incidents to a school doesn't change what we index
+        if instance in session.dirty and not session.is_modified(
+            instance, include_collections=False
+        ):
+            continue
+        state = instance.state
+        changed.add(
+            (type(instance), state if isinstance(state, State) else State[state])
+        )
+
+
+def invalidate_committed_changes(session):
+    changed = session.info.pop("autocomplete_changes", None)
+    for model, state in changed or []:
+        invalidate_autocomplete(model, [state])
+
+
+def discard_rolled_back_changes(session, previous_transaction):
+    session.info.pop("autocomplete_changes", None)
+
+
+event.listen(db.session, "after_flush", track_autocomplete_changes)
+event.listen(db.session, "after_commit", invalidate_committed_changes)
+event.listen(db.session, "after_soft_rollback", discard_rolled_back_changes)
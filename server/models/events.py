@@ -0,0 +1,58 @@
+from flask import json
+from sqlalchemy import event
+
+from worker import conn
+from .models import Incident, InternalNote
+from ..database import db
+
+# Redis stream of incident changes, read by the SSE endpoint (see routes/events.py).
+# A stream rather than pub/sub so reconnecting clients can resume where they left off.
+INCIDENT_EVENTS_KEY = "incidents:events"
+# Roughly how many events to keep for clients to resume from
+INCIDENT_EVENTS_KEPT = 1000
+
+
+def publish_incident_events(events):
+    """Add (event, JSON data) pairs to the incident events stream."""
+    pipeline = conn.pipeline()
+    for name, data in events:
+        pipeline.xadd(
+            INCIDENT_EVENTS_KEY,
+            {"event": name, "data": data},
+            maxlen=INCIDENT_EVENTS_KEPT,
+            approximate=True,
+        )
+    pipeline.execute()
+
+
+def track_incident_events(session, flush_context):
+    """Remember what a transaction changed so we publish it once it commits."""
+    events = session.info.setdefault("incident_events", [])
+    for instance in session.new:
+        if isinstance(instance, Incident):
+            events.append(("incident.created", json.dumps({"id": instance.id})))
+        elif isinstance(instance, InternalNote):
+            data = {"id": instance.id, "incidentId": instance.incident_id}
+            events.append(("note.created", json.dumps(data)))
+    for instance in session.dirty:
+        if isinstance(instance, Incident) and session.is_modified(instance):
+            events.append(("incident.updated", json.dumps({"id": instance.id})))
+    for instance in session.deleted:
+        if isinstance(instance, Incident):
+            events.append(("incident.deleted", json.dumps({"id": instance.id})))
+
+
+def publish_committed_events(session):
+    events = session.info.pop("incident_events", None)
+    if events:
+        # A transaction can flush the same change more than once
+        publish_incident_events(dict.fromkeys(events))
+
+
+def discard_rolled_back_events(session, previous_transaction):
+    session.info.pop("incident_events", None)
+
+
+event.listen(db.session, "after_flush", track_incident_events)
+event.listen(db.session, "after_commit", publish_committed_events)
+event.listen(db.session, "after_soft_rollback", discard_rolled_back_events)
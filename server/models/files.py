@@ -0,0 +1,160 @@
+import os
+
+import requests
+from rq import Queue, Retry
+from sqlalchemy import event, func, insert, select, union
+from sqlalchemy.orm import object_session
+
+from worker import conn
+from .models import File, PendingFileDelete
+from ..database import db
+
+API_URL = "https://app.simplefileupload.com/api/v1/file"
+
+# Simple File Upload urls of mirrored files by the SHA-256 of their content, and
+# the reverse, so mirroring can reuse uploads (see server.admin.mirror)
+MIRRORED_FILES_KEY = "files:mirrored"
+MIRRORED_URLS_KEY = "files:mirrored-urls"
+# Simple File Upload urls of mirrored files by the url they were mirrored from
+MIRRORED_SOURCES_KEY = "files:mirrored-sources"
+
+FILE_DELETE_BATCH_SIZE = 50
+# Seconds to wait for Simple File Upload to delete a file
+FILE_DELETE_TIMEOUT = 30
+FILE_DELETE_RETRY = Retry(
+    max=5, interval=[60, 5 * 60, 30 * 60, 2 * 60 * 60, 6 * 60 * 60]
+)
+
+file_delete_queue = Queue("low", connection=conn)
+
+
+def record_file_delete(mapper, connection, target):
+    """
+    Add a deleted row's file to the outbox in the same transaction, rather than
+    deleting it from Simple File Upload while the flush holds the transaction open.
+    """
+    if target.url == None:
+        return
+    connection.execute(
+        insert(PendingFileDelete).values(
+            url=target.url, created_on=func.now(), attempts=0
+        )
+    )
+    object_session(target).info["files_deleted"] = True
+
+
+def enqueue_file_deletes(session):
+    if session.info.pop("files_deleted", False):
+        file_delete_queue.enqueue(delete_pending_files, retry=FILE_DELETE_RETRY)
+
+
+def discard_file_deletes(session, previous_transaction):
+    session.info.pop("files_deleted", None)
+
+
+def urls_in_use(urls):
+    """Those of `urls` still used by a file row (mirrored files can be shared)."""
+    return set(
+        db.session.execute(
+            union(
+                *(
+                    select(model.url).where(model.url.in_(urls))
+                    for model in File.__subclasses__()
+                )
+            )
+        ).scalars()
+    )
+
+
+def simple_file_delete_from_url(url):
+    """
+    Let's delete a resource from simple file upload storage so we
+    don't overload. Returns whether it's gone.
+    """
+    try:
+        response = requests.delete(
+            API_URL,
+            params={"url": url},
+            auth=(
+                os.environ["SIMPLE_FILE_UPLOAD_API_TOKEN"],
+                os.environ["SIMPLE_FILE_UPLOAD_API_SECRET"],
+            ),
+            timeout=FILE_DELETE_TIMEOUT,
+        )
+    except requests.exceptions.RequestException as e:
+        print(f"Error when deleting Simple File Upload file {url}: {str(e)}")
+        return False
+
+    if response.status_code in (200, 404):
+        digest = conn.hget(MIRRORED_URLS_KEY, url)
+        if digest:
+            conn.hdel(MIRRORED_FILES_KEY, digest)
+            conn.hdel(MIRRORED_URLS_KEY, url)
+        return True
+
+    print(f"Error when deleting Simple File Upload file {url}: ", response.text)
+    return False
+
+
+def delete_pending_files():
+    """
+    Delete the files in the outbox from Simple File Upload, a batch at a time.
+    Files that fail stay in the outbox and fail the job, so RQ retries it.
+    """
+    deleted = 0
+    failed = 0
+    last_id = 0
+    while True:
+        # Skip rows another run of this job is working on
+        batch = (
+            db.session.execute(
+                select(PendingFileDelete)
+                .where(PendingFileDelete.id > last_id)
+                .order_by(PendingFileDelete.id)
+                .limit(FILE_DELETE_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+            )
+            .scalars()
+            .all()
+        )
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        in_use = urls_in_use({pending.url for pending in batch})
+        for pending in batch:
+            if pending.url in in_use or simple_file_delete_from_url(pending.url):
+                db.session.delete(pending)
+                deleted += 1
+            else:
+                pending.attempts += 1
+                failed += 1
+        db.session.commit()
+
+    if failed:
+        raise RuntimeError(f"{failed} Simple File Upload files couldn't be deleted")
+    return f"Deleted {deleted} files"
+
+
+def enqueue_pending_file_deletes():
+    """
+    Sweep the outbox: enqueue delete_pending_files if it has files in it, e.g. ones
+    left by a job that ran out of retries. Returns the job, if any.
+    """
+    if db.session.scalar(select(PendingFileDelete.id).limit(1)) is None:
+        return None
+    return file_delete_queue.enqueue(delete_pending_files, retry=FILE_DELETE_RETRY)
+
+
+event.listen(File, "after_delete", record_file_delete, propagate=True)
+event.listen(db.session, "after_commit", enqueue_file_deletes)
+event.listen(db.session, "after_soft_rollback", discard_file_deletes)
+
+
+if __name__ == "__main__":
+    # Periodic sweep of the outbox (e.g. hourly from Heroku Scheduler)
+    from server import create_app
+
+    with create_app().app_context():
+        job = enqueue_pending_file_deletes()
+        print(f"Enqueued {job.id}" if job else "No files to delete")
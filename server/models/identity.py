@@ -0,0 +1,148 @@
+import time
+
+from sqlalchemy import inspect, select, true
+from sqlalchemy.orm import aliased, joinedload, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from worker import conn
+from .user import Organization, Role, User, UserTermsAcceptance
+from ..cache import get_or_load, invalidate
+from ..database import db
+
+# Redis counter bumped whenever something many users share (a role or an
+# organization) changes
+USERS_VERSION_KEY = "users:version"
+# How long (seconds) a user's identity is cached if nothing invalidates it
+IDENTITY_TIMEOUT = 60
+
+# Everything an identity is built from
+IDENTITY_MODELS = (User, Role, Organization, UserTermsAcceptance)
+
+
+def users_version():
+    version = conn.get(USERS_VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 0 so a flushed Redis never reissues versions
+        conn.set(USERS_VERSION_KEY, time.time_ns(), nx=True)
+        version = conn.get(USERS_VERSION_KEY)
+    return int(version)
+
+
+def bump_users_version():
+    """Drop every cached identity, after changing a role or organization."""
+    users_version()
+    conn.incr(USERS_VERSION_KEY)
+
+
+def identity_key(user_id):
+    return f"identity:{users_version()}:{user_id}"
+
+
+def invalidate_identity(user_id):
+    """Drop one user's cached identity, after changing them or their terms."""
+    invalidate(identity_key(user_id))
+
+
+def invalidate_identities(instance):
+    """Drop the cached identities `instance` (an admin edit) is part of."""
+    if isinstance(instance, User):
+        invalidate_identity(instance.id)
+    elif isinstance(instance, UserTermsAcceptance):
+        invalidate_identity(instance.user_id)
+    elif isinstance(instance, IDENTITY_MODELS):
+        bump_users_version()
+
+
+def column_values(instance):
+    if instance is None:
+        return None
+    return {
+        column.key: getattr(instance, column.key)
+        for column in inspect(instance).mapper.column_attrs
+    }
+
+
+def select_identity(user_id):
+    """The user with their roles, organization and latest terms acceptance."""
+    latest_terms = (
+        select(UserTermsAcceptance)
+        .where(UserTermsAcceptance.user_id == User.id)
+        .order_by(UserTermsAcceptance.accepted_on.desc())
+        .limit(1)
+        .lateral()
+    )
+    return (
+        select(User, aliased(UserTermsAcceptance, latest_terms))
+        .outerjoin(latest_terms, true())
+        .options(joinedload(User.roles), joinedload(User.organization))
+        .where(User.id == user_id)
+    )
+
+
+def load_identity(user_id):
+    """
+    What requests need about a user, loaded in one query (see select_identity), as
+    plain values that can be cached.
+    """
+    row = db.session.execute(select_identity(user_id)).unique().first()
+    if row is None:
+        return None
+    user, terms = row
+    return {
+        "user": column_values(user),
+        "roles": [column_values(role) for role in user.roles],
+        "organization": column_values(user.organization),
+        "terms": column_values(terms),
+    }
+
+
+def detached(model, values):
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return instance
+
+
+def identity_user(identity):
+    """
+    A User in the current session built from a cached identity, without querying.
+    Only its latest terms acceptance is loaded, the rest load if they're accessed.
+    """
+    user = detached(User, identity["user"])
+    # Set relationships as if they'd been loaded, so nothing is flushed for them
+    set_committed_value(
+        user, "roles", [detached(Role, role) for role in identity["roles"]]
+    )
+    set_committed_value(
+        user,
+        "organization",
+        (
+            detached(Organization, identity["organization"])
+            if identity["organization"]
+            else None
+        ),
+    )
+    set_committed_value(
+        user,
+        "latest_terms_acceptance",
+        (
+            detached(UserTermsAcceptance, identity["terms"])
+            if identity["terms"]
+            else None
+        ),
+    )
+    return db.session.merge(user, load=False)
+
+
+def get_identity_user(user_id):
+    """
+    The user with `user_id`, or None, from a short lived cache of identities.
+    It's kept in Redis only, not per worker, so a user's changed or revoked roles
+    apply to their next request. Flask-Login keeps it for the rest of the request.
+    """
+    identity = get_or_load(
+        identity_key(user_id),
+        lambda: load_identity(user_id),
+        timeout=IDENTITY_TIMEOUT,
+        local=False,
+    )
+    return identity_user(identity) if identity else None
@@ -1,4 +1,5 @@
 from sqlalchemy import DateTime, String, cast, case
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.sql import func
 from ..database import db
 import datetime
@@ -295,7 +296,9 @@ class Incident(db.Model):
     owner_id = db.Column(db.Integer(), db.ForeignKey("users.id"))
     owner = db.relationship("User", back_populates="incidents")
     created_on = db.Column(DateTime(timezone=True), default=datetime.datetime.now)
-    updated_on = db.Column(DateTime(timezone=True), default=datetime.datetime.now)
+    updated_on = db.Column(
+        DateTime(timezone=True), default=datetime.datetime.now, nullable=False
+    )
     occurred_on_year = db.Column(db.Integer())
     occurred_on_month_start = db.Column(db.Integer())
     occurred_on_month_end = db.Column(db.Integer())
@@ -326,6 +329,21 @@ class Incident(db.Model):
     school_responses = db.relationship(
         "SchoolResponse", back_populates="incident", single_parent=True
     )
+    # Full text search document, kept current by server/models/search.py
+    search_vector = db.Column(TSVECTOR(), info={"audit": False})
+
+    # Indexes backing keyset pagination of the incident list (see routes/incident.py)
+    __table_args__ = (
+        db.Index(
+            "ix_incidents_occurred_on_sort",
+            func.coalesce(occurred_on_year, 0),
+            func.coalesce(occurred_on_month_start, 1),
+            func.coalesce(occurred_on_day_start, 1),
+            id,
+        ),
+        db.Index("ix_incidents_updated_on", updated_on, id),
+        db.Index("ix_incidents_search_vector", search_vector, postgresql_using="gin"),
+    )
 
     @hybrid_property
     def occurred_on(self):
@@ -364,58 +382,138 @@ class Incident(db.Model):
             ),
         )
 
-    def jsonable(self):
-        """Return a JSON serializable version of the incident."""
+    def jsonable(self, fields=None):
+        """
+        Return a JSON serializable version of the incident, limited to `fields`
+        (see INCIDENT_FIELDS and INCIDENT_FIELD_PROFILES) if given.
+        """
         return {
-            "id": self.id,
-            "summary": self.summary,
-            "details": self.details,
-            "status": self.status.value,
-            "date": {
-                "year": self.occurred_on_year,
-                "month": [
-                    self.occurred_on_month_start or "",
-                    self.occurred_on_month_end or "",
-                ],
-                "day": [
-                    self.occurred_on_day_start or "",
-                    self.occurred_on_day_end or "",
-                ],
-            },
-            "discussion": [note.jsonable() for note in self.internal_notes],
-            "documents": [document.jsonable() for document in self.documents],
-            "owner": self.owner.jsonable() if self.owner else None,
-            "links": [link.link for link in self.related_links],
-            "types": [type.name for type in self.types],
-            "city": self.city,
-            "state": self.state.name if self.state else None,
-            "schools": [school.jsonable() for school in self.schools],
-            "districts": [district.jsonable() for district in self.districts],
-            "unions": [union.name for union in self.unions],
-            "createdOn": self.created_on.isoformat() if self.created_on else None,
-            "updatedOn": self.updated_on.isoformat() if self.updated_on else None,
-            "publishDetails": (
-                self.publish_details.jsonable() if self.publish_details else None
-            ),
-            "sharingDetails": (
-                self.sharing_details.jsonable() if self.sharing_details else None
-            ),
-            "sourceTypes": [s.name for s in self.source_types],
-            "otherSource": self.other_source,
-            "attributions": [a.attribution_type.name for a in self.attributions],
-            "schoolReport": {
-                "status": self.reported_to_school if self.reported_to_school else None,
-                "reports": [report.jsonable() for report in self.school_reports],
-            },
-            "schoolResponse": {
-                "status": self.school_responded if self.school_responded else None,
-                "responses": [
-                    response.jsonable() for response in self.school_responses
-                ],
-            },
+            field: serialize(self)
+            for field, serialize in INCIDENT_FIELDS.items()
+            if fields is None or field in fields
         }
 
 
+# How to serialize each field of Incident.jsonable(). Fields are only computed
+# (and their relationships only loaded) when requested.
+INCIDENT_FIELDS = {
+    "id": lambda incident: incident.id,
+    "summary": lambda incident: incident.summary,
+    "details": lambda incident: incident.details,
+    "status": lambda incident: incident.status.value,
+    "date": lambda incident: {
+        "year": incident.occurred_on_year,
+        "month": [
+            incident.occurred_on_month_start or "",
+            incident.occurred_on_month_end or "",
+        ],
+        "day": [
+            incident.occurred_on_day_start or "",
+            incident.occurred_on_day_end or "",
+        ],
+    },
+    "discussion": lambda incident: [
+        note.jsonable() for note in incident.internal_notes
+    ],
+    "documents": lambda incident: [
+        document.jsonable() for document in incident.documents
+    ],
+    "owner": lambda incident: incident.owner.jsonable() if incident.owner else None,
+    "links": lambda incident: [link.link for link in incident.related_links],
+    "types": lambda incident: [type.name for type in incident.types],
+    "city": lambda incident: incident.city,
+    "state": lambda incident: incident.state.name if incident.state else None,
+    "schools": lambda incident: [school.jsonable() for school in incident.schools],
+    "districts": lambda incident: [
+        district.jsonable() for district in incident.districts
+    ],
+    "unions": lambda incident: [union.name for union in incident.unions],
+    "createdOn": lambda incident: (
+        incident.created_on.isoformat() if incident.created_on else None
+    ),
+    "updatedOn": lambda incident: (
+        incident.updated_on.isoformat() if incident.updated_on else None
+    ),
+    "publishDetails": lambda incident: (
+        incident.publish_details.jsonable() if incident.publish_details else None
+    ),
+    "sharingDetails": lambda incident: (
+        incident.sharing_details.jsonable() if incident.sharing_details else None
+    ),
+    "sourceTypes": lambda incident: [s.name for s in incident.source_types],
+    "otherSource": lambda incident: incident.other_source,
+    "attributions": lambda incident: [
+        a.attribution_type.name for a in incident.attributions
+    ],
+    "schoolReport": lambda incident: {
+        "status": incident.reported_to_school if incident.reported_to_school else None,
+        "reports": [report.jsonable() for report in incident.school_reports],
+    },
+    "schoolResponse": lambda incident: {
+        "status": incident.school_responded if incident.school_responded else None,
+        "responses": [response.jsonable() for response in incident.school_responses],
+    },
+}
+
+# Named sets of fields for the different ways incidents are viewed
+INCIDENT_FIELD_PROFILES = {
+    # Dashboard and incident tables
+    "list": [
+        "id",
+        "summary",
+        "status",
+        "date",
+        "owner",
+        "types",
+        "city",
+        "state",
+        "schools",
+        "districts",
+        "createdOn",
+        "updatedOn",
+    ],
+    # Everything, for viewing and editing a single incident
+    "detail": list(INCIDENT_FIELDS),
+    # Incident data without internal discussion, files or sharing settings
+    "export": [
+        field
+        for field in INCIDENT_FIELDS
+        if field not in ["discussion", "documents", "sharingDetails"]
+    ],
+}
+
+
+class DeletedIncident(db.Model):
+    """Tombstones for deleted incidents, so delta syncs can tell clients to drop them."""
+
+    __tablename__ = "deleted_incidents"
+
+    incident_id = db.Column(db.Integer(), primary_key=True)
+    deleted_on = db.Column(
+        DateTime(timezone=True),
+        default=datetime.datetime.now,
+        nullable=False,
+        index=True,
+    )
+
+
+class PendingFileDelete(db.Model):
+    """
+    Outbox of Simple File Upload files to delete. Rows are added in the transaction
+    that deletes the file's row and removed once the file is deleted after commit
+    (see server.models.files).
+    """
+
+    __tablename__ = "pending_file_deletes"
+
+    id = db.Column(db.Integer(), primary_key=True)
+    url = db.Column(db.String(), nullable=False)
+    created_on = db.Column(
+        DateTime(timezone=True), default=datetime.datetime.now, nullable=False
+    )
+    attempts = db.Column(db.Integer(), default=0, nullable=False)
+
+
 class IncidentStatus(db.Model):
     """Incident statuses"""
 
@@ -686,8 +784,23 @@ class SchoolDistrict(db.Model):
         "Union", secondary=union_to_school_districts, back_populates="districts"
     )
 
-    # Create an index on name to speed up searches
-    __table_args__ = (db.Index("ix_school_districts_name", "name"),)
+    # Create an index on name to speed up searches and trigram indexes to serve
+    # typeahead substring searches (see routes/district.py)
+    __table_args__ = (
+        db.Index("ix_school_districts_name", "name"),
+        db.Index(
+            "ix_school_districts_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        db.Index(
+            "ix_school_districts_display_name_trgm",
+            "display_name",
+            postgresql_using="gin",
+            postgresql_ops={"display_name": "gin_trgm_ops"},
+        ),
+    )
 
     def __str__(self):
         return f"{self.display_name if self.display_name else self.name}"
@@ -773,8 +886,23 @@ class School(db.Model):
         "Incident", secondary=incident_schools, back_populates="schools"
     )
 
-    # Create an index on name to speed up searches
-    __table_args__ = (db.Index("ix_schools_name", "name"),)
+    # Create an index on name to speed up searches and trigram indexes to serve
+    # typeahead substring searches (see routes/school.py)
+    __table_args__ = (
+        db.Index("ix_schools_name", "name"),
+        db.Index(
+            "ix_schools_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+        db.Index(
+            "ix_schools_display_name_trgm",
+            "display_name",
+            postgresql_using="gin",
+            postgresql_ops={"display_name": "gin_trgm_ops"},
+        ),
+    )
 
     def __str__(self):
         return self.name
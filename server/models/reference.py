@@ -0,0 +1,90 @@
+from sqlalchemy.orm import make_transient_to_detached
+
+from .models import (
+    AttributionType,
+    IncidentPrivacyStatus,
+    IncidentSharingStatus,
+    IncidentSourceType,
+    IncidentType,
+)
+from ..cache import get_or_load, invalidate
+from ..database import db
+
+# Small lookup tables that only change through the admin, so they're served from cache
+REFERENCE_MODELS = (
+    IncidentType,
+    IncidentSourceType,
+    AttributionType,
+    IncidentSharingStatus,
+    IncidentPrivacyStatus,
+)
+
+INCIDENT_METADATA_KEY = "incident_metadata"
+
+
+def reference_key(model):
+    return f"reference:{model.__tablename__}"
+
+
+def reference_ids(model):
+    """{name: id} for every row of a reference table, in id order."""
+    return get_or_load(
+        reference_key(model),
+        lambda: dict(db.session.query(model.name, model.id).order_by(model.id).all()),
+    )
+
+
+def reference_rows(model, names):
+    """
+    Rows of a reference table by name (unknown names are skipped), built from the
+    cached ids rather than queried. Other columns load if they're accessed.
+    """
+    ids = reference_ids(model)
+    missing = [name for name in names if name not in ids]
+    if missing:
+        # Rows added outside the admin (e.g. by a migration) aren't in the cache yet
+        added = dict(
+            db.session.query(model.name, model.id).filter(model.name.in_(missing)).all()
+        )
+        if added:
+            invalidate_reference(model)
+            ids = {**ids, **added}
+    rows = []
+    for name in names:
+        if name not in ids:
+            continue
+        row = model(id=ids[name], name=name)
+        make_transient_to_detached(row)
+        rows.append(db.session.merge(row, load=False))
+    return rows
+
+
+def reference_row(model, name):
+    rows = reference_rows(model, [name])
+    return rows[0] if rows else None
+
+
+def incident_metadata():
+    """The options incident forms choose from (see get_incident_metadata)."""
+
+    def load():
+        source_types = [
+            name
+            for name in reference_ids(IncidentSourceType)
+            if name not in ["Google Sheet", "Website"]
+        ]
+        source_types.sort(key=lambda x: (x == "Other", x))
+        return {
+            "types": list(reference_ids(IncidentType)),
+            "sourceTypes": source_types,
+            # TODO Only return orgs that have users associateds & remove other
+            "organizations": list(reference_ids(AttributionType)),
+        }
+
+    return get_or_load(INCIDENT_METADATA_KEY, load)
+
+
+def invalidate_reference(model):
+    """Drop anything cached from `model`'s table, if it's a reference table."""
+    if model in REFERENCE_MODELS:
+        invalidate(reference_key(model), INCIDENT_METADATA_KEY)
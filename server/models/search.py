@@ -0,0 +1,117 @@
+import re
+from sqlalchemy import event, func, inspect, literal_column, or_
+
+from .models import Incident, School, SchoolDistrict
+from ..database import db
+
+SEARCH_CONFIG = "english"
+
+# setweight() takes a "char", so weights are literals rather than (varchar) parameters
+WEIGHT_A = literal_column("'A'")
+WEIGHT_B = literal_column("'B'")
+WEIGHT_C = literal_column("'C'")
+
+DEFAULT_TYPEAHEAD_LIMIT = 20
+MAX_TYPEAHEAD_LIMIT = 100
+
+# Attributes that feed into an incident's search vector
+INCIDENT_SEARCH_ATTRIBUTES = ["summary", "details", "city", "schools", "districts"]
+NAME_SEARCH_ATTRIBUTES = ["name", "display_name"]
+
+
+def incident_search_vector(incident):
+    """
+    SQL expression for an incident's weighted search document. Summary ranks
+    highest, then where it happened (school names, district names and city), then details.
+    """
+    places = (
+        [school.display_name or school.name for school in incident.schools]
+        + [district.display_name or district.name for district in incident.districts]
+        + [incident.city]
+    )
+    return (
+        func.setweight(
+            func.to_tsvector(SEARCH_CONFIG, incident.summary or ""), WEIGHT_A
+        )
+        .op("||")(
+            func.setweight(
+                func.to_tsvector(SEARCH_CONFIG, " ".join(filter(None, places))),
+                WEIGHT_B,
+            )
+        )
+        .op("||")(
+            func.setweight(
+                func.to_tsvector(SEARCH_CONFIG, incident.details or ""), WEIGHT_C
+            )
+        )
+    )
+
+
+def to_prefix_tsquery(text):
+    """
+    Build a tsquery matching documents that contain every word in `text`, treating
+    each word as a prefix so results update as the user types. Returns None if
+    there is nothing to search for.
+    """
+    words = re.findall(r"\w+", text or "")
+    if not words:
+        return None
+    return func.to_tsquery(SEARCH_CONFIG, " & ".join(f"{word}:*" for word in words))
+
+
+def name_search_criteria(model, text):
+    """
+    Case insensitive substring match on a model's name or display name. Served by
+    the trigram indexes on those columns (once the text is at least 3 characters).
+    """
+    return or_(
+        model.name.icontains(text, autoescape=True),
+        model.display_name.icontains(text, autoescape=True),
+    )
+
+
+def name_search_order(model, text):
+    """Order typeahead results: prefix matches first, then by trigram similarity."""
+    return [
+        func.coalesce(
+            or_(
+                model.name.istartswith(text, autoescape=True),
+                model.display_name.istartswith(text, autoescape=True),
+            ),
+            False,
+        ).desc(),
+        func.greatest(
+            func.similarity(model.name, text),
+            func.similarity(model.display_name, text),
+        ).desc(),
+        model.name,
+    ]
+
+
+def has_changes(instance, attributes):
+    state = inspect(instance)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+def update_search_vectors(session, flush_context, instances):
+    """Keep Incident.search_vector current with the data it's built from."""
+    incidents = set()
+    for instance in session.new.union(session.dirty):
+        if isinstance(instance, Incident):
+            if instance in session.new or has_changes(
+                instance, INCIDENT_SEARCH_ATTRIBUTES
+            ):
+                incidents.add(instance)
+        elif isinstance(instance, (School, SchoolDistrict)):
+            # Renaming a school or district changes the incidents that reference it
+            if instance not in session.new and has_changes(
+                instance, NAME_SEARCH_ATTRIBUTES
+            ):
+                incidents.update(instance.incidents)
+
+    for incident in incidents:
+        if incident not in session.deleted:
+            incident.search_vector = incident_search_vector(incident)
+
+
+event.listen(db.session, "before_flush", update_search_vectors)
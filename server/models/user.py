@@ -2,8 +2,9 @@ import datetime
 from enum import Enum
 from flask_login import UserMixin
 from flask_dance.consumer.storage.sqla import OAuthConsumerMixin
-from sqlalchemy import ARRAY, DateTime
+from sqlalchemy import ARRAY, DateTime, and_, select
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import aliased
 
 from .models import State
 
@@ -60,15 +61,26 @@ class User(UserMixin, db.Model):
     incidents = db.relationship("Incident", back_populates="owner")
     notes = db.relationship("InternalNote", back_populates="author")
     terms_acceptances = db.relationship("UserTermsAcceptance", back_populates="user")
+    # Just the latest of terms_acceptances, so it can be loaded (or cached) alone
+    latest_terms_acceptance = db.relationship(
+        "UserTermsAcceptance",
+        primaryjoin=lambda: and_(
+            UserTermsAcceptance.user_id == User.id,
+            UserTermsAcceptance.id == latest_terms_acceptance_id(),
+        ),
+        viewonly=True,
+        uselist=False,
+    )
+
+    @property
+    def role_set(self):
+        """The user's roles (UserRole) as a set, for constant time checks."""
+        return frozenset(role.name for role in self.roles)
 
     @property
     def most_recent_terms_accepted(self):
         """Get the most recent terms acceptance for this user."""
-        if self.terms_acceptances:
-            return max(
-                self.terms_acceptances, key=lambda acceptance: acceptance.accepted_on
-            )
-        return None
+        return self.latest_terms_acceptance
 
     @hybrid_property
     def name(self):
@@ -134,6 +146,18 @@ class UserTermsAcceptance(db.Model):
         }
 
 
+def latest_terms_acceptance_id():
+    """The id of the latest terms acceptance by the user of the outer query's."""
+    latest = aliased(UserTermsAcceptance)
+    return (
+        select(latest.id)
+        .where(latest.user_id == UserTermsAcceptance.user_id)
+        .order_by(latest.accepted_on.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
 def create_user(user):
     existing_user = User.query.filter_by(email=user["email"]).first()
     if existing_user:
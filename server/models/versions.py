@@ -0,0 +1,191 @@
+import datetime
+import time
+
+from sqlalchemy import event, func, insert, inspect
+
+from worker import conn
+from .models import (
+    AttributionType,
+    DeletedIncident,
+    Incident,
+    IncidentAttribution,
+    IncidentDocument,
+    IncidentPublishDetail,
+    IncidentSharingDetail,
+    IncidentSourceType,
+    IncidentType,
+    InternalNote,
+    RelatedLink,
+    School,
+    SchoolDistrict,
+    SchoolDistrictLogo,
+    SchoolReport,
+    SchoolResponse,
+    Union,
+)
+from .user import Organization, Role, User
+from ..database import db
+
+# Redis counter bumped after every commit that changes what an incident serializes to
+INCIDENTS_VERSION_KEY = "incidents:version"
+
+# Everything that appears in Incident.jsonable()
+INCIDENT_MODELS = (
+    Incident,
+    InternalNote,
+    IncidentDocument,
+    RelatedLink,
+    SchoolReport,
+    SchoolResponse,
+    IncidentAttribution,
+    IncidentPublishDetail,
+    IncidentSharingDetail,
+    IncidentType,
+    IncidentSourceType,
+    AttributionType,
+    School,
+    SchoolDistrict,
+    SchoolDistrictLogo,
+    Union,
+    User,
+    Role,
+    Organization,
+)
+
+
+# What Incident.jsonable() shows of a user (an owner or note author). Logging in or
+# accepting terms touches users without changing any of these.
+USER_ATTRIBUTES = (
+    "first_name",
+    "last_name",
+    "email",
+    "profile_picture",
+    "regions",
+    "organization_id",
+    "organization",
+    "roles",
+)
+
+# Rows that are part of a single incident, and what Incident.jsonable() shows of them
+INCIDENT_CHILD_MODELS = (
+    InternalNote,
+    IncidentDocument,
+    RelatedLink,
+    SchoolReport,
+    SchoolResponse,
+    IncidentAttribution,
+    IncidentPublishDetail,
+    IncidentSharingDetail,
+)
+
+
+def _ensure_incidents_version():
+    # Start from the clock rather than 0 so a flushed Redis never reissues old versions
+    conn.set(INCIDENTS_VERSION_KEY, time.time_ns(), nx=True)
+
+
+def incidents_version():
+    """The current version of incident data, shared by every worker."""
+    version = conn.get(INCIDENTS_VERSION_KEY)
+    if version is None:
+        _ensure_incidents_version()
+        version = conn.get(INCIDENTS_VERSION_KEY)
+    return int(version)
+
+
+def bump_incidents_version():
+    """
+    Mark every incident response stale. Call this after changing incident data
+    outside the ORM session (e.g. Core bulk statements), which the listeners below
+    don't see.
+    """
+    _ensure_incidents_version()
+    conn.incr(INCIDENTS_VERSION_KEY)
+
+
+def record_deleted_incident(mapper, connection, target):
+    """Leave a tombstone so delta syncs (see get_incident_changes) drop the incident."""
+    connection.execute(
+        insert(DeletedIncident).values(incident_id=target.id, deleted_on=func.now())
+    )
+
+
+def has_column_changes(instance):
+    state = inspect(instance)
+    return any(
+        state.attrs[column.key].history.has_changes()
+        for column in state.mapper.column_attrs
+    )
+
+
+def parent_incident(session, child):
+    # New rows are often added by incident_id alone, which doesn't load `incident`
+    if child.incident is None and child.incident_id:
+        return session.get(Incident, child.incident_id)
+    return child.incident
+
+
+def touch_changed_incidents(session, flush_context, instances):
+    """
+    Set updated_on of every incident whose serialized form is about to change, so
+    delta syncs (see get_incident_changes) pick it up: the incident itself, its notes
+    and other child rows, and the schools and districts it shows the names of.
+    Incidents given an updated_on explicitly (e.g. from Airtable) keep it.
+    """
+    incidents = set()
+    for instance in session.dirty:
+        if isinstance(instance, Incident) and session.is_modified(instance):
+            incidents.add(instance)
+        elif isinstance(instance, (School, SchoolDistrict)):
+            # Only columns: adding an incident to a school changes just that incident
+            if has_column_changes(instance):
+                incidents.update(instance.incidents)
+    for instance in session.new.union(session.dirty).union(session.deleted):
+        if isinstance(instance, INCIDENT_CHILD_MODELS):
+            incidents.add(parent_incident(session, instance))
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for incident in incidents:
+        if (
+            incident is not None
+            and incident not in session.new
+            and incident not in session.deleted
+            and not inspect(incident).attrs.updated_on.history.has_changes()
+        ):
+            incident.updated_on = now
+
+
+def changes_incidents(session, instance):
+    if isinstance(instance, User):
+        # New users aren't on any incident yet
+        if instance in session.new:
+            return False
+        if instance in session.dirty:
+            state = inspect(instance)
+            return any(
+                state.attrs[key].history.has_changes() for key in USER_ATTRIBUTES
+            )
+    return isinstance(instance, INCIDENT_MODELS)
+
+
+def track_incident_changes(session, flush_context):
+    for instance in session.new.union(session.dirty).union(session.deleted):
+        if changes_incidents(session, instance):
+            session.info["incidents_changed"] = True
+            return
+
+
+def bump_committed_changes(session):
+    if session.info.pop("incidents_changed", False):
+        bump_incidents_version()
+
+
+def discard_rolled_back_changes(session, previous_transaction):
+    session.info.pop("incidents_changed", None)
+
+
+event.listen(Incident, "after_delete", record_deleted_incident)
+event.listen(db.session, "before_flush", touch_changed_incidents)
+event.listen(db.session, "after_flush", track_incident_changes)
+event.listen(db.session, "after_commit", bump_committed_changes)
+event.listen(db.session, "after_soft_rollback", discard_rolled_back_changes)
@@ -0,0 +1,111 @@
+from dateutil.parser import parse
+from flask import Blueprint, jsonify, request
+from flask_login import login_required
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.orm import joinedload
+
+from server.models.audit import AuditAction, AuditLog, AuditModel
+from server.models.user import UserRole
+from .auth import has_role
+from .pagination import PaginationError, get_page_limit, keyset_paginate
+
+audit = Blueprint("audit", __name__, url_prefix="/audit")
+
+# Newest first by default, served by ix_audit_logs_timestamp
+AUDIT_SORT_KEYS = [(AuditLog.timestamp, parse), (AuditLog.id, int)]
+
+
+class AuditFilterError(ValueError):
+    """Raised when audit log query parameters can't be used."""
+
+
+def get_enum(enum, value, name):
+    try:
+        return enum(value)
+    except ValueError:
+        raise AuditFilterError(f"Invalid {name}: {value}")
+
+
+def get_int(args, name):
+    try:
+        return int(args[name])
+    except ValueError:
+        raise AuditFilterError(f"{name} must be an integer")
+
+
+def get_audit_filters(args):
+    """
+    Compile the audit log filters in the query string into SQL criteria:
+    - model / recordId: the record changed (e.g. model=Incident&recordId=12)
+    - userId: who made the change
+    - from / to: inclusive range on when the change was made
+    - field: a field changed (repeatable), matching any of them
+    - action: insert, update or delete
+    """
+    criteria = []
+    if args.get("model"):
+        criteria.append(
+            AuditLog.model_name == get_enum(AuditModel, args["model"], "model")
+        )
+    if args.get("recordId"):
+        criteria.append(AuditLog.record_id == get_int(args, "recordId"))
+    if args.get("userId"):
+        criteria.append(AuditLog.user_id == get_int(args, "userId"))
+    if args.get("action"):
+        criteria.append(
+            AuditLog.action == get_enum(AuditAction, args["action"], "action")
+        )
+
+    try:
+        time_from = parse(args["from"]) if args.get("from") else None
+        time_to = parse(args["to"]) if args.get("to") else None
+    except (ValueError, OverflowError):
+        raise AuditFilterError("Invalid time range")
+    if time_from:
+        criteria.append(AuditLog.timestamp >= time_from)
+    if time_to:
+        criteria.append(AuditLog.timestamp <= time_to)
+
+    # Served by the GIN index on changes (changes ?| array[...])
+    fields = args.getlist("field")
+    if fields:
+        criteria.append(AuditLog.changes.has_any(array(fields)))
+    return criteria
+
+
+@audit.route("", methods=["GET"])
+@login_required
+def get_audit_logs():
+    """
+    Get a page of audit logs matching the filters in get_audit_filters, newest
+    first (or oldest first with `direction=asc`). Pages hold up to `limit` entries
+    and the `nextCursor` of one page is passed as `cursor` to get the next.
+    """
+    if not has_role([UserRole.ADMIN]):
+        return jsonify({"error": "Unauthorized to view audit logs"}), 403
+
+    direction = request.args.get("direction", "desc")
+    if direction not in ["asc", "desc"]:
+        return jsonify({"error": "Invalid sort"}), 400
+    try:
+        audit_logs, next_cursor = keyset_paginate(
+            AuditLog.query.options(joinedload(AuditLog.user)).filter(
+                *get_audit_filters(request.args)
+            ),
+            AUDIT_SORT_KEYS,
+            cursor=request.args.get("cursor"),
+            limit=get_page_limit(request.args),
+            descending=direction == "desc",
+        )
+    except (AuditFilterError, PaginationError) as e:
+        return jsonify({"error": str(e)}), 400
+
+    return (
+        jsonify(
+            {
+                "auditLogs": [audit_log.jsonable() for audit_log in audit_logs],
+                "nextCursor": next_cursor,
+            }
+        ),
+        200,
+    )
@@ -10,6 +10,7 @@ from flask import (
 from functools import wraps
 from flask_login import current_user, login_required, login_user, logout_user
 
+from ..models.identity import invalidate_identity
 from ..models.user import OAuth, User, UserTermsAcceptance
 from ..database import db
 from google.oauth2 import id_token
@@ -22,16 +23,13 @@ def has_role(roles_required):
     """Determines if the current_user has a role in a given list of roles"""
     if current_user:
         # If current user has no roles, don't allow access.
-        if not current_user.roles:
+        if not current_user.role_set:
             return False
         # If no specific role required, allow access.
         if not roles_required:
             return True
 
-        current_roles = [role.name for role in current_user.roles]
-        for role in roles_required:
-            if role in current_roles:
-                return True
+        return any(role in current_user.role_set for role in roles_required)
     return False
 
 
@@ -93,6 +91,7 @@ def accept_terms_of_service():
 
     db.session.add(accepted_terms)
     db.session.commit()
+    invalidate_identity(current_user.id)
 
     return jsonify({"message": "Terms of service accepted"}), 200
 
@@ -133,6 +132,7 @@ def login():
             user.profile_picture = user_info.get("picture", "")
 
         login_user(user)
+        invalidate_identity(user.id)
         # If the user exists, log them in
         return {
             "user": user.jsonable(),
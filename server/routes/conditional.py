@@ -0,0 +1,41 @@
+import hashlib
+from functools import wraps
+
+from flask import make_response, request
+from flask_login import current_user
+
+from server.models.versions import incidents_version
+
+
+def incidents_etag():
+    """
+    Strong ETag for the current request, valid until incident data next changes.
+    Responses can depend on the user (e.g. `region=my-regions`), so they're part of it.
+    """
+    key = f"{incidents_version()}:{current_user.get_id()}:{request.full_path}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def conditional_on_incidents(view):
+    """
+    Tag successful responses with incidents_etag() and answer a matching
+    If-None-Match with 304 without running the view at all.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Read the version before the view queries anything: a change committed in
+        # between then yields newer data under an older tag, never the reverse
+        etag = incidents_etag()
+        if request.if_none_match.contains(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        # Let browsers keep the response but revalidate it on every use
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+
+    return wrapper
@@ -1,6 +1,14 @@
 from flask import Blueprint, jsonify, request
 from flask_login import login_required
-from server.models.models import SchoolDistrict
+from server.models.autocomplete import AUTOCOMPLETE_ENABLED, autocomplete
+from server.models.models import SchoolDistrict, State
+from server.models.search import (
+    DEFAULT_TYPEAHEAD_LIMIT,
+    MAX_TYPEAHEAD_LIMIT,
+    name_search_criteria,
+    name_search_order,
+)
+from .pagination import PaginationError, get_page_limit
 
 
 district = Blueprint("districts", __name__, url_prefix="/districts")
@@ -9,10 +17,37 @@ district = Blueprint("districts", __name__, url_prefix="/districts")
 @district.route("/", methods=["GET"])
 @login_required
 def get_all_districts_by_state():
-    """Get all districts."""
+    """
+    Get all districts in a state, or when `q` is given, up to `limit` districts whose
+    name contains it, best matches first. With IN_PROCESS_AUTOCOMPLETE on, names
+    are matched by prefix (of the whole name or any word in it) from memory.
+    """
     state = request.args.get("state")
     if not state:
         return []
 
-    districts = SchoolDistrict.query.filter(SchoolDistrict.state == state).all()
+    query = SchoolDistrict.query.filter(SchoolDistrict.state == state)
+    search = request.args.get("q", "").strip()
+    if search:
+        try:
+            limit = get_page_limit(
+                request.args, DEFAULT_TYPEAHEAD_LIMIT, MAX_TYPEAHEAD_LIMIT
+            )
+        except PaginationError as e:
+            return jsonify({"error": str(e)}), 400
+        if AUTOCOMPLETE_ENABLED and state in State.__members__:
+            # Answer from this worker's in memory prefix index
+            return (
+                jsonify(
+                    autocomplete.search(SchoolDistrict, State[state], search, limit)
+                ),
+                200,
+            )
+        query = (
+            query.filter(name_search_criteria(SchoolDistrict, search))
+            .order_by(*name_search_order(SchoolDistrict, search))
+            .limit(limit)
+        )
+
+    districts = query.all()
     return jsonify([district.jsonable() for district in districts]), 200
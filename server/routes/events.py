@@ -0,0 +1,67 @@
+import os
+import re
+import threading
+import time
+
+from server.models.events import INCIDENT_EVENTS_KEY
+from worker import conn
+
+# How long to wait for events before sending a comment to keep the connection open
+HEARTBEAT_INTERVAL = 15
+# Streams end after this long (holding a worker thread) and the browser reconnects
+STREAM_DURATION = 5 * 60
+# How long (milliseconds) browsers wait before reconnecting
+RECONNECT_DELAY = 3000
+
+# Each open stream holds one of a worker's GUNICORN_THREADS (see build_and_run.sh),
+# so streams may use all but API_THREADS of them, leaving those for API requests
+WORKER_THREADS = int(os.getenv("GUNICORN_THREADS", 32))
+API_THREADS = int(os.getenv("API_THREADS", 8))
+MAX_STREAMS = int(os.getenv("MAX_EVENT_STREAMS", max(WORKER_THREADS - API_THREADS, 1)))
+# How long (milliseconds) browsers turned away by a full worker wait to reconnect
+BUSY_RECONNECT_DELAY = 30 * 1000
+
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+EVENT_ID = re.compile(r"\d+-\d+")
+
+
+def latest_event_id():
+    events = conn.xrevrange(INCIDENT_EVENTS_KEY, count=1)
+    return events[0][0].decode() if events else "0-0"
+
+
+def incident_event_stream(last_event_id=None):
+    """
+    Yield server-sent events for incident changes after `last_event_id` (the
+    Last-Event-ID a reconnecting browser sends), or from now on. Once MAX_STREAMS
+    are open in this worker, further streams only tell the browser to retry later.
+    """
+    if not last_event_id or not EVENT_ID.fullmatch(last_event_id):
+        last_event_id = latest_event_id()
+
+    if not stream_slots.acquire(blocking=False):
+        # End right away, but with an id so the browser resumes from here later
+        yield f"retry: {BUSY_RECONNECT_DELAY}\nid: {last_event_id}\n\n"
+        return
+
+    try:
+        yield f"retry: {RECONNECT_DELAY}\n\n"
+        ends_on = time.monotonic() + STREAM_DURATION
+        while time.monotonic() < ends_on:
+            response = conn.xread(
+                {INCIDENT_EVENTS_KEY: last_event_id}, block=HEARTBEAT_INTERVAL * 1000
+            )
+            if not response:
+                yield ": heartbeat\n\n"
+                continue
+            for event_id, fields in response[0][1]:
+                last_event_id = event_id.decode()
+                yield (
+                    f"id: {last_event_id}\n"
+                    f"event: {fields[b'event'].decode()}\n"
+                    f"data: {fields[b'data'].decode()}\n\n"
+                )
+    finally:
+        # Also run when the browser disconnects and the server closes the stream
+        stream_slots.release()
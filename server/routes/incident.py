@@ -1,9 +1,14 @@
 import datetime
-from flask import Blueprint, jsonify, request
+import json
+from flask import Blueprint, Response, jsonify, request
 from flask_login import current_user, login_required
 from server.models.models import (
+    INCIDENT_FIELD_PROFILES,
+    INCIDENT_FIELDS,
     AttributionType,
+    DeletedIncident,
     Incident,
+    IncidentAttribution,
     IncidentDocument,
     IncidentPrivacyStatus,
     IncidentPublishDetail,
@@ -17,17 +22,268 @@ from server.models.models import (
     SchoolDistrict,
     SchoolReport,
     SchoolResponse,
+    State,
     Status,
 )
+from server.models.reference import incident_metadata, reference_row, reference_rows
+from server.models.search import to_prefix_tsquery
+from server.models.user import User
 from ..database import db
 from dateutil.parser import parse
 from rq import Queue
 from worker import conn
+from sqlalchemy import Float, cast, false, func, literal_column, or_, select
 from sqlalchemy.orm import selectinload, joinedload
+from .conditional import conditional_on_incidents
+from .events import incident_event_stream
+from .incident_bulk import (
+    BulkUpdateError,
+    apply_bulk_update,
+    parse_bulk_update,
+    publish_bulk_update,
+)
+from .incident_list import select_incident_list
+from .pagination import PaginationError, get_page_limit, keyset_paginate
 
 incident = Blueprint("incidents", __name__, url_prefix="/incidents")
 q = Queue(connection=conn)
 
+# Keyset pagination sort keys. The occurred on key mirrors the defaults of the
+# Incident.occurred_on expression (missing month/day sort as 1, missing year sorts
+# last) using plain columns so it can be served by ix_incidents_occurred_on_sort.
+# Defaults are literals (not bound parameters) so they match the index expressions.
+INCIDENT_SORT_KEYS = {
+    "occurredOn": [
+        (func.coalesce(Incident.occurred_on_year, literal_column("0")), int),
+        (func.coalesce(Incident.occurred_on_month_start, literal_column("1")), int),
+        (func.coalesce(Incident.occurred_on_day_start, literal_column("1")), int),
+        (Incident.id, int),
+    ],
+    "updatedOn": [
+        (Incident.updated_on, parse),
+        (Incident.id, int),
+    ],
+}
+
+# updated_on is set before the change commits, so a change can become visible after
+# a sync that started later than its updated_on. Delta syncs look back this much
+# further than asked to catch those; clients merge by id, so repeats are harmless.
+SYNC_OVERLAP = datetime.timedelta(minutes=1)
+
+
+class IncidentFilterError(ValueError):
+    """Raised when incident list query parameters (filters, fields) can't be used."""
+
+
+def get_incident_filters(args):
+    """
+    Compile the incident list filters in the query string into SQL criteria.
+    These mirror the filters on the AllIncidents page:
+    - q: full text search on summary, details, city, school and district names
+    - search: case insensitive match on summary, details, city, school or district names
+    - region: "my-regions" to limit to the current user's regions
+    - dateFrom / dateTo: inclusive range on when the incident occurred
+    - myOrganization: "true" to limit to incidents owned by the current user's organization
+    - types: incident type names (repeatable), matching any of them
+    - states: state abbreviations (repeatable), matching any of them
+    """
+    criteria = []
+
+    tsquery = to_prefix_tsquery(args.get("q"))
+    if tsquery is not None:
+        criteria.append(Incident.search_vector.op("@@")(tsquery))
+
+    search = args.get("search", "").strip()
+    if search:
+        criteria.append(
+            or_(
+                Incident.summary.icontains(search, autoescape=True),
+                Incident.details.icontains(search, autoescape=True),
+                Incident.city.icontains(search, autoescape=True),
+                Incident.schools.any(
+                    or_(
+                        School.name.icontains(search, autoescape=True),
+                        School.display_name.icontains(search, autoescape=True),
+                    )
+                ),
+                Incident.districts.any(
+                    or_(
+                        SchoolDistrict.name.icontains(search, autoescape=True),
+                        SchoolDistrict.display_name.icontains(search, autoescape=True),
+                    )
+                ),
+            )
+        )
+
+    if args.get("region") == "my-regions":
+        regions = current_user.regions or []
+        criteria.append(Incident.state.in_(regions) if regions else false())
+
+    try:
+        date_from = parse(args["dateFrom"]).date() if args.get("dateFrom") else None
+        date_to = parse(args["dateTo"]).date() if args.get("dateTo") else None
+    except (ValueError, OverflowError):
+        raise IncidentFilterError("Invalid date range")
+    if date_from:
+        criteria.append(Incident.occurred_on >= date_from)
+    if date_to:
+        criteria.append(Incident.occurred_on <= date_to)
+
+    if args.get("myOrganization") == "true":
+        criteria.append(
+            Incident.owner.has(User.organization_id == current_user.organization_id)
+            if current_user.organization_id
+            else false()
+        )
+
+    types = args.getlist("types")
+    if types:
+        criteria.append(Incident.types.any(IncidentType.name.in_(types)))
+
+    states = args.getlist("states")
+    if states:
+        try:
+            criteria.append(Incident.state.in_([State[state] for state in states]))
+        except KeyError as e:
+            raise IncidentFilterError(f"Invalid state: {e.args[0]}")
+
+    return criteria
+
+
+def get_incident_fields(args):
+    """
+    Fields to serialize from the `fields` query parameter: either a profile name
+    (`list`, `detail` or `export`) or comma separated field names. Defaults to all.
+    """
+    value = args.get("fields")
+    if not value:
+        return None
+    if value in INCIDENT_FIELD_PROFILES:
+        return INCIDENT_FIELD_PROFILES[value]
+
+    fields = [field.strip() for field in value.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in INCIDENT_FIELDS]
+    if unknown:
+        raise IncidentFilterError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def incident_load_options(fields=None):
+    """Eager load just the relationships needed to serialize `fields` (default all)."""
+
+    def owner(load):
+        # User.jsonable() includes roles and organization
+        return load.options(selectinload(User.roles), joinedload(User.organization))
+
+    loaders = {
+        "discussion": lambda: selectinload(Incident.internal_notes).options(
+            owner(joinedload(InternalNote.author))
+        ),
+        "documents": lambda: selectinload(Incident.documents),
+        "owner": lambda: owner(joinedload(Incident.owner)),
+        "links": lambda: selectinload(Incident.related_links),
+        "types": lambda: selectinload(Incident.types),
+        "schools": lambda: selectinload(Incident.schools),
+        "districts": lambda: selectinload(Incident.districts).options(
+            joinedload(SchoolDistrict.logo)
+        ),
+        "unions": lambda: selectinload(Incident.unions),
+        "publishDetails": lambda: joinedload(Incident.publish_details).options(
+            joinedload(IncidentPublishDetail.status),
+            joinedload(IncidentPublishDetail.privacy),
+        ),
+        "sharingDetails": lambda: joinedload(Incident.sharing_details).options(
+            joinedload(IncidentSharingDetail.sharing),
+            selectinload(IncidentSharingDetail.organizations),
+        ),
+        "sourceTypes": lambda: selectinload(Incident.source_types),
+        "attributions": lambda: selectinload(Incident.attributions).options(
+            joinedload(IncidentAttribution.attribution_type)
+        ),
+        "schoolReport": lambda: selectinload(Incident.school_reports),
+        "schoolResponse": lambda: selectinload(Incident.school_responses),
+    }
+    return [
+        load() for field, load in loaders.items() if fields is None or field in fields
+    ]
+
+
+def get_incident_sort_keys(args):
+    """
+    Sort keys for the requested `sort`. Full text searches sort by relevance
+    unless another sort is requested.
+    """
+    tsquery = to_prefix_tsquery(args.get("q"))
+    sort = args.get("sort", "relevance" if tsquery is not None else "occurredOn")
+    if sort == "relevance" and tsquery is not None:
+        # ts_rank is a real, which doesn't compare equal to the double a cursor
+        # round trips through JSON, so rank as a double to page through ties exactly
+        return [
+            (cast(func.ts_rank(Incident.search_vector, tsquery), Float(53)), float),
+            (Incident.id, int),
+        ]
+    return INCIDENT_SORT_KEYS.get(sort)
+
+
+def is_paginated(args):
+    """Whether to return a page rather than the full list, as older clients expect."""
+    return "cursor" in args or "limit" in args
+
+
+def get_updated_since(args):
+    """The `updatedSince` timestamp of a delta sync, widened by SYNC_OVERLAP."""
+    try:
+        since = parse(args["updatedSince"])
+    except (ValueError, OverflowError):
+        raise IncidentFilterError("Invalid updatedSince")
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return since - SYNC_OVERLAP
+
+
+def get_incident_changes(args, fields, fast_list):
+    """
+    Incidents created or updated since `updatedSince`, and the ids of those deleted
+    since then. Pass the returned `syncedOn` as `updatedSince` next time.
+    """
+    since = get_updated_since(args)
+    # Taken first so nothing committed while we query falls between two syncs
+    synced_on = db.session.scalar(select(func.now()))
+    deleted = db.session.scalars(
+        select(DeletedIncident.incident_id).where(DeletedIncident.deleted_on > since)
+    ).all()
+
+    criteria = [Incident.updated_on > since]
+    order = [Incident.updated_on, Incident.id]
+    if fast_list:
+        incidents = db.session.scalars(select_incident_list(*criteria).order_by(*order))
+        return Response(
+            '{"incidents":[%s],"deleted":%s,"syncedOn":%s}'
+            % (
+                ",".join(incidents),
+                json.dumps(deleted),
+                json.dumps(synced_on.isoformat()),
+            ),
+            mimetype="application/json",
+        )
+
+    incidents = (
+        Incident.query.options(*incident_load_options(fields))
+        .filter(*criteria)
+        .order_by(*order)
+        .all()
+    )
+    return (
+        jsonify(
+            {
+                "incidents": [incident.jsonable(fields) for incident in incidents],
+                "deleted": deleted,
+                "syncedOn": synced_on.isoformat(),
+            }
+        ),
+        200,
+    )
+
 
 def update_documents(incident, documents):
     current_documents = incident.documents
@@ -48,23 +304,15 @@ def update_documents(incident, documents):
         incident.documents.append(new_document)
 
     for document in removed_documents:
-        remove_document = (
-            IncidentDocument.query.filter_by(incident_id=incident.id)
-            .filter_by(name=document.name)
-            .first()
-        )
-        if remove_document:
-            incident.documents.remove(remove_document)
-            db.session.delete(remove_document)
+        incident.documents.remove(document)
+        db.session.delete(document)
 
 
 def update_sharing_details(incident, sharing_details):
-    sharing_status = IncidentSharingStatus.query.filter(
-        IncidentSharingStatus.name == sharing_details.get("status")
-    ).first()
-    organizations = AttributionType.query.filter(
-        AttributionType.name.in_(sharing_details.get("organizations"))
-    ).all()
+    sharing_status = reference_row(IncidentSharingStatus, sharing_details.get("status"))
+    organizations = reference_rows(
+        AttributionType, sharing_details.get("organizations") or []
+    )
     if incident.sharing_details:
         incident.sharing_details.sharing = sharing_status
         incident.sharing_details.organizations = organizations
@@ -79,9 +327,9 @@ def update_sharing_details(incident, sharing_details):
 
 
 def update_publish_details(incident, publish_details):
-    privacy_status = IncidentPrivacyStatus.query.filter_by(
-        name=publish_details.get("privacy")
-    ).first()
+    privacy_status = reference_row(
+        IncidentPrivacyStatus, publish_details.get("privacy")
+    )
     if incident.publish_details:
         incident.publish_details.privacy = privacy_status
     else:
@@ -94,35 +342,21 @@ def update_publish_details(incident, publish_details):
 
 
 def update_links(incident, links):
-    if not links:
-        incident.related_links = []
-    else:
-        for link in links:
-            existing_link = (
-                RelatedLink.query.filter_by(incident_id=incident.id)
-                .filter_by(link=link)
-                .first()
-            )
-            if existing_link:
-                incident.related_links.append(existing_link)
-            else:
-                new_link = RelatedLink(link=link)
-                db.session.add(new_link)
-                incident.related_links.append(new_link)
+    existing_links = {link.link: link for link in incident.related_links}
+    incident.related_links = [
+        existing_links.get(link) or RelatedLink(link=link) for link in links
+    ]
 
 
 def update_school_reports(incident, status, reports):
     incident.reported_to_school = status
+    existing_reports = {report.id: report for report in incident.school_reports}
     for report in reports:
         recipient_type = report.get("recipientType")  # Required
         date = report.get("date", None)
         note = report.get("note", None)
 
-        existing_report = (
-            (SchoolReport.query.filter_by(id=report["id"]).first())
-            if report.get("id")
-            else None
-        )
+        existing_report = existing_reports.get(report.get("id"))
         if existing_report:
             existing_date = (
                 existing_report.occurred_on.date()
@@ -154,17 +388,16 @@ def update_school_reports(incident, status, reports):
 
 def update_school_responses(incident, status, responses):
     incident.school_responded = status
+    existing_responses = {
+        response.id: response for response in incident.school_responses
+    }
     for response in responses:
         source_type = response.get("sourceType")  # Required
         date = response.get("date", None)
         sentiment = response.get("sentiment", None)
         note = response.get("note", None)
 
-        existing_response = (
-            (SchoolResponse.query.filter_by(id=response["id"]).first())
-            if response.get("id")
-            else None
-        )
+        existing_response = existing_responses.get(response.get("id"))
         if existing_response:
             existing_date = (
                 existing_response.occurred_on.date()
@@ -221,12 +454,10 @@ def apply_incident_data(incident, data):
         incident.created_on = now
     incident.updated_on = now
 
-    incident.types = IncidentType.query.filter(
-        IncidentType.name.in_(data.get("types", []))
-    ).all()
-    incident.source_types = IncidentSourceType.query.filter(
-        IncidentSourceType.name.in_(data.get("sourceTypes", []))
-    ).all()
+    incident.types = reference_rows(IncidentType, data.get("types", []))
+    incident.source_types = reference_rows(
+        IncidentSourceType, data.get("sourceTypes", [])
+    )
     incident.other_source = data.get("otherSource", None)
     print("schools ", data.get("schools", []))
     incident.schools = School.query.filter(
@@ -256,26 +487,76 @@ def apply_incident_data(incident, data):
 
 @incident.route("", methods=["GET"])
 @login_required
+@conditional_on_incidents
 def get_all_incidents():
-    """Get all incidents."""
+    """
+    Get all incidents.
+
+    Passing `limit` or `cursor` returns a single page instead of the full list:
+    `{"incidents": [...], "nextCursor": ..., "total": ...}`. Pages hold up to `limit`
+    incidents ordered by `sort` (`occurredOn`, `updatedOn` or, when searching with
+    `q`, `relevance`) in `direction` (`desc` or `asc`), and the `nextCursor` of one
+    page is passed as `cursor` to get the next. Either way, see get_incident_filters
+    for the supported filters, and `fields` limits what each incident includes (see
+    get_incident_fields).
+
+    Passing `updatedSince` instead returns what changed since then, regardless of
+    other filters (see get_incident_changes).
+    """
     try:
-        incidents = Incident.query.options(
-            joinedload(Incident.owner),
-            selectinload(Incident.schools),
-            selectinload(Incident.districts),
-            selectinload(Incident.unions),
-            selectinload(Incident.internal_notes),
-            selectinload(Incident.documents),
-            selectinload(Incident.related_links),
-            selectinload(Incident.types),
-            selectinload(Incident.source_types),
-            selectinload(Incident.attributions),
-            selectinload(Incident.school_reports),
-            selectinload(Incident.school_responses),
-            joinedload(Incident.publish_details),
-            joinedload(Incident.sharing_details),
-        ).all()
-        return jsonify([incident.jsonable() for incident in incidents]), 200
+        fields = get_incident_fields(request.args)
+        # The list profile is built by Postgres rather than the ORM (see incident_list.py)
+        fast_list = fields == INCIDENT_FIELD_PROFILES["list"]
+        if fast_list:
+            query = select_incident_list()
+        else:
+            query = Incident.query.options(*incident_load_options(fields))
+
+        if request.args.get("updatedSince"):
+            return get_incident_changes(request.args, fields, fast_list)
+
+        criteria = get_incident_filters(request.args)
+        if not is_paginated(request.args):
+            if fast_list:
+                incidents = db.session.scalars(query.where(*criteria))
+                return Response(
+                    "[%s]" % ",".join(incidents), mimetype="application/json"
+                )
+            incidents = query.filter(*criteria).all()
+            return jsonify([incident.jsonable(fields) for incident in incidents]), 200
+
+        sort_keys = get_incident_sort_keys(request.args)
+        direction = request.args.get("direction", "desc")
+        if not sort_keys or direction not in ["asc", "desc"]:
+            return jsonify({"error": "Invalid sort"}), 400
+
+        total = db.session.query(func.count(Incident.id)).filter(*criteria).scalar()
+        incidents, next_cursor = keyset_paginate(
+            query.filter(*criteria),
+            sort_keys,
+            cursor=request.args.get("cursor"),
+            limit=get_page_limit(request.args),
+            descending=direction == "desc",
+        )
+        if fast_list:
+            # Incidents are already JSON text, so splice them in rather than re-encode
+            return Response(
+                '{"incidents":[%s],"nextCursor":%s,"total":%d}'
+                % (",".join(incidents), json.dumps(next_cursor), total),
+                mimetype="application/json",
+            )
+        return (
+            jsonify(
+                {
+                    "incidents": [incident.jsonable(fields) for incident in incidents],
+                    "nextCursor": next_cursor,
+                    "total": total,
+                }
+            ),
+            200,
+        )
+    except (PaginationError, IncidentFilterError) as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print("Error getting incidents: ", e)
         return jsonify({"error": e}), 500
@@ -283,10 +564,35 @@ def get_all_incidents():
 
 @incident.route("/<int:incident_id>", methods=["GET"])
 @login_required
+@conditional_on_incidents
 def get_incident(incident_id):
-    """Get a specific incident by ID."""
-    incident = Incident.query.get_or_404(incident_id)
-    return jsonify(incident.jsonable()), 200
+    """Get a specific incident by ID, limited to `fields` if given."""
+    try:
+        fields = get_incident_fields(request.args)
+    except IncidentFilterError as e:
+        return jsonify({"error": str(e)}), 400
+    incident = (
+        Incident.query.options(*incident_load_options(fields))
+        .filter(Incident.id == incident_id)
+        .first_or_404()
+    )
+    return jsonify(incident.jsonable(fields)), 200
+
+
+@incident.route("/events", methods=["GET"])
+@login_required
+def stream_incident_events():
+    """
+    Server-sent events as incidents are created, updated and deleted and notes are
+    added (`incident.created`, `incident.updated`, `incident.deleted` and
+    `note.created`), so clients can patch what they have instead of refetching.
+    """
+    return Response(
+        incident_event_stream(request.headers.get("Last-Event-ID")),
+        mimetype="text/event-stream",
+        # Don't let proxies buffer events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @incident.route("/metadata", methods=["GET"])
@@ -294,28 +600,7 @@ def get_incident(incident_id):
 def get_incident_metadata():
     """Get metadata for incidents."""
     try:
-        types = IncidentType.query.all()
-
-        source_types = IncidentSourceType.query.all()
-        source_types_list = [
-            source_type.__str__()
-            for source_type in source_types
-            if source_type.__str__() not in ["Google Sheet", "Website"]
-        ]
-        source_types_list.sort(key=lambda x: (x == "Other", x))
-
-        organizations = AttributionType.query.all()
-
-        return jsonify(
-            {
-                "types": [type.__str__() for type in types],
-                "sourceTypes": source_types_list,
-                # TODO Only return orgs that have users associateds & remove other
-                "organizations": [
-                    organization.__str__() for organization in organizations
-                ],
-            }
-        )
+        return jsonify(incident_metadata())
     except Exception as e:
         return jsonify({"error": e}), 500
 
@@ -332,6 +617,24 @@ def create_incident():
     return jsonify({"id": incident.id, "message": "Incident created"}), 201
 
 
+@incident.route("/bulk", methods=["POST"])
+@login_required
+def bulk_update_incidents():
+    """
+    Apply the same changes to many incidents in one transaction (see
+    parse_bulk_update for what can be changed).
+    """
+    try:
+        ids, changes = parse_bulk_update(request.get_json())
+    except BulkUpdateError as e:
+        return jsonify({"error": str(e)}), 400
+    ids = apply_bulk_update(ids, changes)
+    db.session.commit()
+    publish_bulk_update(ids)
+
+    return jsonify({"ids": ids, "message": "Incidents updated"}), 200
+
+
 @incident.route("/<int:incident_id>", methods=["PATCH"])
 @login_required
 def update_incident(incident_id):
@@ -0,0 +1,172 @@
+import datetime
+
+from flask import json
+from sqlalchemy import delete, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from server.models.audit import AuditAction, AuditLog, AuditModel, audit_log_values
+from server.models.events import publish_incident_events
+from server.models.models import (
+    Incident,
+    IncidentPrivacyStatus,
+    IncidentPublishDetail,
+    IncidentType,
+    Status,
+    incident_to_incident_types,
+)
+from server.models.reference import reference_ids
+from server.models.user import User
+from server.models.versions import bump_incidents_version
+from ..database import db
+
+# Changes to many incidents at once (see POST /api/incidents/bulk). Each kind of change
+# is one set based statement over all the incidents, rather than a load, modify and
+# flush per incident.
+
+MAX_BULK_INCIDENTS = 1000
+
+
+class BulkUpdateError(ValueError):
+    """Raised when a bulk update request can't be applied."""
+
+
+def get_reference_ids(model, names, label):
+    if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+        raise BulkUpdateError(f"{label} must be a list of names")
+    ids = reference_ids(model)
+    unknown = [name for name in names if name not in ids]
+    if unknown:
+        raise BulkUpdateError(f"Unknown {label}: {', '.join(unknown)}")
+    return [ids[name] for name in names]
+
+
+def is_id(value):
+    # JSON true and false are ints in Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_bulk_update(data):
+    """
+    Validate a bulk update request: `ids` of the incidents to change and any of
+    `status`, `owner` ({"id": ...}), `addTypes`, `removeTypes` and `privacy`.
+    """
+    if not isinstance(data, dict):
+        raise BulkUpdateError("Send a JSON object")
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not all(is_id(id) for id in ids):
+        raise BulkUpdateError("ids must be a list of incident ids")
+    if not ids or len(ids) > MAX_BULK_INCIDENTS:
+        raise BulkUpdateError(f"Update between 1 and {MAX_BULK_INCIDENTS} incidents")
+
+    changes = {}
+    if data.get("status"):
+        try:
+            changes["status"] = Status(data["status"])
+        except ValueError:
+            raise BulkUpdateError(f"Invalid status: {data['status']}")
+    if data.get("owner"):
+        owner = data["owner"]
+        if not isinstance(owner, dict) or not is_id(owner.get("id")):
+            raise BulkUpdateError('owner must be {"id": <user id>}')
+        if not db.session.get(User, owner["id"]):
+            raise BulkUpdateError(f"Unknown owner: {owner['id']}")
+        changes["owner_id"] = owner["id"]
+    changes["add_type_ids"] = get_reference_ids(
+        IncidentType, data.get("addTypes", []), "types"
+    )
+    changes["remove_type_ids"] = get_reference_ids(
+        IncidentType, data.get("removeTypes", []), "types"
+    )
+    if data.get("privacy"):
+        if not isinstance(data["privacy"], str):
+            raise BulkUpdateError("privacy must be a name")
+        changes["privacy_id"] = get_reference_ids(
+            IncidentPrivacyStatus, [data["privacy"]], "privacy"
+        )[0]
+    return ids, changes
+
+
+def apply_bulk_update(ids, changes):
+    """Apply parsed changes to the incidents with `ids`, returning those that exist."""
+    # Lock the incidents so the audit log's old values stay accurate
+    current = db.session.execute(
+        select(Incident.id, Incident.status, Incident.owner_id, Incident.updated_on)
+        .where(Incident.id.in_(ids))
+        .with_for_update()
+    ).all()
+    ids = [row.id for row in current]
+    if not ids:
+        return ids
+
+    values = {"updated_on": datetime.datetime.now(datetime.timezone.utc)}
+    for column in ["status", "owner_id"]:
+        if column in changes:
+            values[column] = changes[column]
+    db.session.execute(
+        update(Incident)
+        .where(Incident.id.in_(ids))
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+    if changes["add_type_ids"]:
+        db.session.execute(
+            pg_insert(incident_to_incident_types).on_conflict_do_nothing(),
+            [
+                {"incident_id": incident_id, "incident_type_id": type_id}
+                for incident_id in ids
+                for type_id in changes["add_type_ids"]
+            ],
+        )
+    if changes["remove_type_ids"]:
+        db.session.execute(
+            delete(incident_to_incident_types).where(
+                incident_to_incident_types.c.incident_id.in_(ids),
+                incident_to_incident_types.c.incident_type_id.in_(
+                    changes["remove_type_ids"]
+                ),
+            )
+        )
+
+    if "privacy_id" in changes:
+        db.session.execute(
+            update(IncidentPublishDetail)
+            .where(IncidentPublishDetail.incident_id.in_(ids))
+            .values(privacy_id=changes["privacy_id"])
+            .execution_options(synchronize_session=False)
+        )
+        db.session.execute(
+            insert(IncidentPublishDetail).from_select(
+                ["incident_id", "privacy_id"],
+                select(Incident.id, literal(changes["privacy_id"])).where(
+                    Incident.id.in_(ids), ~Incident.publish_details.has()
+                ),
+            )
+        )
+
+    # Core statements skip the audit listener, so write the same entries it would
+    db.session.execute(
+        insert(AuditLog),
+        [
+            audit_log_values(
+                AuditAction.UPDATE,
+                AuditModel.INCIDENT,
+                row.id,
+                {
+                    column: {"old": getattr(row, column), "new": value}
+                    for column, value in values.items()
+                    if getattr(row, column) != value
+                },
+            )
+            for row in current
+        ],
+    )
+    return ids
+
+
+def publish_bulk_update(ids):
+    """Let clients know about committed bulk changes (the session listeners can't)."""
+    bump_incidents_version()
+    publish_incident_events(
+        ("incident.updated", json.dumps({"id": incident_id})) for incident_id in ids
+    )
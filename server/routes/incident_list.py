@@ -0,0 +1,176 @@
+from itertools import chain
+
+from sqlalchemy import String, case, cast, func, literal_column, select
+
+from server.models.models import (
+    Incident,
+    IncidentType,
+    School,
+    SchoolDistrict,
+    SchoolDistrictLogo,
+    SchoolLevel,
+    State,
+    Status,
+    incident_districts,
+    incident_schools,
+    incident_to_incident_types,
+)
+from server.models.user import Organization, Role, User, UserRole, user_roles
+
+# Incidents in the "list" field profile, built entirely by Postgres. This skips ORM
+# hydration of every incident and child row: each row comes back as JSON text that
+# is spliced straight into the response. The output matches
+# Incident.jsonable(INCIDENT_FIELD_PROFILES["list"]).
+
+EMPTY_JSON_ARRAY = literal_column("'[]'::json")
+EMPTY_JSON_STRING = literal_column("'\"\"'::json")
+
+
+def json_object(**fields):
+    """json_build_object() with the keyword names as (literal) keys."""
+    return func.json_build_object(
+        *chain.from_iterable(
+            (literal_column(f"'{key}'"), value) for key, value in fields.items()
+        )
+    )
+
+
+def json_array_of(expression, *criteria):
+    """A JSON array of `expression` over the rows matching `criteria`, never null."""
+    return func.coalesce(
+        select(func.json_agg(expression)).where(*criteria).scalar_subquery(),
+        EMPTY_JSON_ARRAY,
+    )
+
+
+def enum_value(column, enum):
+    """The value of an Enum column's member (columns store member names)."""
+    return case(
+        {member.name: member.value for member in enum}, value=cast(column, String)
+    )
+
+
+def blank_if_null(column):
+    """Mirror `value or ""` in Incident.jsonable()."""
+    return case((column.is_(None), EMPTY_JSON_STRING), else_=func.to_json(column))
+
+
+def isoformat(column):
+    """
+    Mirror datetime.isoformat(): to_json() drops trailing zeros of the fraction,
+    which isoformat() prints all six digits of (or none, when it's zero).
+    """
+    return (
+        func.to_char(column, literal_column("'YYYY-MM-DD\"T\"HH24:MI:SS'"))
+        + case(
+            (func.date_trunc("second", column) == column, ""),
+            else_=func.to_char(column, literal_column("'.US'")),
+        )
+        + func.to_char(column, literal_column("'TZH:TZM'"))
+    )
+
+
+def display_name(model):
+    """Mirror `display_name if display_name else name`."""
+    return func.coalesce(func.nullif(model.display_name, ""), model.name)
+
+
+def owner_json():
+    roles = json_array_of(
+        enum_value(Role.name, UserRole),
+        user_roles.c.user_id == User.id,
+        user_roles.c.role_id == Role.id,
+    )
+    organization = (
+        select(Organization.name)
+        .where(Organization.id == User.organization_id)
+        .scalar_subquery()
+    )
+    return (
+        select(
+            json_object(
+                id=User.id,
+                firstName=User.first_name,
+                lastName=User.last_name,
+                email=User.email,
+                roles=roles,
+                profilePicture=User.profile_picture,
+                regions=func.coalesce(func.to_json(User.regions), EMPTY_JSON_ARRAY),
+                organization=organization,
+            )
+        )
+        .where(User.id == Incident.owner_id)
+        .scalar_subquery()
+    )
+
+
+def incident_list_json():
+    """SQL expression for an incident in the list profile, as JSON text."""
+    school = json_object(
+        id=School.id,
+        name=display_name(School),
+        district_id=School.district_id,
+        street=School.street,
+        city=School.city,
+        state=enum_value(School.state, State),
+        postal_code=School.postal_code,
+        latitude=School.latitude,
+        longitude=School.longitude,
+        level=enum_value(School.level, SchoolLevel),
+    )
+    district_logo = (
+        select(SchoolDistrictLogo.url)
+        .where(SchoolDistrictLogo.school_district_id == SchoolDistrict.id)
+        .scalar_subquery()
+    )
+    district = json_object(
+        id=SchoolDistrict.id,
+        name=display_name(SchoolDistrict),
+        logo=district_logo,
+        state=enum_value(SchoolDistrict.state, State),
+    )
+
+    return cast(
+        json_object(
+            id=Incident.id,
+            summary=Incident.summary,
+            status=enum_value(Incident.status, Status),
+            date=json_object(
+                year=Incident.occurred_on_year,
+                month=func.json_build_array(
+                    blank_if_null(Incident.occurred_on_month_start),
+                    blank_if_null(Incident.occurred_on_month_end),
+                ),
+                day=func.json_build_array(
+                    blank_if_null(Incident.occurred_on_day_start),
+                    blank_if_null(Incident.occurred_on_day_end),
+                ),
+            ),
+            owner=owner_json(),
+            types=json_array_of(
+                IncidentType.name,
+                incident_to_incident_types.c.incident_id == Incident.id,
+                incident_to_incident_types.c.incident_type_id == IncidentType.id,
+            ),
+            city=Incident.city,
+            state=cast(Incident.state, String),
+            schools=json_array_of(
+                school,
+                incident_schools.c.incident_id == Incident.id,
+                incident_schools.c.school_id == School.id,
+            ),
+            districts=json_array_of(
+                district,
+                incident_districts.c.incident_id == Incident.id,
+                incident_districts.c.district_id == SchoolDistrict.id,
+            ),
+            createdOn=isoformat(Incident.created_on),
+            updatedOn=isoformat(Incident.updated_on),
+        ),
+        String,
+    )
+
+
+def select_incident_list(*criteria):
+    """Select list profile JSON for the incidents matching `criteria`."""
+    return select(incident_list_json().label("incident")).where(*criteria)
@@ -0,0 +1,86 @@
+import base64
+import json
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+
+from ..database import db
+
+DEFAULT_PAGE_LIMIT = 50
+MAX_PAGE_LIMIT = 200
+
+
+class PaginationError(ValueError):
+    """Raised when pagination query parameters can't be used."""
+
+
+def encode_cursor(values):
+    """Encode the sort key values of the last row of a page as an opaque cursor."""
+    payload = json.dumps(
+        [
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in values
+        ],
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_keys):
+    """Decode a cursor back into values comparable with the given sort keys."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(values, list) or len(values) != len(sort_keys):
+            raise ValueError("Cursor does not match sort keys")
+        return [parse(value) for (_, parse), value in zip(sort_keys, values)]
+    except (ValueError, TypeError, OverflowError):
+        raise PaginationError("Invalid cursor")
+
+
+def get_page_limit(args, default=DEFAULT_PAGE_LIMIT, maximum=MAX_PAGE_LIMIT):
+    """Read and bound the `limit` query parameter."""
+    limit = args.get("limit")
+    if limit is None:
+        return default
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError("limit must be an integer")
+    if limit < 1:
+        raise PaginationError("limit must be positive")
+    return min(limit, maximum)
+
+
+def keyset_paginate(
+    query, sort_keys, cursor=None, limit=DEFAULT_PAGE_LIMIT, descending=True
+):
+    """
+    Return one page of `query` (an ORM query or a Core select) and the cursor for
+    the page after it.
+
+    `sort_keys` is a list of `(expression, parse)` pairs. The last expression must be
+    unique (i.e. the primary key) so rows are totally ordered, and `parse` converts a
+    value read back from a cursor into something comparable with its expression.
+    Rather than OFFSET, each page seeks past the previous page's last row so every
+    page costs the same as long as an index covers the sort keys.
+    """
+    expressions = [expression for expression, _ in sort_keys]
+    if cursor:
+        position = tuple_(*expressions)
+        after = tuple_(*decode_cursor(cursor, sort_keys))
+        query = query.filter(position < after if descending else position > after)
+
+    query = query.order_by(
+        *[
+            expression.desc() if descending else expression.asc()
+            for expression in expressions
+        ]
+    )
+    # Fetch one extra row to know whether there is another page
+    query = query.add_columns(*expressions).limit(limit + 1)
+    # ORM queries run themselves, Core selects run on the session
+    rows = query.all() if isinstance(query, Query) else db.session.execute(query).all()
+    next_cursor = encode_cursor(rows[limit - 1][1:]) if len(rows) > limit else None
+
+    return [row[0] for row in rows[:limit]], next_cursor
@@ -1,6 +1,14 @@
 from flask import Blueprint, jsonify, request
 from flask_login import login_required
-from server.models.models import School
+from server.models.autocomplete import AUTOCOMPLETE_ENABLED, autocomplete
+from server.models.models import School, State
+from server.models.search import (
+    DEFAULT_TYPEAHEAD_LIMIT,
+    MAX_TYPEAHEAD_LIMIT,
+    name_search_criteria,
+    name_search_order,
+)
+from .pagination import PaginationError, get_page_limit
 
 
 school = Blueprint("schools", __name__, url_prefix="/schools")
@@ -9,10 +17,35 @@ school = Blueprint("schools", __name__, url_prefix="/schools")
 @school.route("/", methods=["GET"])
 @login_required
 def get_all_schools_by_state():
-    """Get all schools."""
+    """
+    Get all schools in a state, or when `q` is given, up to `limit` schools whose
+    name contains it, best matches first. With IN_PROCESS_AUTOCOMPLETE on, names
+    are matched by prefix (of the whole name or any word in it) from memory.
+    """
     state = request.args.get("state")
     if not state:
         return []
 
-    schools = School.query.filter(School.state == state).all()
+    query = School.query.filter(School.state == state)
+    search = request.args.get("q", "").strip()
+    if search:
+        try:
+            limit = get_page_limit(
+                request.args, DEFAULT_TYPEAHEAD_LIMIT, MAX_TYPEAHEAD_LIMIT
+            )
+        except PaginationError as e:
+            return jsonify({"error": str(e)}), 400
+        if AUTOCOMPLETE_ENABLED and state in State.__members__:
+            # Answer from this worker's in memory prefix index
+            return (
+                jsonify(autocomplete.search(School, State[state], search, limit)),
+                200,
+            )
+        query = (
+            query.filter(name_search_criteria(School, search))
+            .order_by(*name_search_order(School, search))
+            .limit(limit)
+        )
+
+    schools = query.all()
     return jsonify([school.jsonable() for school in schools]), 200
@@ -1,10 +1,14 @@
 import os
+from datetime import datetime, timezone
 from flask import Flask
 import pytest
+from rq import Queue, SimpleWorker
 from sqlalchemy import create_engine
 from sqlalchemy.orm import scoped_session
 from sqlalchemy.orm.session import sessionmaker
 from server import db
+from server.cache import _local_cache, cache
+from worker import conn, listen
 
 
 # Fixutre postgresql comes from pytest-postgresql
@@ -32,3 +36,51 @@ def db_session(postgresql):
 
     # Clean up after tests by removing the session
     session.remove()
+
+
+@pytest.fixture
+def app_session(db_session):
+    """
+    db.session in an app context on the test database, for code that uses it
+    directly. Cached values don't outlive the test.
+    """
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_session.get_bind().url
+    db.init_app(app)
+    cache.init_app(app, config={"CACHE_TYPE": "SimpleCache"})
+    _local_cache.clear()
+
+    with app.app_context():
+        yield db.session
+        db.session.remove()
+    _local_cache.clear()
+
+
+@pytest.fixture
+def run_jobs():
+    """
+    Runs the queued jobs in this process, as the worker would, until none are
+    left. Jobs scheduled for a retry are run straight away rather than waited for.
+    """
+    queues = [Queue(name, connection=conn) for name in listen]
+
+    def clear():
+        for queue in queues:
+            queue.empty()
+            for job_id in queue.scheduled_job_registry.get_job_ids():
+                queue.scheduled_job_registry.remove(job_id)
+
+    def run():
+        while any(
+            queue.count or queue.scheduled_job_registry.count for queue in queues
+        ):
+            for queue in queues:
+                for job_id in queue.scheduled_job_registry.get_job_ids():
+                    queue.scheduled_job_registry.schedule(
+                        queue.fetch_job(job_id), datetime.now(timezone.utc)
+                    )
+            SimpleWorker(queues, connection=conn).work(burst=True, with_scheduler=True)
+
+    clear()
+    yield run
+    clear()
@@ -0,0 +1,162 @@
+import datetime
+from email.parser import BytesParser
+from io import BytesIO
+
+import pytest
+
+from server.admin import airtable, mirror
+from server.admin.mirror import MultipartFile, simple_file_upload_from_url
+from server.admin.util import first_linked_ids, get_publish_details
+from server.models.files import (
+    MIRRORED_FILES_KEY,
+    MIRRORED_SOURCES_KEY,
+    MIRRORED_URLS_KEY,
+)
+from server.models.models import IncidentPrivacyStatus, IncidentStatus
+from worker import conn
+
+LOOKUPS = {
+    "statuses": {"Duplicate": IncidentStatus(name="Duplicate")},
+    "privacies": {
+        name: IncidentPrivacyStatus(name=name)
+        for name in ["Full Details", "Limited Details", "Hide Details"]
+    },
+}
+
+
+def test_get_publish_details_uses_lookups():
+    details = get_publish_details("YES", "YES-Full", LOOKUPS)
+    assert details.privacy.name == "Full Details"
+    assert details.status is None
+
+    details = get_publish_details("NO-Duplicate", None, LOOKUPS)
+    assert details.privacy.name == "Hide Details"
+    assert details.status.name == "Duplicate"
+
+    details = get_publish_details("NO-Unknown", None, LOOKUPS)
+    assert details.status is None
+
+
+def test_first_linked_ids():
+    data = [
+        {"id": "rec1", "fields": {"School-Name": ["recA", "recB"]}},
+        {"id": "rec2", "fields": {"School-Name": []}},
+        {"id": "rec3", "fields": {}},
+    ]
+    assert first_linked_ids(data, "School-Name") == {"recA"}
+
+
+def test_multipart_file_streams_form_data():
+    body = MultipartFile({"tag": "test-logo"}, "logo.png", BytesIO(b"x" * 1000), 1000)
+    content = b""
+    while chunk := body.read(100):
+        content += chunk
+    assert len(content) == body.len
+
+    message = BytesParser().parsebytes(
+        f"Content-Type: {body.content_type}\r\n\r\n".encode() + content
+    )
+    parts = {
+        part.get_param("name", header="content-disposition"): part
+        for part in message.get_payload()
+    }
+    assert parts["tag"].get_payload() == "test-logo"
+    assert parts["file"].get_filename() == "logo.png"
+    assert parts["file"].get_payload(decode=True) == b"x" * 1000
+
+
+def test_multipart_file_escapes_filename():
+    body = MultipartFile({}, 'a"b\r\nX-Injected: 1.png', BytesIO(b"x"), 1)
+    content = body.read()
+
+    assert not any(line.startswith(b"X-Injected") for line in content.split(b"\r\n"))
+    message = BytesParser().parsebytes(
+        f"Content-Type: {body.content_type}\r\n\r\n".encode() + content
+    )
+    (part,) = message.get_payload()
+    assert part.get_filename() == "a%22b%0D%0AX-Injected: 1.png"
+    assert part.get_payload(decode=True) == b"x"
+
+
+@pytest.fixture
+def mirrored(monkeypatch):
+    downloads = []
+
+    def download(url, file):
+        downloads.append(url)
+        return "digest-2", 1
+
+    monkeypatch.setattr(mirror, "download", download)
+    keys = [MIRRORED_FILES_KEY, MIRRORED_URLS_KEY, MIRRORED_SOURCES_KEY]
+    conn.delete(*keys)
+    conn.hset(MIRRORED_FILES_KEY, mapping={"digest": "cdn/1", "digest-2": "cdn/2"})
+    conn.hset(MIRRORED_URLS_KEY, mapping={"cdn/1": "digest", "cdn/2": "digest-2"})
+    conn.hset(MIRRORED_SOURCES_KEY, "airtable/1", "cdn/1")
+    yield downloads
+    conn.delete(*keys)
+
+
+def test_mirrored_files_are_not_downloaded_again(mirrored):
+    assert simple_file_upload_from_url("airtable/1", "a.png") == "cdn/1"
+    assert mirrored == []
+
+    # Once its copy is deleted, the file is fetched again
+    conn.hdel(MIRRORED_URLS_KEY, "cdn/1")
+    assert simple_file_upload_from_url("airtable/1", "a.png") == "cdn/2"
+    assert mirrored == ["airtable/1"]
+    assert conn.hget(MIRRORED_SOURCES_KEY, "airtable/1") == b"cdn/2"
+
+
+class PagedTable:
+    """Stands in for an Airtable table, failing after `fail_after` pages."""
+
+    def __init__(self, pages, fail_after=None):
+        self.pages = pages
+        self.fail_after = fail_after
+
+    def iterate(self, **options):
+        for number, page in enumerate(self.pages):
+            if number == self.fail_after:
+                raise ConnectionError("Airtable went away")
+            yield page
+
+
+def record(id, last_modified):
+    return {"id": id, "fields": {airtable.LAST_MODIFIED_FIELD: last_modified}}
+
+
+@pytest.fixture
+def synced(app_session, monkeypatch):
+    synced = []
+
+    def sync(records, progress):
+        synced.append([record["id"] for record in records])
+        progress.commit(len(records), updated=len(records))
+        return f"{progress.counts['updated']} updated"
+
+    monkeypatch.setitem(airtable.SYNC_FUNCTIONS, "School-Table", (sync, "schools"))
+    conn.delete(airtable.synced_on_key("WA", "School-Table"))
+    yield synced
+    conn.delete(airtable.synced_on_key("WA", "School-Table"))
+
+
+def test_sync_airtable_moves_mark_after_each_page(monkeypatch, synced):
+    pages = [
+        [record("rec1", "2024-01-01T10:00:00.000Z")],
+        [record("rec2", "2024-01-02T10:00:00.000Z")],
+    ]
+    monkeypatch.setattr(
+        airtable, "get_table", lambda *args: PagedTable(pages, fail_after=1)
+    )
+
+    with pytest.raises(ConnectionError):
+        airtable.sync_airtable("WA", "School-Table")
+    assert synced == [["rec1"]]
+    assert airtable.get_synced_on("WA", "School-Table") == datetime.datetime(
+        2024, 1, 1, 10, tzinfo=datetime.timezone.utc
+    )
+
+    monkeypatch.setattr(airtable, "get_table", lambda *args: PagedTable(pages))
+    started_on = datetime.datetime.now(datetime.timezone.utc)
+    assert airtable.sync_airtable("WA", "School-Table") == "2 updated"
+    assert airtable.get_synced_on("WA", "School-Table") >= started_on
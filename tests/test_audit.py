@@ -0,0 +1,148 @@
+import datetime
+
+import pytest
+from redis import ConnectionError
+from werkzeug.datastructures import MultiDict
+
+from server.models import audit
+from server.models.audit import (
+    AUDIT_PENDING_KEY,
+    AUDIT_PROCESSING_KEY,
+    AuditAction,
+    AuditLog,
+    AuditModel,
+    write_pending_audit_logs,
+)
+from server.models.models import Incident, State, Status
+from server.routes.audit import AUDIT_SORT_KEYS, AuditFilterError, get_audit_filters
+from server.routes.pagination import keyset_paginate
+from worker import conn
+
+
+@pytest.fixture
+def audit_logs(db_session):
+    timestamp = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    audit_logs = [
+        AuditLog(
+            model_name=AuditModel.INCIDENT,
+            action=AuditAction.UPDATE,
+            record_id=record_id,
+            timestamp=timestamp + datetime.timedelta(hours=hours),
+            changes={field: {"old": "Active", "new": "Filed"}},
+        )
+        for record_id, hours, field in [
+            (1, 0, "status"),
+            (1, 1, "summary"),
+            (2, 2, "status"),
+            (1, 3, "status"),
+        ]
+    ]
+    db_session.add_all(audit_logs)
+    db_session.commit()
+    return audit_logs
+
+
+def audit_log_ids(db_session, **args):
+    criteria = get_audit_filters(MultiDict(args))
+    return [
+        audit_log.id
+        for audit_log in db_session.query(AuditLog)
+        .filter(*criteria)
+        .order_by(AuditLog.id)
+    ]
+
+
+def test_filter_by_field_and_record(db_session, audit_logs):
+    assert audit_log_ids(
+        db_session, model="Incident", recordId="1", field="status"
+    ) == [audit_logs[0].id, audit_logs[3].id]
+    assert audit_log_ids(db_session, field="summary") == [audit_logs[1].id]
+    assert audit_log_ids(db_session, **{"from": "2025-01-01T01:30:00+00:00"}) == [
+        audit_logs[2].id,
+        audit_logs[3].id,
+    ]
+    with pytest.raises(AuditFilterError):
+        get_audit_filters(MultiDict({"model": "Nope"}))
+
+
+def test_audit_logs_paginate_newest_first(db_session, audit_logs):
+    page, cursor = keyset_paginate(db_session.query(AuditLog), AUDIT_SORT_KEYS, limit=3)
+    assert [audit_log.id for audit_log in page] == [
+        audit_log.id for audit_log in reversed(audit_logs[1:])
+    ]
+
+    page, cursor = keyset_paginate(
+        db_session.query(AuditLog), AUDIT_SORT_KEYS, cursor=cursor, limit=3
+    )
+    assert [audit_log.id for audit_log in page] == [audit_logs[0].id]
+    assert cursor is None
+
+
+@pytest.fixture
+def async_audit(app_session, monkeypatch):
+    monkeypatch.setattr(audit, "ASYNC_AUDIT_LOG", True)
+    jobs = []
+    monkeypatch.setattr(audit.audit_queue, "enqueue", jobs.append)
+    conn.delete(AUDIT_PENDING_KEY, AUDIT_PROCESSING_KEY)
+    incident = Incident(summary="Graffiti", status=Status.ACTIVE, state=State.WA)
+    app_session.add(incident)
+    app_session.commit()
+    yield incident, jobs
+    conn.delete(AUDIT_PENDING_KEY, AUDIT_PROCESSING_KEY)
+
+
+def file_incident(app_session, incident):
+    incident.status = Status.FILED
+    app_session.commit()
+
+
+def test_async_audit_log_is_written_by_job(app_session, async_audit):
+    incident, jobs = async_audit
+
+    file_incident(app_session, incident)
+
+    assert jobs == [write_pending_audit_logs]
+    assert app_session.query(AuditLog).count() == 0
+    assert write_pending_audit_logs() == "Wrote 1 audit logs"
+    audit_log = app_session.query(AuditLog).one()
+    assert audit_log.record_id == incident.id
+    assert audit_log.changes["status"]["new"] == "FILED"
+    assert conn.llen(AUDIT_PENDING_KEY) == conn.llen(AUDIT_PROCESSING_KEY) == 0
+
+
+def test_writer_finishes_a_crashed_batch_once(app_session, async_audit):
+    incident, _ = async_audit
+    file_incident(app_session, incident)
+    # A writer moved the entry to processing and inserted it, but died (or lost
+    # its lock) before letting it go
+    conn.lmove(AUDIT_PENDING_KEY, AUDIT_PROCESSING_KEY)
+    audit.insert_audit_entries(app_session, conn.lrange(AUDIT_PROCESSING_KEY, 0, -1))
+    app_session.commit()
+    incident.summary = "Graffiti on a locker"
+    app_session.commit()
+
+    write_pending_audit_logs()
+
+    audit_logs = app_session.query(AuditLog).order_by(AuditLog.id).all()
+    assert [
+        ("status" in audit_log.changes, "summary" in audit_log.changes)
+        for audit_log in audit_logs
+    ] == [(True, False), (False, True)]
+    assert conn.llen(AUDIT_PENDING_KEY) == conn.llen(AUDIT_PROCESSING_KEY) == 0
+
+
+def test_audit_entries_are_written_when_redis_fails(
+    app_session, async_audit, monkeypatch
+):
+    incident, _ = async_audit
+
+    def enqueue(function):
+        raise ConnectionError("Redis went away")
+
+    monkeypatch.setattr(audit.audit_queue, "enqueue", enqueue)
+    file_incident(app_session, incident)
+
+    assert app_session.query(AuditLog).count() == 1
+    # The entry also reached the queue before enqueuing failed, but isn't repeated
+    write_pending_audit_logs()
+    assert app_session.query(AuditLog).count() == 1
@@ -1,6 +1,19 @@
 import pytest
 
-from server.models.user import Organization, UserRole, User, Role
+import datetime
+import importlib
+
+from cachetools import TTLCache
+
+from server.admin.models import UserView
+from server.models.identity import (
+    get_identity_user,
+    invalidate_identities,
+    invalidate_identity,
+    select_identity,
+)
+from server.models.user import Organization, UserRole, User, Role, UserTermsAcceptance
+
 
 @pytest.fixture
 def admin_role(db_session):
@@ -48,3 +61,106 @@ def test_get_users(db_session, admin_role, user_admin):
 
     assert user.roles[0] == admin_role
     assert user2 is None
+
+
+def test_select_identity(db_session, user_admin):
+    accepted_on = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    db_session.add_all(
+        [
+            UserTermsAcceptance(user=user_admin, version="1", accepted_on=accepted_on),
+            UserTermsAcceptance(
+                user=user_admin,
+                version="2",
+                accepted_on=accepted_on + datetime.timedelta(days=1),
+            ),
+        ]
+    )
+    db_session.commit()
+
+    user, terms = db_session.execute(select_identity(user_admin.id)).unique().one()
+    assert user.role_set == {UserRole.ADMIN}
+    assert user.organization.name == "Stop Hate in Schools"
+    assert terms.version == "2"
+
+
+@pytest.fixture
+def accepted_terms(db_session, user_admin):
+    accepted_on = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    db_session.add_all(
+        [
+            UserTermsAcceptance(user=user_admin, version="1", accepted_on=accepted_on),
+            UserTermsAcceptance(
+                user=user_admin,
+                version="2",
+                accepted_on=accepted_on + datetime.timedelta(days=1),
+            ),
+        ]
+    )
+    db_session.commit()
+
+
+def test_latest_terms_acceptance(db_session, user_admin, accepted_terms):
+    assert user_admin.most_recent_terms_accepted.version == "2"
+    assert len(user_admin.terms_acceptances) == 2
+
+
+def test_identity_user(app_session, user_admin, accepted_terms):
+    user = get_identity_user(user_admin.id)
+
+    assert user.role_set == {UserRole.ADMIN}
+    assert user.organization.name == "Stop Hate in Schools"
+    assert user.most_recent_terms_accepted.version == "2"
+    # Only the latest acceptance is cached, the rest still load
+    assert sorted(terms.version for terms in user.terms_acceptances) == ["1", "2"]
+
+
+def test_invalidate_identity(app_session, user_admin, admin_role):
+    other = User(first_name="Other", last_name="User", email="other@test.com")
+    app_session.add(other)
+    app_session.commit()
+    other_id = other.id
+    assert get_identity_user(user_admin.id).first_name == "Test"
+    assert get_identity_user(other_id).first_name == "Other"
+
+    app_session.execute(
+        User.__table__.update().values(first_name=User.first_name + "!")
+    )
+    app_session.commit()
+    app_session.expunge_all()
+    invalidate_identity(user_admin.id)
+
+    # Only that user's identity is reloaded
+    assert get_identity_user(user_admin.id).first_name == "Test!"
+    assert get_identity_user(other_id).first_name == "Other"
+
+    # Roles are shared, so editing one drops every identity
+    invalidate_identities(admin_role)
+    assert get_identity_user(other_id).first_name == "Other!"
+
+
+def test_role_set_follows_roles(db_session, user_admin, admin_role):
+    assert user_admin.role_set == {UserRole.ADMIN}
+
+    user_admin.roles.remove(admin_role)
+    assert user_admin.role_set == set()
+
+
+def test_role_removed_in_admin_applies_to_next_request(
+    app_session, user_admin, admin_role, monkeypatch
+):
+    user_id = user_admin.id
+    assert get_identity_user(user_id).role_set == {UserRole.ADMIN}
+
+    # An admin removes the role, through another worker (with its own local cache)
+    with monkeypatch.context() as other_worker:
+        # (server.cache the attribute is the Flask-Caching instance, not the module)
+        other_worker.setattr(
+            importlib.import_module("server.cache"), "_local_cache", TTLCache(10, 60)
+        )
+        user = app_session.get(User, user_id)
+        user.roles = []
+        app_session.commit()
+        UserView(User, app_session).after_model_change(None, user, False)
+    app_session.expunge_all()
+
+    assert get_identity_user(user_id).role_set == set()
@@ -0,0 +1,24 @@
+from server.models.autocomplete import PrefixIndex
+
+
+def test_prefix_index_search():
+    lincoln = {"id": 1, "name": "Abraham Lincoln High School"}
+    roosevelt = {"id": 2, "name": "Roosevelt High"}
+    linden = {"id": 3, "name": "Linden Elementary"}
+    index = PrefixIndex(
+        [
+            (lincoln, ["Abraham Lincoln High School", None]),
+            (roosevelt, ["ROOSEVELT HIGH SCHOOL", "Roosevelt High"]),
+            (linden, ["Linden Elementary"]),
+        ]
+    )
+
+    # Whole name prefixes come before word prefixes
+    assert index.search("lin", 10) == [linden, lincoln]
+    assert index.search("Lincoln  hi", 10) == [lincoln]
+    # Items with more than one matching name are only returned once
+    assert index.search("roosevelt", 10) == [roosevelt]
+    assert index.search("high", 10) == [roosevelt, lincoln]
+    assert index.search("high", 1) == [roosevelt]
+    assert index.search("  ", 10) == []
+    assert index.search("zzz", 10) == []
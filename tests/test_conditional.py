@@ -0,0 +1,83 @@
+from flask import Flask, jsonify
+from flask_login import LoginManager
+import pytest
+from sqlalchemy import event
+
+from server.models.models import Incident, State, Status
+from server.models.user import User, UserTermsAcceptance
+from server.models.versions import (
+    bump_committed_changes,
+    incidents_version,
+    track_incident_changes,
+)
+from server.routes.conditional import conditional_on_incidents
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    # Requests are anonymous
+    LoginManager(app).user_loader(lambda user_id: None)
+    calls = []
+
+    @app.route("/incidents")
+    @conditional_on_incidents
+    def get_incidents():
+        calls.append(1)
+        return jsonify([])
+
+    client = app.test_client()
+    client.calls = calls
+    return client
+
+
+def test_matching_etag_is_not_modified(client):
+    response = client.get("/incidents")
+    etag = response.headers["ETag"]
+    assert response.status_code == 200
+
+    response = client.get("/incidents", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    # Answered without running the view
+    assert len(client.calls) == 1
+
+
+@pytest.fixture
+def versioned_session(db_session):
+    # The app registers these on db.session, so do the same for the test session
+    event.listen(db_session, "after_flush", track_incident_changes)
+    event.listen(db_session, "after_commit", bump_committed_changes)
+    return db_session
+
+
+def test_write_changes_etag(versioned_session, client):
+    db_session = versioned_session
+    etag = client.get("/incidents").headers["ETag"]
+
+    db_session.add(Incident(summary="New", status=Status.ACTIVE, state=State.WA))
+    db_session.commit()
+
+    response = client.get("/incidents", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_only_user_changes_incidents_show_bump_version(versioned_session):
+    db_session = versioned_session
+    user = User(first_name="Test", last_name="User", email="user@test.com")
+    db_session.add(user)
+    db_session.commit()
+    version = incidents_version()
+
+    # Logging in writes the same picture, accepting terms adds to the user
+    user.profile_picture = user.profile_picture
+    db_session.add(UserTermsAcceptance(user=user, version="1"))
+    db_session.commit()
+    assert incidents_version() == version
+
+    user.first_name = "Renamed"
+    db_session.commit()
+    assert incidents_version() > version
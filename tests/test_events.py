@@ -0,0 +1,56 @@
+import pytest
+
+from server.models.events import INCIDENT_EVENTS_KEY, publish_incident_events
+from server.routes import events
+from server.routes.events import incident_event_stream
+from worker import conn
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    monkeypatch.setattr(events, "HEARTBEAT_INTERVAL", 1)
+    monkeypatch.setattr(events, "STREAM_DURATION", 1.5)
+    conn.delete(INCIDENT_EVENTS_KEY)
+    yield
+    conn.delete(INCIDENT_EVENTS_KEY)
+
+
+def test_heartbeat_until_stream_ends(stream):
+    messages = list(incident_event_stream())
+
+    assert messages[0] == f"retry: {events.RECONNECT_DELAY}\n\n"
+    assert set(messages[1:]) == {": heartbeat\n\n"}
+
+
+def test_resume_from_last_event_id(stream):
+    publish_incident_events([("incident.created", '{"id": 1}')])
+    publish_incident_events([("incident.updated", '{"id": 1}')])
+    first_id, second_id = [
+        event_id.decode() for event_id, _ in conn.xrange(INCIDENT_EVENTS_KEY)
+    ]
+
+    messages = [
+        message
+        for message in incident_event_stream(first_id)
+        if not message.startswith((":", "retry"))
+    ]
+
+    assert messages == [
+        f'id: {second_id}\nevent: incident.updated\ndata: {{"id": 1}}\n\n'
+    ]
+
+
+def test_full_worker_turns_streams_away(stream, monkeypatch):
+    monkeypatch.setattr(events, "stream_slots", events.threading.BoundedSemaphore(1))
+    publish_incident_events([("incident.created", '{"id": 1}')])
+    latest_id = events.latest_event_id()
+
+    open_stream = incident_event_stream()
+    next(open_stream)
+    assert list(incident_event_stream()) == [
+        f"retry: {events.BUSY_RECONNECT_DELAY}\nid: {latest_id}\n\n"
+    ]
+
+    # Closing a stream frees its slot
+    open_stream.close()
+    assert next(incident_event_stream()) == f"retry: {events.RECONNECT_DELAY}\n\n"
@@ -0,0 +1,33 @@
+from server.models import files
+from server.models.files import enqueue_pending_file_deletes
+from server.models.models import PendingFileDelete
+
+attempts = []
+
+
+def flaky_delete(url):
+    """Stands in for Simple File Upload, failing the first attempt at a.pdf."""
+    attempts.append(url)
+    return attempts.count(url) > 1 or url != "https://files/a.pdf"
+
+
+def test_failed_file_deletes_are_retried(app_session, run_jobs, monkeypatch):
+    attempts.clear()
+    monkeypatch.setattr(files, "simple_file_delete_from_url", flaky_delete)
+    assert enqueue_pending_file_deletes() is None
+
+    app_session.add_all(
+        PendingFileDelete(url=url, attempts=0)
+        for url in ["https://files/a.pdf", "https://files/b.pdf"]
+    )
+    app_session.commit()
+    job = enqueue_pending_file_deletes()
+    run_jobs()
+
+    assert attempts == [
+        "https://files/a.pdf",
+        "https://files/b.pdf",
+        "https://files/a.pdf",
+    ]
+    assert job.return_value() == "Deleted 1 files"
+    assert app_session.query(PendingFileDelete).count() == 0
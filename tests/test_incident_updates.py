@@ -0,0 +1,237 @@
+import pytest
+
+from server.models.audit import AuditAction, AuditLog
+from server.models.events import INCIDENT_EVENTS_KEY
+from server.models.models import (
+    Incident,
+    IncidentDocument,
+    IncidentPrivacyStatus,
+    IncidentPublishDetail,
+    IncidentType,
+    RelatedLink,
+    State,
+    Status,
+)
+from server.models.reference import reference_ids, reference_rows
+from server.models.versions import incidents_version
+from server.routes.incident import (
+    update_documents,
+    update_links,
+    update_school_reports,
+    update_school_responses,
+)
+from server.routes.incident_bulk import (
+    BulkUpdateError,
+    apply_bulk_update,
+    parse_bulk_update,
+    publish_bulk_update,
+)
+from worker import conn
+
+
+@pytest.fixture
+def incident(app_session):
+    incident = Incident(
+        summary="Graffiti on a locker",
+        status=Status.ACTIVE,
+        state=State.WA,
+        related_links=[
+            RelatedLink(link="https://a.org"),
+            RelatedLink(link="https://b.org"),
+        ],
+        documents=[IncidentDocument(name="a.pdf", url="https://files/a.pdf")],
+    )
+    app_session.add(incident)
+    app_session.commit()
+    return incident
+
+
+def test_reference_rows_finds_rows_added_since_cached(app_session):
+    app_session.add(IncidentType(name="Graffiti"))
+    app_session.commit()
+    assert list(reference_ids(IncidentType)) == ["Graffiti"]
+
+    # As a migration or another process would, without invalidating the cache
+    app_session.add(IncidentType(name="Harassment"))
+    app_session.commit()
+    rows = reference_rows(IncidentType, ["Harassment", "Graffiti", "Unknown"])
+
+    assert [(row.id, row.name) for row in rows] == [
+        (reference_ids(IncidentType)["Harassment"], "Harassment"),
+        (reference_ids(IncidentType)["Graffiti"], "Graffiti"),
+    ]
+    assert list(reference_ids(IncidentType)) == ["Graffiti", "Harassment"]
+
+
+def test_update_links_keeps_existing_rows(app_session, incident):
+    kept = {link.link: link.id for link in incident.related_links}["https://b.org"]
+
+    update_links(incident, ["https://b.org", "https://c.org"])
+    app_session.commit()
+
+    assert [link.link for link in incident.related_links] == [
+        "https://b.org",
+        "https://c.org",
+    ]
+    assert incident.related_links[0].id == kept
+    assert app_session.query(RelatedLink).count() == 2
+
+
+def test_update_documents(app_session, incident):
+    update_documents(
+        incident,
+        [
+            {"name": "a.pdf", "url": "https://files/a.pdf"},
+            {"name": "b.pdf", "url": "https://files/b.pdf"},
+        ],
+    )
+    app_session.commit()
+    assert sorted(document.name for document in incident.documents) == [
+        "a.pdf",
+        "b.pdf",
+    ]
+
+    update_documents(incident, [{"name": "b.pdf", "url": "https://files/b.pdf"}])
+    app_session.commit()
+    assert [document.name for document in incident.documents] == ["b.pdf"]
+
+
+def test_update_school_reports_and_responses(app_session, incident):
+    update_school_reports(
+        incident, True, [{"recipientType": "Principal", "note": "Emailed"}]
+    )
+    update_school_responses(
+        incident, True, [{"sourceType": "Email", "sentiment": 2, "note": "Replied"}]
+    )
+    app_session.commit()
+    report = incident.school_reports[0]
+    response = incident.school_responses[0]
+    assert report.updated_on is None
+
+    update_school_reports(
+        incident,
+        True,
+        [
+            {"id": report.id, "recipientType": "Principal", "note": "Called"},
+            {"recipientType": "District", "date": "2024-03-01"},
+        ],
+    )
+    update_school_responses(
+        incident,
+        False,
+        [{"id": response.id, "sourceType": "Email", "sentiment": 2, "note": "Replied"}],
+    )
+    app_session.commit()
+
+    reports = sorted(incident.school_reports, key=lambda report: report.id)
+    assert [(report.recipient_type, report.report) for report in reports] == [
+        ("Principal", "Called"),
+        ("District", None),
+    ]
+    assert reports[0].updated_on is not None
+    # Unchanged responses aren't marked updated
+    assert incident.school_responded is False
+    assert incident.school_responses[0].updated_on is None
+
+
+@pytest.fixture
+def bulk_incidents(app_session):
+    graffiti = IncidentType(name="Graffiti")
+    limited = IncidentPrivacyStatus(name="Limited Details")
+    app_session.add_all(
+        [IncidentType(name="Harassment"), IncidentPrivacyStatus(name="Hide Details")]
+    )
+    incidents = [
+        Incident(
+            summary="Graffiti on a locker",
+            status=Status.ACTIVE,
+            state=State.WA,
+            types=[graffiti],
+            publish_details=IncidentPublishDetail(privacy=limited),
+        ),
+        Incident(summary="Harassment in class", status=Status.ACTIVE, state=State.CA),
+        Incident(summary="Already filed", status=Status.FILED, state=State.CA),
+    ]
+    app_session.add_all(incidents)
+    app_session.commit()
+    return incidents
+
+
+def test_parse_bulk_update(app_session, bulk_incidents):
+    ids, changes = parse_bulk_update(
+        {"ids": [1, 2], "status": "Filed", "addTypes": ["Harassment"]}
+    )
+
+    assert ids == [1, 2]
+    assert changes == {
+        "status": Status.FILED,
+        "add_type_ids": [reference_ids(IncidentType)["Harassment"]],
+        "remove_type_ids": [],
+    }
+    with pytest.raises(BulkUpdateError):
+        parse_bulk_update({"ids": "1,2"})
+    with pytest.raises(BulkUpdateError):
+        parse_bulk_update({"ids": [1], "addTypes": ["Unknown"]})
+    with pytest.raises(BulkUpdateError):
+        parse_bulk_update({"ids": [1], "status": "Closed"})
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        [1, 2],
+        "ids",
+        None,
+        {"ids": [1, True]},
+        {"ids": [1], "status": ["Filed"]},
+        {"ids": [1], "owner": "someone"},
+        {"ids": [1], "owner": {"id": "1"}},
+        {"ids": [1], "owner": {"id": None}},
+        {"ids": [1], "addTypes": "Graffiti"},
+        {"ids": [1], "removeTypes": [1]},
+        {"ids": [1], "privacy": ["Hide Details"]},
+    ],
+)
+def test_parse_bulk_update_rejects_malformed_requests(app_session, data):
+    with pytest.raises(BulkUpdateError):
+        parse_bulk_update(data)
+
+
+def test_bulk_update(app_session, bulk_incidents):
+    conn.delete(INCIDENT_EVENTS_KEY)
+    version = incidents_version()
+    ids = [incident.id for incident in bulk_incidents]
+    _, changes = parse_bulk_update(
+        {
+            "ids": ids,
+            "status": "Filed",
+            "addTypes": ["Harassment"],
+            "removeTypes": ["Graffiti"],
+            "privacy": "Hide Details",
+        }
+    )
+
+    # Ids of missing incidents are dropped
+    assert apply_bulk_update(ids + [ids[-1] + 1], changes) == ids
+    app_session.commit()
+    publish_bulk_update(ids)
+
+    app_session.expire_all()
+    for incident in bulk_incidents:
+        assert incident.status == Status.FILED
+        assert [type.name for type in incident.types] == ["Harassment"]
+        assert incident.publish_details.privacy.name == "Hide Details"
+
+    audit_logs = app_session.query(AuditLog).order_by(AuditLog.record_id).all()
+    assert [audit_log.record_id for audit_log in audit_logs] == ids
+    assert {audit_log.action for audit_log in audit_logs} == {AuditAction.UPDATE}
+    assert [audit_log.changes.get("status") for audit_log in audit_logs] == [
+        {"old": "ACTIVE", "new": "FILED"},
+        {"old": "ACTIVE", "new": "FILED"},
+        None,
+    ]
+
+    assert incidents_version() > version
+    assert [fields[b"event"] for _, fields in conn.xrange(INCIDENT_EVENTS_KEY)] == [
+        b"incident.updated"
+    ] * len(ids)
@@ -0,0 +1,248 @@
+import datetime
+import json
+
+import pytest
+from sqlalchemy import event, select
+from werkzeug.datastructures import MultiDict
+
+from server.models.audit import audit_changes
+from server.models.models import (
+    INCIDENT_FIELD_PROFILES,
+    DeletedIncident,
+    Incident,
+    IncidentType,
+    InternalNote,
+    School,
+    State,
+    Status,
+)
+from server.models.search import update_search_vectors
+from server.models.versions import record_deleted_incident, touch_changed_incidents
+from server.routes.incident import (
+    IncidentFilterError,
+    get_incident_fields,
+    get_incident_filters,
+    get_incident_sort_keys,
+    get_updated_since,
+    is_paginated,
+)
+from server.routes.incident_list import select_incident_list
+from server.routes.pagination import keyset_paginate
+
+
+@pytest.fixture
+def school(db_session):
+    school = School(
+        name="Lincoln High School",
+        street="1 Main St",
+        city="Seattle",
+        state=State.WA,
+        postal_code="98101",
+    )
+    db_session.add(school)
+    db_session.commit()
+    return school
+
+
+@pytest.fixture
+def incidents(db_session, school):
+    # The app registers this on db.session, so do the same for the test session
+    event.listen(db_session, "before_flush", update_search_vectors)
+
+    graffiti = IncidentType(name="Graffiti")
+    harassment = IncidentType(name="Harassment")
+    incidents = [
+        Incident(
+            summary="Graffiti on a locker",
+            status=Status.ACTIVE,
+            state=State.WA,
+            occurred_on_year=2024,
+            occurred_on_month_start=3,
+            types=[graffiti],
+            schools=[school],
+        ),
+        Incident(
+            summary="Harassment in class",
+            status=Status.ACTIVE,
+            state=State.CA,
+            occurred_on_year=2023,
+            types=[harassment],
+        ),
+        Incident(
+            summary="Undated report",
+            details="100% graffiti",
+            status=Status.FILED,
+            state=State.CA,
+        ),
+    ]
+    db_session.add_all(incidents)
+    db_session.commit()
+    return incidents
+
+
+def filter_summaries(db_session, **args):
+    criteria = get_incident_filters(MultiDict(args))
+    return sorted(
+        incident.summary
+        for incident in db_session.query(Incident).filter(*criteria).all()
+    )
+
+
+def test_filter_by_search(db_session, incidents):
+    assert filter_summaries(db_session, search="graffiti") == [
+        "Graffiti on a locker",
+        "Undated report",
+    ]
+    assert filter_summaries(db_session, search="lincoln") == ["Graffiti on a locker"]
+    # LIKE wildcards are matched literally
+    assert filter_summaries(db_session, search="100%") == ["Undated report"]
+
+
+def test_filter_by_types_and_states(db_session, incidents):
+    assert filter_summaries(db_session, types=["Harassment", "Other"]) == [
+        "Harassment in class"
+    ]
+    assert filter_summaries(db_session, states=["CA"]) == [
+        "Harassment in class",
+        "Undated report",
+    ]
+    with pytest.raises(IncidentFilterError):
+        get_incident_filters(MultiDict({"states": ["XX"]}))
+
+
+def test_filter_by_date_range(db_session, incidents):
+    assert filter_summaries(db_session, dateFrom="2024-01-01") == [
+        "Graffiti on a locker"
+    ]
+    assert filter_summaries(db_session, dateFrom="2023-01-01", dateTo="2024-02-29") == [
+        "Harassment in class"
+    ]
+    with pytest.raises(IncidentFilterError):
+        get_incident_filters(MultiDict({"dateFrom": "not a date"}))
+
+
+def test_full_text_search(db_session, incidents, school):
+    assert filter_summaries(db_session, q="lincoln high") == ["Graffiti on a locker"]
+    # Words match as prefixes and are stemmed
+    assert filter_summaries(db_session, q="harass") == ["Harassment in class"]
+    assert filter_summaries(db_session, q="   ") == sorted(
+        incident.summary for incident in incidents
+    )
+
+    # Summary matches rank above details matches
+    args = MultiDict({"q": "graffiti"})
+    ranked = (
+        db_session.query(Incident)
+        .filter(*get_incident_filters(args))
+        .order_by(*[key.desc() for key, _ in get_incident_sort_keys(args)])
+        .all()
+    )
+    assert [incident.summary for incident in ranked] == [
+        "Graffiti on a locker",
+        "Undated report",
+    ]
+
+    # Renaming a school updates the incidents that reference it
+    school.display_name = "Abraham Lincoln High"
+    db_session.commit()
+    assert filter_summaries(db_session, q="abraham") == ["Graffiti on a locker"]
+
+
+def test_relevance_pages_through_equal_ranks(db_session, incidents):
+    db_session.add_all(
+        Incident(summary="Graffiti on a wall", status=Status.ACTIVE, state=State.WA)
+        for _ in range(4)
+    )
+    db_session.commit()
+    args = MultiDict({"q": "graffiti"})
+    query = db_session.query(Incident).filter(*get_incident_filters(args))
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = keyset_paginate(
+            query, get_incident_sort_keys(args), cursor=cursor, limit=2
+        )
+        seen.extend(page)
+        if not cursor:
+            break
+
+    # Every match exactly once, equal ranks ordered by id
+    assert len(seen) == len({incident.id for incident in seen}) == 6
+    walls = [incident.id for incident in seen if incident.summary.endswith("wall")]
+    assert walls == sorted(walls, reverse=True)
+
+
+def test_jsonable_fields(db_session, incidents):
+    incident = incidents[0]
+
+    assert list(incident.jsonable(INCIDENT_FIELD_PROFILES["list"])) == (
+        INCIDENT_FIELD_PROFILES["list"]
+    )
+    assert incident.jsonable(["id", "types"]) == {
+        "id": incident.id,
+        "types": ["Graffiti"],
+    }
+    assert get_incident_fields(MultiDict({"fields": "id, types"})) == ["id", "types"]
+    assert get_incident_fields(MultiDict({})) is None
+    with pytest.raises(IncidentFilterError):
+        get_incident_fields(MultiDict({"fields": "id,internalNotes"}))
+
+
+def test_only_pagination_parameters_page():
+    assert not is_paginated(MultiDict({}))
+    assert not is_paginated(MultiDict({"fields": "list", "states": ["CA"]}))
+    assert is_paginated(MultiDict({"fields": "list", "limit": "50"}))
+    assert is_paginated(MultiDict({"cursor": "WzFd"}))
+
+
+def test_incident_list_json_matches_jsonable(db_session, incidents):
+    rows = db_session.execute(select_incident_list().order_by(Incident.id)).scalars()
+
+    assert [json.loads(row) for row in rows] == [
+        incident.jsonable(INCIDENT_FIELD_PROFILES["list"])
+        for incident in sorted(incidents, key=lambda incident: incident.id)
+    ]
+
+
+def test_deleting_incident_leaves_tombstone(db_session, incidents):
+    # Registered on Incident itself, so this is only to make sure it's imported
+    assert event.contains(Incident, "after_delete", record_deleted_incident)
+    incident_id = incidents[1].id
+    db_session.delete(incidents[1])
+    db_session.commit()
+
+    assert [
+        tombstone.incident_id for tombstone in db_session.query(DeletedIncident).all()
+    ] == [incident_id]
+
+
+def test_comment_edit_is_synced(db_session, incidents):
+    event.listen(db_session, "before_flush", touch_changed_incidents)
+    incident = incidents[0]
+    db_session.add(InternalNote(note="First look", incident_id=incident.id))
+    db_session.commit()
+    # Explicitly set updated_on is kept
+    for each in incidents:
+        each.updated_on = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    db_session.commit()
+
+    incident.internal_notes[0].note = "Second look"
+    db_session.commit()
+
+    since = get_updated_since(MultiDict({"updatedSince": "2024-06-01T00:00:00Z"}))
+    assert db_session.scalars(
+        select(Incident.id).where(Incident.updated_on > since)
+    ).all() == [incident.id]
+
+
+def test_audit_changes_only_changed_columns(db_session, incidents):
+    incident = incidents[0]
+    assert incident.summary == "Graffiti on a locker"
+    incident.summary = "Graffiti on two lockers"
+    # Set but not changed
+    incident.status = incident.status
+
+    assert audit_changes(incident) == {
+        "summary": {"old": "Graffiti on a locker", "new": "Graffiti on two lockers"}
+    }
@@ -0,0 +1,36 @@
+from rq import Queue
+
+from server.admin.jobs import IMPORT_JOB_RETRY, ImportProgress
+from worker import conn
+
+ROWS = list(range(5))
+imported = []
+attempts = []
+
+
+def flaky_import():
+    """Commits a chunk of two rows at a time, and fails part way the first time."""
+    attempts.append(1)
+    progress = ImportProgress("rows", total=len(ROWS))
+    for start in range(progress.resume_from, len(ROWS), 2):
+        if start == 2 and len(attempts) == 1:
+            raise ConnectionError("Lost the connection to NCES")
+        imported.extend(ROWS[start : start + 2])
+        progress.commit(len(ROWS[start : start + 2]), inserted=2)
+    return "Imported"
+
+
+def test_failed_import_is_retried_from_last_commit(app_session, run_jobs):
+    imported.clear()
+    attempts.clear()
+    job = Queue("low", connection=conn).enqueue(flaky_import, retry=IMPORT_JOB_RETRY)
+
+    run_jobs()
+
+    job.refresh()
+    assert len(attempts) == 2
+    assert job.return_value() == "Imported"
+    assert job.retries_left == IMPORT_JOB_RETRY.max - 1
+    # The first chunk was committed before the failure, so it isn't imported again
+    assert imported == [0, 1, 2, 3, 4]
+    assert job.meta["progress"]["rows"]["processed"] == len(ROWS)
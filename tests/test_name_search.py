@@ -0,0 +1,111 @@
+from flask import current_app
+from flask_login import LoginManager
+import pytest
+
+from server.models.models import School, SchoolDistrict, State
+from server.routes import district as district_routes
+from server.routes import school as school_routes
+from server.routes.district import district
+from server.routes.school import school
+
+
+@pytest.fixture
+def client(app_session):
+    app = current_app._get_current_object()
+    app.config["LOGIN_DISABLED"] = True
+    LoginManager(app)
+    app.register_blueprint(school)
+    app.register_blueprint(district)
+    return app.test_client()
+
+
+def add_school(app_session, name, state=State.WA, display_name=None):
+    app_session.add(
+        School(
+            name=name,
+            display_name=display_name,
+            street="1 Main St",
+            city="Seattle",
+            state=state,
+            postal_code="98101",
+        )
+    )
+
+
+@pytest.fixture
+def schools(app_session):
+    for name in [
+        "Abraham Lincoln Middle School Annex",
+        "Roosevelt High School",
+        "Lincoln High School",
+        "Abraham Lincoln",
+        "Lincoln",
+    ]:
+        add_school(app_session, name)
+    add_school(app_session, "Washington Elementary", display_name="Lincoln Park")
+    add_school(app_session, "Lincoln High School", state=State.OR)
+    app_session.commit()
+
+
+def school_names(client, **args):
+    response = client.get("/schools/", query_string={"state": "WA", **args})
+    assert response.status_code == 200
+    return [school["name"] for school in response.json]
+
+
+def test_schools_by_name(client, schools):
+    # Prefix matches (of the name or display name, which is shown) first, then by
+    # similarity
+    assert school_names(client, q="lincoln") == [
+        "Lincoln",
+        "Lincoln Park",
+        "Lincoln High School",
+        "Abraham Lincoln",
+        "Abraham Lincoln Middle School Annex",
+    ]
+    # Matches anywhere in the name, in any case
+    assert school_names(client, q="COLN MID") == ["Abraham Lincoln Middle School Annex"]
+    assert school_names(client, q="Roosevelt") == ["Roosevelt High School"]
+    assert school_names(client, q="%") == []
+
+
+def test_schools_search_limit(client, schools, monkeypatch):
+    assert school_names(client, q="lincoln", limit="2") == ["Lincoln", "Lincoln Park"]
+    monkeypatch.setattr(school_routes, "MAX_TYPEAHEAD_LIMIT", 3)
+    assert len(school_names(client, q="lincoln", limit="100")) == 3
+    monkeypatch.setattr(school_routes, "DEFAULT_TYPEAHEAD_LIMIT", 1)
+    assert school_names(client, q="lincoln") == ["Lincoln"]
+
+    for limit in ["0", "ten"]:
+        response = client.get(
+            "/schools/", query_string={"state": "WA", "q": "lincoln", "limit": limit}
+        )
+        assert response.status_code == 400
+
+
+def test_schools_without_search(client, schools, monkeypatch):
+    monkeypatch.setattr(school_routes, "DEFAULT_TYPEAHEAD_LIMIT", 1)
+    # Every school in the state, however many
+    assert len(school_names(client)) == 6
+    assert len(school_names(client, q="  ", limit="1")) == 6
+
+
+def test_districts_by_name(app_session, client, monkeypatch):
+    app_session.add_all(
+        SchoolDistrict(name=name, state=State.WA)
+        for name in ["North Seattle", "Seattle", "Seattle Public Schools", "Tacoma"]
+    )
+    app_session.commit()
+
+    def district_names(**args):
+        response = client.get("/districts/", query_string={"state": "WA", **args})
+        return [district["name"] for district in response.json]
+
+    assert district_names(q="seattle") == [
+        "Seattle",
+        "Seattle Public Schools",
+        "North Seattle",
+    ]
+    monkeypatch.setattr(district_routes, "MAX_TYPEAHEAD_LIMIT", 1)
+    assert district_names(q="seattle", limit="10") == ["Seattle"]
+    assert len(district_names()) == 4
@@ -0,0 +1,162 @@
+import asyncio
+from io import StringIO
+
+from flask import current_app
+from sqlalchemy import select
+
+from server.admin import nces
+from server.admin.jobs import IMPORT_JOB_RETRY
+from server.admin.nces import refresh_states
+from server.admin.util import (
+    chunked,
+    convert_file_to_data,
+    import_state,
+    iter_table_rows,
+    school_district_values,
+    school_values,
+)
+from server.models.models import School, SchoolTypes, State
+
+PUBLIC_SCHOOL_ROW = {
+    "School Name": "LINCOLN HIGH SCHOOL",
+    "NCES School ID": " 530000000001 ",
+    "Street Address": "1 MAIN ST",
+    "City": "SEATTLE",
+    "State": "WA",
+    "ZIP": "98101",
+    "Phone": "(206) 555-0100",
+    "Low Grade": "9",
+    "High Grade": "12",
+    "Charter": "Yes",
+    "NCES District ID": "5300001",
+}
+
+
+def test_chunked():
+    assert list(chunked(range(5), size=2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([], size=2)) == []
+
+
+def test_school_district_values():
+    assert school_district_values(
+        {"District Name": " Seattle ", "NCES District ID": "5300001 ", "State": "WA"}
+    ) == {"name": "Seattle", "nces_id": "5300001", "state": "WA"}
+    assert (
+        school_district_values(
+            {
+                "District Name": "A Community College",
+                "NCES District ID": "1",
+                "State": "WA",
+            }
+        )
+        is None
+    )
+
+
+def test_school_values():
+    school, types, district_nces_id = school_values(PUBLIC_SCHOOL_ROW, is_public=True)
+
+    assert school["name"] == "Lincoln High School"
+    assert school["nces_id"] == "530000000001"
+    assert school["phone"] == "2065550100"
+    assert types == [SchoolTypes.PUBLIC]
+    assert district_nces_id == "5300001"
+    assert (
+        school_values(dict(PUBLIC_SCHOOL_ROW, **{"Low Grade": "UG"}), is_public=True)
+        is None
+    )
+
+
+def test_iter_table_rows():
+    html = StringIO(
+        "<html><body><table>"
+        "<tr><td>Ignored title</td></tr>"
+        "<tr><td><b>NCES District ID</b></td><td>District Name</td>"
+        "<tr><td>5300001</td><td>Seattle &amp; King</td></tr>"
+        "<tr><td>5300002<td>Tacoma"
+        "</table><table><tr><td>Second table</td></tr></table>"
+    )
+
+    assert list(iter_table_rows(html, read_size=7)) == [
+        ["Ignored title"],
+        ["NCES District ID", "District Name"],
+        ["5300001", "Seattle & King"],
+        ["5300002", "Tacoma"],
+    ]
+
+
+def test_refresh_states():
+    assert refresh_states(["Washington", "Michigan"]) == ["Washington", "Michigan"]
+    assert refresh_states(["all"]) == [state.value for state in State]
+    assert refresh_states("all") == [state.value for state in State]
+
+
+def html_export(rows):
+    return (
+        "<html><body><table>"
+        + "".join(
+            "<tr>" + "".join(f"<td>{cell}</td>" for cell in row) + "</tr>"
+            for row in rows
+        )
+        + "</table></body></html>"
+    )
+
+
+def test_import_state_links_schools_to_its_districts(app_session):
+    # NCES exports start with their ID column
+    school_headers = ["NCES School ID"] + [
+        header for header in PUBLIC_SCHOOL_ROW if header != "NCES School ID"
+    ]
+    exports = {
+        "districts": html_export(
+            [
+                ["NCES District ID", "District Name", "State"],
+                ["5300001", "Seattle", "WA"],
+            ]
+        ),
+        "schools": html_export(
+            [school_headers, [PUBLIC_SCHOOL_ROW[header] for header in school_headers]]
+        ),
+    }
+    app = current_app._get_current_object()
+
+    async def fetch_export(url):
+        # Find the schools export first
+        await asyncio.sleep(0.2 if url == "districts" else 0)
+        return url
+
+    def import_file(file_url):
+        with app.app_context():
+            convert_file_to_data(StringIO(exports[file_url]), source="WA")
+
+    assert asyncio.run(
+        import_state(["districts", "schools"], fetch_export, import_file)
+    ) == ["districts", "schools"]
+    school = app_session.scalars(select(School)).one()
+    assert school.district.nces_id == "5300001"
+
+
+fetched = []
+
+
+def fetch_states(urls_by_state):
+    """Stands in for fetch_pages, failing every attempt at Washington."""
+    (state,) = urls_by_state
+    fetched.append(state)
+    if state == "Washington":
+        raise ConnectionError("NCES is down")
+    return f"Imported {state}"
+
+
+def test_refresh_lane_continues_after_a_state_fails(monkeypatch, run_jobs):
+    fetched.clear()
+    monkeypatch.setattr(nces, "REFRESH_LANES", 1)
+    monkeypatch.setattr(nces, "get_state_id", lambda state: state)
+    monkeypatch.setattr(nces, "fetch_pages", fetch_states)
+
+    job = nces.enqueue_nces_refresh(["Washington", "Oregon"])
+    run_jobs()
+
+    # Oregon waits in Washington's lane until its retries run out
+    assert fetched == ["Washington"] * (IMPORT_JOB_RETRY.max + 1) + ["Oregon"]
+    assert job.return_value() == "NCES refresh of 2 states (1 failed: Washington)"
@@ -0,0 +1,87 @@
+import pytest
+
+from server.models.models import Incident, State, Status
+from server.routes.incident import INCIDENT_SORT_KEYS
+from server.routes.pagination import (
+    PaginationError,
+    decode_cursor,
+    encode_cursor,
+    get_page_limit,
+    keyset_paginate,
+)
+
+
+@pytest.fixture
+def incidents(db_session):
+    incidents = [
+        Incident(
+            summary=f"Incident {year}",
+            status=Status.ACTIVE,
+            state=State.WA,
+            occurred_on_year=year,
+        )
+        for year in [2021, 2024, None, 2022, 2024, 2023]
+    ]
+    db_session.add_all(incidents)
+    db_session.commit()
+    return incidents
+
+
+def test_cursor_round_trip():
+    sort_keys = INCIDENT_SORT_KEYS["occurredOn"]
+    cursor = encode_cursor([2024, 5, 1, 10])
+
+    assert decode_cursor(cursor, sort_keys) == [2024, 5, 1, 10]
+    with pytest.raises(PaginationError):
+        decode_cursor(cursor, INCIDENT_SORT_KEYS["updatedOn"])
+    with pytest.raises(PaginationError):
+        decode_cursor("not-a-cursor", sort_keys)
+
+
+def test_get_page_limit():
+    assert get_page_limit({}, default=20, maximum=100) == 20
+    assert get_page_limit({"limit": "5"}, default=20, maximum=100) == 5
+    assert get_page_limit({"limit": "500"}, default=20, maximum=100) == 100
+    for limit in ["0", "-1", "five"]:
+        with pytest.raises(PaginationError):
+            get_page_limit({"limit": limit})
+
+
+def test_keyset_paginate_occurred_on(db_session, incidents):
+    sort_keys = INCIDENT_SORT_KEYS["occurredOn"]
+    query = db_session.query(Incident)
+
+    seen = []
+    cursor = None
+    while True:
+        page, cursor = keyset_paginate(query, sort_keys, cursor=cursor, limit=4)
+        seen.extend(page)
+        if not cursor:
+            break
+
+    assert len(seen) == len(incidents)
+    # Most recent first, ties broken by id and incidents without a year last
+    assert [incident.occurred_on_year for incident in seen] == [
+        2024,
+        2024,
+        2023,
+        2022,
+        2021,
+        None,
+    ]
+    assert seen[0].id > seen[1].id
+
+
+def test_keyset_paginate_ascending_updated_on(db_session, incidents):
+    sort_keys = INCIDENT_SORT_KEYS["updatedOn"]
+    query = db_session.query(Incident)
+
+    first_page, cursor = keyset_paginate(query, sort_keys, limit=3, descending=False)
+    second_page, last_cursor = keyset_paginate(
+        query, sort_keys, cursor=cursor, limit=3, descending=False
+    )
+
+    assert [incident.id for incident in first_page + second_page] == [
+        incident.id for incident in incidents
+    ]
+    assert last_cursor is None
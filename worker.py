@@ -38,7 +38,8 @@ if __name__ == "__main__":
             worker = Worker(queues)
 
             print("Starting RQ worker...")
-            worker.work()
+            # The scheduler enqueues jobs retried after an interval (e.g. imports)
+            worker.work(with_scheduler=True)
         except TimeoutError:
             print("Redis read timed out")
             raise RuntimeError("Redis read timed out")